@@ -8,3 +8,11 @@ keepalive = 2
 max_requests = 1000
 max_requests_jitter = 100
 preload_app = False
+
+
+def post_worker_init(worker):
+    # Tareas largas con JOB_RUNNER='thread': cada worker web las ejecuta y
+    # revisa la cola periódicamente (no al importar main, que también importan
+    # el cron, el worker y los scripts)
+    from tasks.jobs import start_thread_runner
+    start_thread_runner(worker.wsgi)
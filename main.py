@@ -14,6 +14,7 @@ from routes.time import time_bp
 from routes.admin import admin_bp
 from routes.export import export_bp
 from routes.internal import internal_bp
+from routes.instrumentation import init_instrumentation
 try:
     from apscheduler.schedulers.background import BackgroundScheduler
     from apscheduler.triggers.cron import CronTrigger
@@ -83,6 +84,13 @@ else:
         "max_overflow": 0
     }
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Fichajes por página en el historial del empleado (paginación por cursor)
+app.config['HISTORY_PAGE_SIZE'] = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+# Ejecución de tareas largas (autofichaje/backfill): thread | worker | inline.
+# Con SQLite se ejecutan dentro de la petición (conexión única, sin concurrencia).
+app.config['JOB_RUNNER'] = os.getenv("JOB_RUNNER") or ("inline" if uri.startswith("sqlite") else "thread")
+# Métricas de consultas/latencia por endpoint (/internal/metrics, logs JSON)
+app.config['INSTRUMENTATION_ENABLED'] = os.getenv("TT_INSTRUMENTATION", "").lower() in ("1", "true", "yes")
 # Inicializar extensiones
 db.init_app(app)
 # Log rápido del driver efectivo
@@ -91,14 +99,8 @@ try:
         print("Driver:", db.engine.url.drivername, file=sys.stderr)
 except Exception:
     pass
-# Log de diagnóstico por request para confirmar motor/URL
-@app.before_request
-def _log_db_on_request():
-    try:
-        from flask import request
-        print(f"[REQ] {request.method} {request.path} -> engine={db.engine.url.drivername}", file=sys.stderr, flush=True)
-    except Exception as e:
-        print(f"[REQ] engine-info error: {e}", file=sys.stderr, flush=True)
+# Instrumentación opcional por petición (consultas, tiempo en BD, latencia)
+init_instrumentation(app)
 
 migrate = Migrate(app, db)
 
@@ -107,37 +109,6 @@ migrate = Migrate(app, db)
 def shutdown_session(exception=None):
     db.session.remove()
 
-# Context processor para hacer disponible el usuario actual y saludo
-@app.context_processor
-def inject_user():
-    from flask import session
-    from models.models import User
-    from datetime import datetime
-
-    user = None
-    greeting = ""
-
-    user_id = session.get("user_id")
-    if user_id:
-        user = User.query.get(user_id)
-        if user:
-            # Obtener solo el primer nombre
-            first_name = user.full_name.split()[0] if user.full_name else user.username
-
-            # Determinar saludo según la hora
-            hour = datetime.now().hour
-            if 6 <= hour < 12:
-                greeting = f"Buenos días, {first_name}"
-            elif 12 <= hour < 20:
-                greeting = f"Buenas tardes, {first_name}"
-            else:
-                greeting = f"Buenas noches, {first_name}"
-
-    return dict(
-        current_user=user,
-        greeting=greeting,
-    )
-
 # Registrar blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(time_bp)
@@ -210,6 +181,9 @@ if __name__ == '__main__':
     # Solo inicializar la base de datos cuando se ejecuta directamente (no con gunicorn)
     init_db()
     init_scheduler()
+    # Servidor web de desarrollo: con gunicorn lo arranca gunicorn.conf.py
+    from tasks.jobs import start_thread_runner
+    start_thread_runner(app)
     port = int(os.getenv('PORT', 5000))
     # En producción usar debug=False
     debug_mode = not (os.getenv('DYNO') or os.getenv('RENDER'))
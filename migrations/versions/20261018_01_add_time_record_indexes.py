@@ -0,0 +1,63 @@
+"""Add composite and open-record indexes to time_record / employee_status
+
+Revision ID: 20261018_01
+Revises: 20260712_01
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_01"
+down_revision = "20260712_01"
+branch_labels = None
+depends_on = None
+
+
+COMPOSITE_INDEXES = (
+    ("ix_time_record_user_date", "time_record", ["user_id", "date"]),
+    ("ix_time_record_date_user", "time_record", ["date", "user_id"]),
+    ("ix_employee_status_date_user", "employee_status", ["date", "user_id"]),
+)
+OPEN_INDEX = "ix_time_record_open"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        # CONCURRENTLY evita bloquear los fichajes mientras se construye el
+        # índice sobre una tabla grande; requiere ir fuera de la transacción.
+        with op.get_context().autocommit_block():
+            for name, table, columns in COMPOSITE_INDEXES:
+                op.create_index(
+                    name, table, columns,
+                    postgresql_concurrently=True, if_not_exists=True,
+                )
+            op.create_index(
+                OPEN_INDEX, "time_record", ["user_id"],
+                postgresql_where=sa.text("check_out IS NULL"),
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+        return
+
+    for name, table, columns in COMPOSITE_INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+    if dialect == "sqlite":
+        # SQLite admite índices parciales desde 3.8
+        op.create_index(
+            OPEN_INDEX, "time_record", ["user_id"],
+            sqlite_where=sa.text("check_out IS NULL"),
+            if_not_exists=True,
+        )
+    else:
+        # Motores sin índices parciales: índice compuesto equivalente
+        op.create_index(OPEN_INDEX, "time_record", ["user_id", "check_out"], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index(OPEN_INDEX, table_name="time_record", if_exists=True)
+    for name, table, _ in reversed(COMPOSITE_INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
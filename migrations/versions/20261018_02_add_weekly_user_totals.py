@@ -0,0 +1,61 @@
+"""Add weekly_user_totals table
+
+Revision ID: 20261018_02
+Revises: 20261018_01
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_02"
+down_revision = "20261018_01"
+branch_labels = None
+depends_on = None
+
+
+# Carga inicial desde time_record; en otros motores usar
+# `python -m tasks.weekly_totals` tras migrar.
+BACKFILL = {
+    "postgresql": """
+        INSERT INTO weekly_user_totals (user_id, week_start, worked_seconds, updated_at)
+        SELECT user_id,
+               CAST(date_trunc('week', date) AS DATE),
+               CAST(ROUND(SUM(EXTRACT(EPOCH FROM (check_out - check_in)))) AS INTEGER),
+               now()
+        FROM time_record
+        WHERE check_in IS NOT NULL AND check_out IS NOT NULL
+        GROUP BY 1, 2
+    """,
+    "sqlite": """
+        INSERT INTO weekly_user_totals (user_id, week_start, worked_seconds, updated_at)
+        SELECT user_id,
+               date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days'),
+               CAST(ROUND(SUM((julianday(check_out) - julianday(check_in)) * 86400.0)) AS INTEGER),
+               CURRENT_TIMESTAMP
+        FROM time_record
+        WHERE check_in IS NOT NULL AND check_out IS NOT NULL
+        GROUP BY 1, 2
+    """,
+}
+
+
+def upgrade():
+    op.create_table(
+        "weekly_user_totals",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("week_start", sa.Date(), nullable=False),
+        sa.Column("worked_seconds", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "week_start"),
+    )
+
+    backfill = BACKFILL.get(op.get_bind().dialect.name)
+    if backfill:
+        op.execute(backfill)
+
+
+def downgrade():
+    op.drop_table("weekly_user_totals")
@@ -0,0 +1,45 @@
+"""Add shift_pattern table for precomputed shift templates
+
+Revision ID: 20261018_04
+Revises: 20261018_03
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_04"
+down_revision = "20261018_03"
+branch_labels = None
+depends_on = None
+
+
+# La tabla empieza vacía: los patrones se calculan al primer uso. Para
+# precalcular la semana en curso: `python -m tasks.shift_patterns`.
+def upgrade():
+    op.create_table(
+        "shift_pattern",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("week_start", sa.Date(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("group_hours", sa.Integer(), nullable=True),
+        sa.Column("group_categoria", sa.String(length=100), nullable=True),
+        sa.Column("weekday", sa.Integer(), nullable=False),
+        sa.Column("start_seconds", sa.Integer(), nullable=True),
+        sa.Column("duration_seconds", sa.Integer(), nullable=True),
+        sa.Column("sample_count", sa.Integer(), nullable=True),
+        sa.Column("day_seconds", sa.Integer(), nullable=True),
+        sa.Column("second_start_seconds", sa.Integer(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_shift_pattern_user_week", "shift_pattern", ["user_id", "week_start"])
+    op.create_index("ix_shift_pattern_group_week", "shift_pattern", ["week_start", "group_hours"])
+
+
+def downgrade():
+    op.drop_index("ix_shift_pattern_group_week", table_name="shift_pattern")
+    op.drop_index("ix_shift_pattern_user_week", table_name="shift_pattern")
+    op.drop_table("shift_pattern")
@@ -0,0 +1,37 @@
+"""Add unique index on shift_pattern scope
+
+Revision ID: 20261018_06
+Revises: 20261018_05
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_06"
+down_revision = "20261018_05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # shift_pattern es una caché: se vacía (puede tener duplicados de cálculos
+    # concurrentes) y se vuelve a rellenar en la siguiente consulta
+    op.execute("DELETE FROM shift_pattern")
+    op.create_index(
+        "uix_shift_pattern_scope",
+        "shift_pattern",
+        [
+            "week_start",
+            "weekday",
+            sa.text("coalesce(user_id, 0)"),
+            sa.text("coalesce(group_hours, -1)"),
+            sa.text("coalesce(group_categoria, '')"),
+        ],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("uix_shift_pattern_scope", table_name="shift_pattern")
@@ -1,3 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
 db = SQLAlchemy()
+
+
+def upsert_insert(dialect_name: str):
+    """insert() del motor con on_conflict_do_update/do_nothing, o None si no lo soporta."""
+    return {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(dialect_name)
@@ -0,0 +1,98 @@
+"""
+Expresiones SQL dependientes del motor para cálculos de fechas y duraciones.
+
+Producción corre sobre PostgreSQL y el desarrollo/tests sobre SQLite; estas
+construcciones compilan a la función equivalente de cada uno para que los
+agregados (horas por semana, etc.) se puedan resolver en la base de datos.
+"""
+
+from datetime import datetime, time
+
+from sqlalchemy import Date, Float
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+
+class seconds_between(FunctionElement):
+    """Segundos (float) entre dos DATETIME: ``seconds_between(inicio, fin)``."""
+    type = Float()
+    name = "seconds_between"
+    inherit_cache = True
+
+
+@compiles(seconds_between)
+def _seconds_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "EXTRACT(EPOCH FROM (%s - %s))" % (
+        compiler.process(end, **kw),
+        compiler.process(start, **kw),
+    )
+
+
+@compiles(seconds_between, "sqlite")
+def _seconds_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "((julianday(%s) - julianday(%s)) * 86400.0)" % (
+        compiler.process(end, **kw),
+        compiler.process(start, **kw),
+    )
+
+
+class week_start(FunctionElement):
+    """Lunes de la semana de una fecha (DATE), como normalize_week_start."""
+    type = Date()
+    name = "week_start"
+    inherit_cache = True
+
+
+@compiles(week_start)
+def _week_start_default(element, compiler, **kw):
+    (day,) = list(element.clauses)
+    return "CAST(date_trunc('week', %s) AS DATE)" % compiler.process(day, **kw)
+
+
+@compiles(week_start, "sqlite")
+def _week_start_sqlite(element, compiler, **kw):
+    (day,) = list(element.clauses)
+    day_sql = compiler.process(day, **kw)
+    # strftime('%w') -> 0 = domingo; (w + 6) % 7 = días desde el lunes
+    return "date(%s, '-' || ((CAST(strftime('%%w', %s) AS INTEGER) + 6) %% 7) || ' days')" % (
+        day_sql,
+        day_sql,
+    )
+
+
+class seconds_of_day(FunctionElement):
+    """Segundos (float) desde medianoche de un DATETIME: la hora del día comparable."""
+    type = Float()
+    name = "seconds_of_day"
+    inherit_cache = True
+
+
+@compiles(seconds_of_day)
+def _seconds_of_day_default(element, compiler, **kw):
+    (value,) = list(element.clauses)
+    return "EXTRACT(EPOCH FROM CAST(%s AS TIME))" % compiler.process(value, **kw)
+
+
+@compiles(seconds_of_day, "sqlite")
+def _seconds_of_day_sqlite(element, compiler, **kw):
+    (value,) = list(element.clauses)
+    value_sql = compiler.process(value, **kw)
+    # strftime('%f') -> segundos con milésimas (SS.SSS)
+    return (
+        "(CAST(strftime('%%H', %s) AS INTEGER) * 3600"
+        " + CAST(strftime('%%M', %s) AS INTEGER) * 60"
+        " + CAST(strftime('%%f', %s) AS REAL))" % (value_sql, value_sql, value_sql)
+    )
+
+
+def seconds_since_midnight(value):
+    """Equivalente en Python de seconds_of_day para un time/datetime (None -> None)."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        value = value.time()
+    if not isinstance(value, time):
+        raise TypeError(f"Se esperaba time o datetime, no {type(value).__name__}")
+    return value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1_000_000
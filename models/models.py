@@ -1,5 +1,7 @@
 from .database import db
+from .expressions import seconds_of_day, seconds_since_midnight
 from datetime import datetime
+from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class User(db.Model):
@@ -56,6 +58,20 @@ class User(db.Model):
         return f"<User {self.username}>"
 
 class TimeRecord(db.Model):
+    # Casi todas las consultas calientes filtran por (user_id, date) o por el
+    # fichaje abierto del empleado (check_out IS NULL). El índice parcial solo
+    # contiene los registros abiertos, así que se mantiene diminuto.
+    __table_args__ = (
+        db.Index("ix_time_record_user_date", "user_id", "date"),
+        db.Index("ix_time_record_date_user", "date", "user_id"),
+        db.Index(
+            "ix_time_record_open",
+            "user_id",
+            postgresql_where=db.text("check_out IS NULL"),
+            sqlite_where=db.text("check_out IS NULL"),
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
     check_in = db.Column(db.DateTime, nullable=True)
@@ -70,6 +86,27 @@ class TimeRecord(db.Model):
         onupdate=datetime.utcnow
     )
 
+    # Hora del día de entrada/salida en segundos desde medianoche. En Python
+    # se calcula sobre el objeto; en consultas compila a la expresión del motor
+    # (p. ej. TimeRecord.check_in_seconds >= seconds_since_midnight(time(9, 0))).
+    @hybrid_property
+    def check_in_seconds(self):
+        return seconds_since_midnight(self.check_in)
+
+    @check_in_seconds.inplace.expression
+    @classmethod
+    def _check_in_seconds_expression(cls):
+        return seconds_of_day(cls.check_in)
+
+    @hybrid_property
+    def check_out_seconds(self):
+        return seconds_since_midnight(self.check_out)
+
+    @check_out_seconds.inplace.expression
+    @classmethod
+    def _check_out_seconds_expression(cls):
+        return seconds_of_day(cls.check_out)
+
     def __repr__(self):
         return f"<TimeRecord {self.id}-U{self.user_id}>"
 
@@ -77,6 +114,8 @@ class EmployeeStatus(db.Model):
     __tablename__ = "employee_status"
     __table_args__ = (
         db.UniqueConstraint("user_id", "date", name="uix_employee_date"),
+        # Calendario y exportaciones recorren rangos de fechas de todos los empleados
+        db.Index("ix_employee_status_date_user", "date", "user_id"),
     )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -144,3 +183,160 @@ class OvertimeAlert(db.Model):
             f"<OvertimeAlert U{self.user_id} {self.date} "
             f"+{self.excess_seconds // 3600}h reviewed={self.reviewed}>"
         )
+
+
+class WeeklyUserTotal(db.Model):
+    """
+    Segundos trabajados por empleado y semana (fichajes con entrada y salida),
+    mantenidos al día por models/weekly_totals.py. Evita volver a sumar los
+    fichajes en cada petición de paneles y exportaciones.
+    """
+    __tablename__ = "weekly_user_totals"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    week_start = db.Column(db.Date, primary_key=True)
+    worked_seconds = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<WeeklyUserTotal U{self.user_id} {self.week_start} {self.worked_seconds}s>"
+
+
+
+class Job(db.Model):
+    """
+    Tarea de administración larga (autofichaje, regularización) encolada desde
+    la web y ejecutada fuera de la petición por tasks/jobs.py, ya sea en el
+    propio proceso o con `python -m tasks.worker`. Guarda parámetros, progreso
+    y el resumen final para que el panel lo consulte.
+    """
+    __tablename__ = "job"
+    __table_args__ = (
+        # El worker busca la siguiente tarea en cola por orden de llegada
+        db.Index("ix_job_status_id", "status", "id"),
+    )
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=False, default=0)
+    created_by = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="SET NULL"),
+        nullable=True
+    )
+    worker = db.Column(db.String(120), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status}>"
+
+
+
+class ShiftPattern(db.Model):
+    """
+    Turno típico por día de la semana (mediana de entrada, duración y jornada
+    del día) calculado a partir de las HISTORY_WEEKS semanas anteriores a
+    ``week_start``. Las filas con ``user_id`` son el histórico de un empleado;
+    las de grupo (``user_id`` NULL) el de su jornada semanal y categoría
+    (``group_categoria`` NULL = solo jornada). Autofichaje, regularización y
+    cierre automático las consultan en lugar de recorrer el histórico; se
+    calculan al primer uso y models/shift_patterns.py borra las afectadas
+    cuando cambian fichajes o empleados.
+    """
+    __tablename__ = "shift_pattern"
+    __table_args__ = (
+        db.Index("ix_shift_pattern_user_week", "user_id", "week_start"),
+        db.Index("ix_shift_pattern_group_week", "week_start", "group_hours"),
+    )
+
+    # Fila marcador: histórico calculado pero sin ningún turno aprovechable
+    EMPTY_WEEKDAY = -1
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    week_start = db.Column(db.Date, nullable=False)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=True
+    )
+    group_hours = db.Column(db.Integer, nullable=True)
+    group_categoria = db.Column(db.String(100), nullable=True)
+    weekday = db.Column(db.Integer, nullable=False)
+    start_seconds = db.Column(db.Integer, nullable=True)
+    duration_seconds = db.Column(db.Integer, nullable=True)
+    sample_count = db.Column(db.Integer, nullable=True)
+    day_seconds = db.Column(db.Integer, nullable=True)
+    second_start_seconds = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        owner = f"U{self.user_id}" if self.user_id else f"G{self.group_hours}/{self.group_categoria}"
+        return f"<ShiftPattern {owner} {self.week_start} d{self.weekday}>"
+
+
+# Una sola fila por semana, día y ámbito (empleado o grupo): los NULL no
+# chocan en un índice único normal, de ahí los coalesce
+db.Index(
+    "uix_shift_pattern_scope",
+    ShiftPattern.week_start,
+    ShiftPattern.weekday,
+    db.func.coalesce(ShiftPattern.user_id, 0),
+    db.func.coalesce(ShiftPattern.group_hours, -1),
+    db.func.coalesce(ShiftPattern.group_categoria, ""),
+    unique=True,
+)
+
+
+class PunchRequest(db.Model):
+    """
+    Respuesta de un fichaje hecho por la API JSON (/api/v1/punch) con clave de
+    idempotencia. Si el quiosco reintenta la misma petición (Wi-Fi inestable)
+    se devuelve la respuesta guardada en lugar de fichar dos veces. Solo se
+    guardan los fichajes aceptados.
+    """
+    __tablename__ = "punch_request"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "idempotency_key", name="uix_punch_user_key"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    response = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PunchRequest U{self.user_id} {self.idempotency_key} {self.action}>"
+
+
+# Registra los eventos que mantienen weekly_user_totals y shift_pattern (importan los modelos de arriba)
+from . import weekly_totals  # noqa: E402,F401
+from . import shift_patterns  # noqa: E402,F401
+# Vacía la caché de opciones de los desplegables de administración al cambiar usuarios
+from . import user_options  # noqa: E402,F401
@@ -0,0 +1,134 @@
+"""
+Invalidación de shift_pattern.
+
+Los turnos típicos de la semana W salen de los fichajes de las
+HISTORY_WEEKS semanas anteriores, así que un fichaje del día d solo afecta a
+las semanas que empiezan en (d, d + HISTORY_WEEKS * 7]. Cada cambio de
+TimeRecord hecho con el ORM marca en la sesión (user_id, fecha) y al terminar
+el flush se borran las filas de ese empleado y de su grupo de jornada en esas
+semanas; se recalculan en la siguiente consulta (tasks/autofill.py). Cambiar
+la jornada, categoría o estado de un empleado cambia los grupos, así que se
+borran todas las filas de grupo de las jornadas implicadas. Las escrituras
+masivas que no pasan por el ORM deben llamar a invalidate_shift_patterns.
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from .models import ShiftPattern, TimeRecord, User
+
+
+DIRTY_RECORDS_KEY = "shift_patterns_dirty_records"
+DIRTY_GROUPS_KEY = "shift_patterns_dirty_groups"
+# Semanas de histórico de las que sale cada patrón (tasks.autofill la importa de aquí)
+HISTORY_WEEKS = 8
+HISTORY_DAYS = HISTORY_WEEKS * 7
+INVALIDATE_BATCH_SIZE = 500
+# Marca "todas las jornadas" cuando no se conoce el valor anterior
+ALL_GROUPS = object()
+_TRACKED_RECORD_ATTRS = ("user_id", "date", "check_in", "check_out", "notes")
+_TRACKED_USER_ATTRS = ("weekly_hours", "categoria", "is_active", "is_admin")
+
+
+def invalidate_shift_patterns(connection, keys) -> None:
+    """Borra los patrones calculados con fichajes de los (user_id, fecha) indicados."""
+    spans: dict[int, tuple[date, date]] = {}
+    for user_id, day in keys:
+        if user_id is None or day is None:
+            continue
+        first, last = spans.get(user_id, (day, day))
+        spans[user_id] = (min(first, day), max(last, day))
+
+    # Las escrituras masivas tocan la misma semana de muchos empleados: un
+    # DELETE por ventana y bloque de empleados, no por empleado.
+    by_window: dict[tuple[date, date], list[int]] = {}
+    for user_id, span in spans.items():
+        by_window.setdefault(span, []).append(user_id)
+
+    for (first, last), user_ids in by_window.items():
+        window = (
+            ShiftPattern.week_start > first,
+            ShiftPattern.week_start <= last + timedelta(days=HISTORY_DAYS),
+        )
+        user_ids.sort()
+        for i in range(0, len(user_ids), INVALIDATE_BATCH_SIZE):
+            chunk = user_ids[i:i + INVALIDATE_BATCH_SIZE]
+            connection.execute(delete(ShiftPattern).where(ShiftPattern.user_id.in_(chunk), *window))
+            connection.execute(
+                delete(ShiftPattern).where(
+                    ShiftPattern.user_id.is_(None),
+                    ShiftPattern.group_hours.in_(select(User.weekly_hours).where(User.id.in_(chunk))),
+                    *window,
+                )
+            )
+
+
+def invalidate_group_patterns(connection, weekly_hours) -> None:
+    """Borra los patrones de grupo de esas jornadas (ALL_GROUPS = todas)."""
+    stmt = delete(ShiftPattern).where(ShiftPattern.user_id.is_(None))
+    if ALL_GROUPS not in weekly_hours:
+        stmt = stmt.where(ShiftPattern.group_hours.in_(sorted(int(h or 0) for h in weekly_hours)))
+    connection.execute(stmt)
+
+
+def _mark(target, key, values) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(key, set()).update(values)
+
+
+@event.listens_for(TimeRecord, "after_insert")
+def _record_inserted(mapper, connection, target):
+    _mark(target, DIRTY_RECORDS_KEY, {(target.user_id, target.date)})
+
+
+@event.listens_for(TimeRecord, "after_delete")
+def _record_deleted(mapper, connection, target):
+    _mark(target, DIRTY_RECORDS_KEY, {(target.user_id, target.date)})
+
+
+@event.listens_for(TimeRecord, "after_update")
+def _record_updated(mapper, connection, target):
+    state = inspect(target)
+    history = {name: state.attrs[name].history for name in _TRACKED_RECORD_ATTRS}
+    if not any(h.has_changes() for h in history.values()):
+        return
+    keys = {(target.user_id, target.date)}
+    # models/weekly_totals.py activa active_history en user_id/date: el valor anterior está cargado
+    old_user = history["user_id"].deleted[0] if history["user_id"].deleted else target.user_id
+    old_date = history["date"].deleted[0] if history["date"].deleted else target.date
+    keys.add((old_user, old_date))
+    _mark(target, DIRTY_RECORDS_KEY, keys)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    history = {name: state.attrs[name].history for name in _TRACKED_USER_ATTRS}
+    if not any(h.has_changes() for h in history.values()):
+        return
+    hours = {target.weekly_hours}
+    weekly_hours = history["weekly_hours"]
+    if weekly_hours.has_changes():
+        hours.update(weekly_hours.deleted or {ALL_GROUPS})
+    _mark(target, DIRTY_GROUPS_KEY, hours)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    # Sus fichajes se borran en cascada en la BD, sin eventos del ORM
+    _mark(target, DIRTY_GROUPS_KEY, {target.weekly_hours})
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_after_flush(session, flush_context):
+    records = session.info.pop(DIRTY_RECORDS_KEY, None)
+    groups = session.info.pop(DIRTY_GROUPS_KEY, None)
+    if records:
+        invalidate_shift_patterns(session.connection(), records)
+    if groups:
+        invalidate_group_patterns(session.connection(), groups)
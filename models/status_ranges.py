@@ -0,0 +1,82 @@
+"""
+Alta masiva de estados (Baja, Vacaciones, cierre de un centro...) para un
+rango de días de uno o varios empleados.
+
+Cada lote de filas es un único INSERT ... ON CONFLICT (user_id, date) DO
+UPDATE apoyado en uix_employee_date (PostgreSQL y SQLite), en lugar de un
+SELECT y un INSERT/UPDATE por día. Si el día ya tenía estado se sobrescriben
+estado, notas y horas y se conserva created_at. En otros motores se borran los
+estados del rango y se insertan de nuevo.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import delete, insert
+
+from .database import upsert_insert
+from .models import EmployeeStatus
+
+
+# Filas por sentencia (x 8 columnas: por debajo del límite de parámetros de SQLite)
+UPSERT_BATCH_ROWS = 1000
+_UPDATED_COLUMNS = ("status", "notes", "entry_time", "exit_time", "updated_at")
+
+
+def upsert_status_range(
+    connection,
+    user_ids,
+    start: date,
+    end: date,
+    *,
+    status: str,
+    notes: str | None = None,
+    entry_time: time | None = None,
+    exit_time: time | None = None,
+) -> int:
+    """
+    Crea o sobrescribe el estado de cada empleado de ``user_ids`` en cada día
+    de [start, end]. Devuelve el número de filas (empleado, día) escritas.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids or end < start:
+        return 0
+    now = datetime.utcnow()
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    rows = [
+        {
+            "user_id": user_id,
+            "date": day,
+            "status": status,
+            "notes": notes,
+            "entry_time": entry_time,
+            "exit_time": exit_time,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for user_id in user_ids
+        for day in days
+    ]
+
+    dialect_insert = upsert_insert(connection.dialect.name)
+    if dialect_insert is None:
+        connection.execute(
+            delete(EmployeeStatus).where(
+                EmployeeStatus.user_id.in_(user_ids),
+                EmployeeStatus.date >= start,
+                EmployeeStatus.date <= end,
+            )
+        )
+        connection.execute(insert(EmployeeStatus), rows)
+        return len(rows)
+
+    for i in range(0, len(rows), UPSERT_BATCH_ROWS):
+        stmt = dialect_insert(EmployeeStatus).values(rows[i:i + UPSERT_BATCH_ROWS])
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[EmployeeStatus.user_id, EmployeeStatus.date],
+                set_={name: stmt.excluded[name] for name in _UPDATED_COLUMNS},
+            )
+        )
+    return len(rows)
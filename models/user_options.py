@@ -0,0 +1,156 @@
+"""
+Caché en proceso de las opciones de los desplegables de filtros del panel de
+administración: centros, categorías, jornadas y lista de empleados.
+
+Cada página de administración las volvía a sacar de la tabla user (SELECT
+DISTINCT de centro y categoría, todos los usuarios activos para las
+jornadas). Ahora se cargan con una sola consulta por ámbito de centro (el del
+admin, el elegido o None = todos) y se guardan CACHE_TTL_SECONDS en una caché
+LRU de CACHE_MAX_ENTRIES ámbitos. Cualquier alta, cambio o baja de User hecha
+con el ORM vacía la caché al confirmarse la transacción. Cada proceso tiene
+su propia caché: en otros procesos los cambios se ven al caducar el TTL.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from .database import db
+from .models import User
+
+
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_ENTRIES = 64
+DIRTY_KEY = "user_options_dirty"
+# Columnas que salen en los desplegables: otros cambios (último acceso,
+# contraseña...) no invalidan la caché
+_OPTION_ATTRS = ("username", "full_name", "centro", "categoria", "weekly_hours", "is_active", "is_admin")
+
+UserOption = namedtuple("UserOption", "id username full_name centro categoria weekly_hours")
+FilterOptions = namedtuple("FilterOptions", [
+    "centros",              # todos los usuarios del ámbito
+    "categorias",
+    "active_users",         # usuarios activos por username (exportaciones)
+    "active_hours",
+    "employees",            # no administradores (api_centro_info)
+    "employee_categorias",
+    "employee_hours",
+])
+
+
+class _TTLCache:
+    """LRU acotada con caducidad; segura entre hilos del mismo proceso."""
+
+    def __init__(self, ttl, max_entries, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _TTLCache(CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES)
+
+
+def _sorted_distinct(values):
+    return sorted({v for v in values if v is not None})
+
+
+def _load(centro):
+    stmt = select(
+        User.id, User.username, User.full_name, User.centro, User.categoria,
+        User.weekly_hours, User.is_active, User.is_admin,
+    ).order_by(User.username)
+    if centro:
+        stmt = stmt.where(User.centro == centro)
+    rows = db.session.execute(stmt).all()
+
+    active = [UserOption(*row[:6]) for row in rows if row.is_active]
+    employees = sorted((UserOption(*row[:6]) for row in rows if not row.is_admin), key=lambda u: u.id)
+    return FilterOptions(
+        centros=_sorted_distinct(row.centro for row in rows),
+        categorias=_sorted_distinct(row.categoria for row in rows),
+        active_users=active,
+        active_hours=_sorted_distinct(u.weekly_hours for u in active),
+        employees=employees,
+        employee_categorias=sorted({u.categoria for u in employees if u.categoria}),
+        employee_hours=_sorted_distinct(u.weekly_hours for u in employees),
+    )
+
+
+def filter_options(centro: str | None = None) -> FilterOptions:
+    """Opciones de los desplegables para el centro indicado (None = todos los centros)."""
+    # El motor forma parte de la clave: cada app (o BD de pruebas) tiene sus opciones
+    key = (db.engine, centro or None)
+    options = _cache.get(key)
+    if options is None:
+        options = _load(centro or None)
+        _cache.set(key, options)
+    return options
+
+
+def clear_filter_options() -> None:
+    _cache.clear()
+
+
+def _mark(target):
+    session = object_session(target)
+    if session is not None:
+        session.info[DIRTY_KEY] = True
+
+
+@event.listens_for(User, "after_insert")
+def _user_inserted(mapper, connection, target):
+    _mark(target)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _OPTION_ATTRS):
+        _mark(target)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    _mark(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_after_commit(session):
+    # Solo al confirmar: antes otra petición podría volver a cargar datos viejos
+    if session.info.pop(DIRTY_KEY, None):
+        _cache.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(DIRTY_KEY, None)
@@ -0,0 +1,155 @@
+"""
+Mantenimiento incremental de weekly_user_totals.
+
+Cada INSERT/UPDATE/DELETE de TimeRecord hecho con el ORM marca en la sesión
+las semanas (user_id, week_start) afectadas; al terminar el flush se
+recalculan solo esas filas dentro de la misma transacción. Las escrituras
+masivas que no pasan por el ORM (insert()/delete() directos) deben llamar a
+refresh_weekly_totals con las semanas que tocan. rebuild_weekly_totals
+reconstruye la tabla entera (python -m tasks.weekly_totals).
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, DateTime, Integer, cast, delete, event, func, insert, inspect, literal, select
+from sqlalchemy.orm import Session, object_session
+
+from .expressions import seconds_between, week_start as week_start_of
+from .models import TimeRecord, WeeklyUserTotal
+
+
+DIRTY_WEEKS_KEY = "weekly_totals_dirty"
+REFRESH_BATCH_SIZE = 500
+_TRACKED_ATTRS = ("user_id", "date", "check_in", "check_out")
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _worked_seconds():
+    return cast(func.round(func.sum(seconds_between(TimeRecord.check_in, TimeRecord.check_out))), Integer)
+
+
+def _complete_records():
+    return (TimeRecord.check_in.isnot(None), TimeRecord.check_out.isnot(None))
+
+
+def refresh_weekly_totals(connection, keys) -> None:
+    """Recalcula desde time_record las filas (user_id, week_start) indicadas."""
+    by_week: dict[date, set[int]] = {}
+    for user_id, week in keys:
+        if user_id is not None and week is not None:
+            by_week.setdefault(week, set()).add(user_id)
+
+    now = datetime.utcnow()
+    for week, user_ids in by_week.items():
+        user_ids = sorted(user_ids)
+        for i in range(0, len(user_ids), REFRESH_BATCH_SIZE):
+            chunk = user_ids[i:i + REFRESH_BATCH_SIZE]
+            connection.execute(
+                delete(WeeklyUserTotal).where(
+                    WeeklyUserTotal.week_start == week,
+                    WeeklyUserTotal.user_id.in_(chunk),
+                )
+            )
+            connection.execute(
+                insert(WeeklyUserTotal).from_select(
+                    ["user_id", "week_start", "worked_seconds", "updated_at"],
+                    select(
+                        TimeRecord.user_id,
+                        literal(week, Date),
+                        _worked_seconds(),
+                        literal(now, DateTime),
+                    )
+                    .where(
+                        TimeRecord.user_id.in_(chunk),
+                        TimeRecord.date >= week,
+                        TimeRecord.date <= week + timedelta(days=6),
+                        *_complete_records(),
+                    )
+                    .group_by(TimeRecord.user_id),
+                )
+            )
+
+
+def rebuild_weekly_totals(connection, since: date | None = None) -> int:
+    """
+    Reconstruye weekly_user_totals (entera o desde la semana de ``since``)
+    con un único INSERT ... SELECT agrupado. Devuelve las filas escritas.
+    """
+    week_col = week_start_of(TimeRecord.date)
+    stmt = delete(WeeklyUserTotal)
+    source = (
+        select(
+            TimeRecord.user_id,
+            week_col,
+            _worked_seconds(),
+            literal(datetime.utcnow(), DateTime),
+        )
+        .where(*_complete_records())
+        .group_by(TimeRecord.user_id, week_col)
+    )
+    if since is not None:
+        since = _week_start(since)
+        stmt = stmt.where(WeeklyUserTotal.week_start >= since)
+        source = source.where(TimeRecord.date >= since)
+
+    connection.execute(stmt)
+    result = connection.execute(
+        insert(WeeklyUserTotal).from_select(
+            ["user_id", "week_start", "worked_seconds", "updated_at"], source
+        )
+    )
+    return result.rowcount
+
+
+def _mark_dirty(target, keys) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(DIRTY_WEEKS_KEY, set()).update(keys)
+
+
+@event.listens_for(TimeRecord, "after_insert")
+def _record_inserted(mapper, connection, target):
+    _mark_dirty(target, {(target.user_id, _week_start(target.date))})
+
+
+@event.listens_for(TimeRecord, "after_delete")
+def _record_deleted(mapper, connection, target):
+    _mark_dirty(target, {(target.user_id, _week_start(target.date))})
+
+
+@event.listens_for(TimeRecord, "after_update")
+def _record_updated(mapper, connection, target):
+    state = inspect(target)
+    history = {name: state.attrs[name].history for name in _TRACKED_ATTRS}
+    if not any(h.has_changes() for h in history.values()):
+        return
+    keys = {(target.user_id, _week_start(target.date))}
+    # Si cambió el empleado o la fecha también hay que recalcular la semana de origen
+    old_user = history["user_id"].deleted[0] if history["user_id"].deleted else target.user_id
+    old_date = history["date"].deleted[0] if history["date"].deleted else target.date
+    if old_date is not None:
+        keys.add((old_user, _week_start(old_date)))
+    _mark_dirty(target, keys)
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+# active_history hace que al reasignar user_id/date se cargue antes el valor
+# anterior aunque el objeto esté expirado; sin él after_update no sabría qué
+# semana abandona el fichaje.
+for _attr in (TimeRecord.user_id, TimeRecord.date):
+    event.listen(_attr, "set", _load_previous_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_after_flush(session, flush_context):
+    keys = session.info.pop(DIRTY_WEEKS_KEY, None)
+    if keys:
+        refresh_weekly_totals(session.connection(), keys)
@@ -1,11 +1,17 @@
 from flask import (
     Blueprint, render_template, request, redirect,
-    url_for, flash, session, jsonify
+    url_for, flash, session, jsonify, current_app
 )
-from functools import wraps
 from datetime import datetime, date, timedelta
-from models.models import User, TimeRecord, EmployeeStatus
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
+import hashlib
+from models.models import User, TimeRecord, EmployeeStatus, Job
 from models.database import db
+from models.expressions import seconds_since_midnight
+from models.status_ranges import upsert_status_range
+from models.user_options import filter_options
+from routes.auth import admin_required, get_current_user
 
 admin_bp = Blueprint(
     "admin", __name__,
@@ -16,27 +22,10 @@ admin_bp = Blueprint(
 # --------------------------------------------------------------------
 #  UTILIDADES
 # --------------------------------------------------------------------
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not session.get("is_admin"):
-            flash("Acceso no autorizado.", "danger")
-            return redirect(url_for("auth.login"))
-        user = User.query.get(session.get("user_id"))
-        if not user or not user.is_admin:
-            session.clear()
-            flash("Sin permisos de administrador.", "danger")
-            return redirect(url_for("auth.login"))
-        return f(*args, **kwargs)
-    return decorated_function
-
 # Centro del admin actual (None implica super admin con acceso global)
 
 def get_admin_centro():
-    uid = session.get("user_id")
-    if not uid:
-        return None
-    u = User.query.get(uid)
+    u = get_current_user()
     # Considerar "-- Sin categoría --" como sin centro (super admin)
     if u and u.is_admin and u.centro and u.centro != "-- Sin categoría --":
         return u.centro
@@ -45,8 +34,7 @@ def get_admin_centro():
 # Helpers de permisos
 
 def _current_user():
-    uid = session.get("user_id")
-    return User.query.get(uid) if uid else None
+    return get_current_user()
 
 def is_super_admin_user(u: User | None):
     return bool(u and u.is_admin and (not u.centro or u.centro == "-- Sin categoría --"))
@@ -90,6 +78,43 @@ def _parse_optional_time(value: str | None):
     raise ValueError
 
 
+# Rango máximo de un alta de estados (evita escribir décadas por un año mal tecleado)
+STATUS_RANGE_MAX_DAYS = 366
+
+
+def _parse_status_form(form):
+    """
+    Rango y valores de un alta de estados (start_date, end_date, status,
+    notes, entry_time, exit_time) -> (start, end, values). ValueError con el
+    mensaje para el usuario si algo no es válido.
+    """
+    try:
+        entry_time = _parse_optional_time(form.get("entry_time"))
+        exit_time = _parse_optional_time(form.get("exit_time"))
+    except ValueError:
+        raise ValueError("Formato de hora inválido. Usa HH:MM.")
+
+    start_str = form.get("start_date")
+    if not start_str:
+        raise ValueError("Indica la fecha de inicio.")
+    try:
+        start = datetime.strptime(start_str, "%Y-%m-%d").date()
+        end = datetime.strptime(form.get("end_date") or start_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Formato de fecha inválido.")
+    if end < start:
+        raise ValueError("La fecha final no puede ser anterior a la inicial.")
+    if (end - start).days + 1 > STATUS_RANGE_MAX_DAYS:
+        raise ValueError(f"El rango no puede superar {STATUS_RANGE_MAX_DAYS} días.")
+
+    return start, end, dict(
+        status=form.get("status", ""),
+        notes=form.get("notes", ""),
+        entry_time=entry_time,
+        exit_time=exit_time,
+    )
+
+
 # --------------------------------------------------------------------
 #  DASHBOARD
 # --------------------------------------------------------------------
@@ -131,9 +156,11 @@ def dashboard():
     start_of_week = today - timedelta(days=today.weekday())
     end_of_week = start_of_week + timedelta(days=6)
 
+    # El empleado de cada fichaje llega en el mismo JOIN (sin una consulta por usuario)
     q = (
         TimeRecord.query
         .join(User, TimeRecord.user_id == User.id)
+        .options(contains_eager(TimeRecord.user))
         .filter(
             TimeRecord.date >= start_of_week,
             TimeRecord.date <= end_of_week,
@@ -171,15 +198,8 @@ def dashboard():
     records_with_accum.reverse()
 
     # Opciones dinámicas de centros y categorías (limitadas por centro del admin si aplica)
-    centros_q = User.query
-    if centro_admin:
-        centros_q = centros_q.filter(User.centro == centro_admin)
-    centros = [c[0] for c in centros_q.with_entities(User.centro).filter(User.centro.isnot(None)).distinct().order_by(User.centro).all()]
-
-    categorias_q = User.query
-    if centro_admin:
-        categorias_q = categorias_q.filter(User.centro == centro_admin)
-    categorias = [c[0] for c in categorias_q.with_entities(User.categoria).filter(User.categoria.isnot(None)).distinct().order_by(User.categoria).all()]
+    options = filter_options(centro_admin)
+    centros, categorias = options.centros, options.categorias
 
     return render_template(
         "admin_dashboard.html",
@@ -220,15 +240,8 @@ def manage_users():
     users = q.order_by(User.username).all()
 
     # Opciones dinámicas de centros y categorías (limitadas por centro del admin si aplica)
-    centros_q = User.query
-    if centro_admin:
-        centros_q = centros_q.filter(User.centro == centro_admin)
-    centros = [c[0] for c in centros_q.with_entities(User.centro).filter(User.centro.isnot(None)).distinct().order_by(User.centro).all()]
-
-    categorias_q = User.query
-    if centro_admin:
-        categorias_q = categorias_q.filter(User.centro == centro_admin)
-    categorias = [c[0] for c in categorias_q.with_entities(User.categoria).filter(User.categoria.isnot(None)).distinct().order_by(User.categoria).all()]
+    options = filter_options(centro_admin)
+    centros, categorias = options.centros, options.categorias
 
     return render_template("manage_users.html", users=users, centros=centros, categorias=categorias, centro_admin=centro_admin)
 
@@ -446,10 +459,11 @@ def manage_records():
     filtro_centro = request.args.get("centro", type=str, default="")
     search_query = request.args.get("search", type=str, default="")
 
-    # Buscar registros solo de esa semana + filtros
+    # Buscar registros solo de esa semana + filtros (con su empleado en el mismo JOIN)
     q = (
         TimeRecord.query
         .join(User, TimeRecord.user_id == User.id)
+        .options(contains_eager(TimeRecord.user))
         .filter(
             TimeRecord.date >= start_of_week,
             TimeRecord.date <= end_of_week,
@@ -465,8 +479,7 @@ def manage_records():
     elif filtro_centro:
         q = q.filter(User.centro == filtro_centro)
 
-    # Aplicar filtros opcionales (fechas)
-    ci_from = co_to = None
+    # Aplicar filtros opcionales (fechas y horas, resueltos en la BD)
     try:
         if date_from:
             df = datetime.strptime(date_from, "%Y-%m-%d").date()
@@ -476,8 +489,10 @@ def manage_records():
             q = q.filter(TimeRecord.date <= dt)
         if time_from:
             ci_from = datetime.strptime(time_from, "%H:%M").time()
+            q = q.filter(TimeRecord.check_in_seconds >= seconds_since_midnight(ci_from))
         if time_to:
             co_to = datetime.strptime(time_to, "%H:%M").time()
+            q = q.filter(TimeRecord.check_out_seconds <= seconds_since_midnight(co_to))
     except ValueError:
         flash("Formato de fecha/hora inválido en filtros.", "warning")
 
@@ -493,19 +508,6 @@ def manage_records():
 
     recs = q.order_by(TimeRecord.user_id, TimeRecord.date.asc(), TimeRecord.check_in.asc()).all()
 
-    # Filtrar por horas en Python para compatibilidad con SQLite/Postgres
-    if ci_from or co_to:
-        filtered = []
-        for r in recs:
-            ok = True
-            if ci_from and (not r.check_in or r.check_in.time() < ci_from):
-                ok = False
-            if co_to and (not r.check_out or r.check_out.time() > co_to):
-                ok = False
-            if ok:
-                filtered.append(r)
-        recs = filtered
-
     # Lógica de acumulados (igual que antes)
     weekly_acc = {}
     enriched = []
@@ -536,10 +538,10 @@ def manage_records():
         })
 
     # ¿Hay una semana anterior en la base de datos?
-    earliest_record = TimeRecord.query.order_by(TimeRecord.date.asc()).first()
+    earliest_date = db.session.scalar(db.select(func.min(TimeRecord.date)))
     has_next = False
-    if earliest_record:
-        first_week = earliest_record.date - timedelta(days=earliest_record.date.weekday())
+    if earliest_date:
+        first_week = earliest_date - timedelta(days=earliest_date.weekday())
         has_next = start_of_week > first_week
 
     # Mostramos la semana más reciente primero
@@ -549,10 +551,11 @@ def manage_records():
     is_current_week = (start_of_week == start_of_current)
 
     # Opciones dinámicas de centros para el select
-    centros_q = User.query
-    if centro_admin:
-        centros_q = centros_q.filter(User.centro == centro_admin)
-    centros = [c[0] for c in centros_q.with_entities(User.centro).filter(User.centro.isnot(None)).distinct().order_by(User.centro).all()]
+    centros = filter_options(centro_admin).centros
+
+    # Tarea en segundo plano recién lanzada desde esta página (autofichaje/backfill)
+    job_id = request.args.get("job", type=int)
+    job = _visible_job(job_id) if job_id else None
 
     return render_template(
         "manage_records.html",
@@ -563,7 +566,9 @@ def manage_records():
         week_range=week_range,
         is_current_week=is_current_week,
         centros=centros,
-        centro_admin=centro_admin
+        centro_admin=centro_admin,
+        job=job,
+        job_messages=_job_messages(job) if job else [],
     )
 
 
@@ -584,32 +589,18 @@ def autofill_week_records():
     centro = centro_admin or request.form.get("centro") or None
 
     try:
-        from tasks.autofill import autofill_week
+        from tasks.jobs import enqueue_job
 
-        result = autofill_week(
-            start_of_week,
-            centro=centro,
-            modified_by=session.get("user_id"),
+        job = enqueue_job(
+            "autofill",
+            {"week_start": start_of_week, "centro": centro},
+            created_by=session.get("user_id"),
         )
-        if result.created_records:
-            flash(
-                f"Autofichaje completado: {result.created_records} registros creados.",
-                "success",
-            )
-        else:
-            flash("Autofichaje ejecutado sin crear nuevos registros.", "info")
-
-        skipped = result.skipped_users
-        if skipped:
-            flash(
-                f"{len(skipped)} empleados no se pudieron autofichar completamente. "
-                "Revisa ausencias, fechas de alta/baja o días de libranza.",
-                "warning",
-            )
     except Exception as e:
-        flash(f"Error al ejecutar el autofichaje: {str(e)}", "danger")
+        flash(f"Error al encolar el autofichaje: {str(e)}", "danger")
+        return redirect(url_for("admin.manage_records", page=page))
 
-    return redirect(url_for("admin.manage_records", page=page))
+    return redirect(url_for("admin.manage_records", page=page, job=job.id))
 
 
 @admin_bp.route("/records/backfill", methods=["POST"])
@@ -619,7 +610,8 @@ def backfill_records():
     Aplica el fichaje automático a un rango de semanas ya cerradas (por defecto
     junio y julio del año en curso). Pensado para regularizar datos "antiguos"
     desde la web, sin necesidad de consola. Con «Simular» solo muestra lo que
-    haría; con «Aplicar» lo ejecuta de verdad. Es idempotente.
+    haría; con «Aplicar» lo ejecuta de verdad. Es idempotente. Se ejecuta como
+    tarea en segundo plano (tasks/jobs.py): la página sigue su progreso.
     """
     dry_run = request.form.get("mode") != "apply"
     page = request.form.get("page", type=int, default=1)
@@ -643,44 +635,113 @@ def backfill_records():
     centro = get_admin_centro()
 
     try:
-        from tasks.regularize import regularize_range
-
-        summary = regularize_range(
-            range_start,
-            range_end,
-            today=today,
-            dry_run=dry_run,
-            centro=centro,
-            modified_by=session.get("user_id"),
+        from tasks.jobs import enqueue_job
+
+        job = enqueue_job(
+            "regularize",
+            {
+                "range_start": range_start,
+                "range_end": range_end,
+                "today": today,
+                "dry_run": dry_run,
+                "centro": centro,
+            },
+            created_by=session.get("user_id"),
         )
     except Exception as e:
-        flash(f"Error al ejecutar la regularización: {str(e)}", "danger")
+        flash(f"Error al encolar la regularización: {str(e)}", "danger")
         return redirect(url_for("admin.manage_records", page=page))
 
+    return redirect(url_for("admin.manage_records", page=page, job=job.id))
+
+
+def _job_messages(job):
+    """Mensajes (texto, categoría) con el resumen de una tarea terminada."""
+    if job.status == Job.STATUS_FAILED:
+        action = "el autofichaje" if job.kind == "autofill" else "la regularización"
+        return [(f"Error al ejecutar {action}: {job.error}", "danger")]
+    if job.status != Job.STATUS_DONE:
+        return []
+
+    result = job.result or {}
+    if job.kind == "autofill":
+        messages = []
+        if result.get("created_records"):
+            messages.append((
+                f"Autofichaje completado: {result['created_records']} registros creados.",
+                "success",
+            ))
+        else:
+            messages.append(("Autofichaje ejecutado sin crear nuevos registros.", "info"))
+        if result.get("skipped_users"):
+            messages.append((
+                f"{result['skipped_users']} empleados no se pudieron autofichar completamente. "
+                "Revisa ausencias, fechas de alta/baja o días de libranza.",
+                "warning",
+            ))
+        return messages
+
+    dry_run = result.get("dry_run")
     prefix = "SIMULACIÓN — " if dry_run else ""
-    if not summary.weeks:
-        flash(
+    weeks = result.get("weeks") or []
+    if not weeks:
+        return [(
             f"{prefix}No hay semanas completas en el rango "
-            f"{range_start} … {range_end}.",
+            f"{result.get('range_start')} … {result.get('range_end')}.",
             "warning",
-        )
-    elif dry_run:
-        flash(
-            f"{prefix}{len(summary.weeks)} semana(s): se recrearían "
-            f"{summary.created_records} fichaje(s) y se detectarían "
-            f"{summary.overtime_alerts} aviso(s) de horas extra. "
+        )]
+    if dry_run:
+        return [(
+            f"{prefix}{len(weeks)} semana(s): se recrearían "
+            f"{result.get('created_records', 0)} fichaje(s) y se detectarían "
+            f"{result.get('overtime_alerts', 0)} aviso(s) de horas extra. "
             "Pulsa «Aplicar backfill» para confirmarlo.",
             "info",
-        )
-    else:
-        flash(
-            f"Regularización aplicada a {len(summary.weeks)} semana(s): "
-            f"{summary.created_records} fichaje(s) recreado(s) y "
-            f"{summary.overtime_alerts} aviso(s) detectado(s) (horas extra o descuadres).",
-            "success",
-        )
+        )]
+    return [(
+        f"Regularización aplicada a {len(weeks)} semana(s): "
+        f"{result.get('created_records', 0)} fichaje(s) recreado(s) y "
+        f"{result.get('overtime_alerts', 0)} aviso(s) detectado(s) (horas extra o descuadres).",
+        "success",
+    )]
+
+
+def _visible_job(job_id):
+    """Tarea si existe y el admin puede verla (los de centro, solo las de su centro)."""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return None
+    centro_admin = get_admin_centro()
+    if centro_admin and (job.params or {}).get("centro") != centro_admin:
+        return None
+    return job
 
-    return redirect(url_for("admin.manage_records", page=page))
+
+@admin_bp.route("/jobs/<int:job_id>")
+@admin_required
+def job_status(job_id):
+    """Estado y progreso de una tarea en segundo plano (JSON, lo consulta manage_records)."""
+    job = _visible_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "Tarea no encontrada."}), 404
+    return jsonify({
+        "ok": True,
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "finished": job.is_finished,
+        "progress_done": job.progress_done,
+        "progress_total": job.progress_total,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "result": job.result,
+        "error": job.error,
+        "messages": [
+            {"text": text, "category": category}
+            for text, category in _job_messages(job)
+        ],
+    })
 
 
 @admin_bp.route("/records/edit/<int:record_id>", methods=["GET", "POST"])
@@ -731,78 +792,116 @@ def admin_calendar():
     # Pasamos el centro del admin (None => super admin)
     return render_template("admin_calendar.html", centro_admin=get_admin_centro())
 
+# Rango máximo (en días) que puede pedir el calendario: la vista mensual de
+# FullCalendar abarca 6 semanas; se deja margen para las vistas de lista.
+CALENDAR_MAX_SPAN_DAYS = 62
+
+STATUS_COLORS = {
+    "Trabajado" : "#60a5fa",
+    "Baja"      : "#f87171",
+    "Ausente"   : "#fbbf24",
+    "Vacaciones": "#34d399"
+}
+
+
+def _parse_calendar_date(value):
+    """Fecha de FullCalendar ('YYYY-MM-DD' o ISO con hora/zona) -> date, o None."""
+    if not value:
+        return None
+    try:
+        if 'T' in value:
+            return datetime.fromisoformat(value.replace('Z', '')).date()
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
 @admin_bp.route("/api/events")
 @admin_required
 def api_events():
-    """Eventos para el calendario global."""
+    """
+    Eventos para el calendario global en la ventana [start, end] (obligatoria,
+    como máximo CALENDAR_MAX_SPAN_DAYS). Responde con un ETag débil calculado
+    a partir del último updated_at y el nº de estados de la ventana; si el
+    navegador ya lo tiene, 304 sin cargar los eventos.
+    """
     user_id = request.args.get("user_id", type=int)
-    start   = request.args.get("start")
-    end     = request.args.get("end")
     status  = request.args.get("status")
     centro  = request.args.get("centro")
 
-    # ==== Cambios para manejo correcto de fechas ====
-    start_date = None
-    end_date = None
-    if start:
-        try:
-            if 'T' in start:
-                start_date = datetime.fromisoformat(start.replace('Z', '')).date()
-            else:
-                start_date = datetime.strptime(start, "%Y-%m-%d").date()
-        except Exception:
-            start_date = None
-    if end:
-        try:
-            if 'T' in end:
-                end_date = datetime.fromisoformat(end.replace('Z', '')).date()
-            else:
-                end_date = datetime.strptime(end, "%Y-%m-%d").date()
-        except Exception:
-            end_date = None
-
-    q = EmployeeStatus.query.join(User).filter(User.is_admin == False)
-
+    start_date = _parse_calendar_date(request.args.get("start"))
+    end_date = _parse_calendar_date(request.args.get("end"))
+    if not start_date or not end_date:
+        return jsonify({"ok": False, "error": "Parámetros start y end (YYYY-MM-DD) obligatorios."}), 400
+    if end_date < start_date:
+        return jsonify({"ok": False, "error": "end no puede ser anterior a start."}), 400
+    if (end_date - start_date).days > CALENDAR_MAX_SPAN_DAYS:
+        return jsonify({
+            "ok": False,
+            "error": f"El rango no puede superar {CALENDAR_MAX_SPAN_DAYS} días.",
+        }), 400
+
+    conditions = [
+        User.is_admin == False,
+        EmployeeStatus.date >= start_date,
+        EmployeeStatus.date <= end_date,
+    ]
     # Scope por centro del admin (si tiene asignado)
     centro_admin = get_admin_centro()
     if centro_admin:
-        q = q.filter(User.centro == centro_admin)
+        conditions.append(User.centro == centro_admin)
     elif centro:
         # Si no hay centro del admin, permitir filtrar por parámetro opcional
-        q = q.filter(User.centro == centro)
-
+        conditions.append(User.centro == centro)
     if user_id:
-        q = q.filter(EmployeeStatus.user_id == user_id)
-    if start_date:
-        q = q.filter(EmployeeStatus.date >= start_date)
-    if end_date:
-        q = q.filter(EmployeeStatus.date <= end_date)
+        conditions.append(EmployeeStatus.user_id == user_id)
     if status:
-        q = q.filter(EmployeeStatus.status == status)
-
-    events = [
-        {
-            "id"   : es.id,
-            "title": f"{es.status} - {es.user.full_name or es.user.username}",
-            "start": es.date.isoformat(),
-            "color": {
-                "Trabajado" : "#60a5fa",
-                "Baja"      : "#f87171",
-                "Ausente"   : "#fbbf24",
-                "Vacaciones": "#34d399"
-            }.get(es.status, "#9ca3af"),
-            "extendedProps": {
-                "notes": es.notes,
-                "username": es.user.full_name or es.user.username,
-                "category": es.user.categoria,
-                "entry_time": es.entry_time.strftime("%H:%M") if es.entry_time else None,
-                "exit_time": es.exit_time.strftime("%H:%M") if es.exit_time else None,
-            },
-            "allDay": True
-        }
-        for es in q.all()
-    ]
-    return jsonify(events)
+        conditions.append(EmployeeStatus.status == status)
+
+    last_updated, total = db.session.execute(
+        db.select(func.max(EmployeeStatus.updated_at), func.count(EmployeeStatus.id))
+        .join(User, EmployeeStatus.user_id == User.id)
+        .where(*conditions)
+    ).one()
+    # El centro del admin forma parte de la clave: la misma URL da otro resultado
+    etag = hashlib.sha1(
+        f"{request.query_string.decode()}|{centro_admin}|{last_updated}|{total}".encode()
+    ).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        rows = db.session.execute(
+            db.select(
+                EmployeeStatus.id, EmployeeStatus.date, EmployeeStatus.status,
+                EmployeeStatus.notes, EmployeeStatus.entry_time, EmployeeStatus.exit_time,
+                User.full_name, User.username, User.categoria,
+            )
+            .join(User, EmployeeStatus.user_id == User.id)
+            .where(*conditions)
+            .order_by(EmployeeStatus.date, EmployeeStatus.id)
+        )
+        events = [
+            {
+                "id"   : es.id,
+                "title": f"{es.status} - {es.full_name or es.username}",
+                "start": es.date.isoformat(),
+                "color": STATUS_COLORS.get(es.status, "#9ca3af"),
+                "extendedProps": {
+                    "notes": es.notes,
+                    "username": es.full_name or es.username,
+                    "category": es.categoria,
+                    "entry_time": es.entry_time.strftime("%H:%M") if es.entry_time else None,
+                    "exit_time": es.exit_time.strftime("%H:%M") if es.exit_time else None,
+                },
+                "allDay": True
+            }
+            for es in rows
+        ]
+        response = jsonify(events)
+    response.set_etag(etag, weak=True)
+    # Revalidar siempre: el navegador reenvía If-None-Match al navegar el calendario
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 @admin_bp.route("/api/employees")
 @admin_required
@@ -827,21 +926,11 @@ def api_employees():
 @admin_required
 def api_centro_info():
     centro = request.args.get("centro")
-    users = User.query.filter_by(is_admin=False)
-
-    centro_admin = get_admin_centro()
-    if centro_admin:
-        users = users.filter(User.centro == centro_admin)
-    elif centro:
-        users = users.filter(User.centro == centro)
-
-    users = users.all()
-    categorias = sorted(set(u.categoria for u in users if u.categoria))
-    horas = sorted(set(u.weekly_hours for u in users if u.weekly_hours is not None))
+    options = filter_options(get_admin_centro() or centro)
     return jsonify({
-        "usuarios": [{"id": u.id, "username": u.username, "full_name": u.full_name} for u in users],
-        "categorias": categorias,
-        "horas": horas
+        "usuarios": [{"id": u.id, "username": u.username, "full_name": u.full_name} for u in options.employees],
+        "categorias": options.employee_categorias,
+        "horas": options.employee_hours
     })
 
 # --------------------------------------------------------------------
@@ -859,55 +948,14 @@ def manage_employee_status(user_id):
     user = User.query.get_or_404(user_id)
 
     if request.method == "POST":
-        start_str = request.form.get("start_date")
-        end_str   = request.form.get("end_date") or start_str
-        status    = request.form.get("status", "")
-        notes     = request.form.get("notes", "")
-        entry_time_str = request.form.get("entry_time")
-        exit_time_str  = request.form.get("exit_time")
-
         try:
-            entry_time = _parse_optional_time(entry_time_str)
-            exit_time = _parse_optional_time(exit_time_str)
-        except ValueError:
-            flash("Formato de hora inválido. Usa HH:MM.", "danger")
+            start, end, values = _parse_status_form(request.form)
+        except ValueError as exc:
+            flash(str(exc), "danger")
             return redirect(url_for("admin.manage_employee_status", user_id=user_id))
 
-        if not start_str:
-            flash("Indica la fecha de inicio.", "danger")
-            return redirect(url_for("admin.manage_employee_status", user_id=user_id))
-
-        try:
-            start = datetime.strptime(start_str, "%Y-%m-%d").date()
-            end   = datetime.strptime(end_str,   "%Y-%m-%d").date()
-        except ValueError:
-            flash("Formato de fecha inválido.", "danger")
-            return redirect(url_for("admin.manage_employee_status", user_id=user_id))
-
-        if end < start:
-            flash("La fecha final no puede ser anterior a la inicial.", "danger")
-            return redirect(url_for("admin.manage_employee_status", user_id=user_id))
-
-        delta = (end - start).days + 1
-        for i in range(delta):
-            day = start + timedelta(days=i)
-            existing = EmployeeStatus.query.filter_by(
-                user_id=user_id, date=day
-            ).first()
-            if existing:
-                existing.status = status
-                existing.notes  = notes
-                existing.entry_time = entry_time
-                existing.exit_time = exit_time
-            else:
-                db.session.add(EmployeeStatus(
-                    user_id = user_id,
-                    date    = day,
-                    status  = status,
-                    notes   = notes,
-                    entry_time = entry_time,
-                    exit_time = exit_time,
-                ))
+        # Todo el rango en una sola sentencia (INSERT ... ON CONFLICT DO UPDATE)
+        upsert_status_range(db.session.connection(), [user_id], start, end, **values)
         db.session.commit()
         flash("Estado guardado.", "success")
         return redirect(url_for("admin.manage_employee_status", user_id=user_id))
@@ -941,27 +989,48 @@ def edit_employee_status(user_id, status_id):
     db.session.commit()
     return jsonify({"ok": True})
 
+# --------------------------------------------------------------------
+#  ESTADO PARA TODO UN CENTRO (festivos, cierres...)
+# --------------------------------------------------------------------
+@admin_bp.route("/centro_status", methods=["POST"])
+@admin_required
+def centro_status():
+    """
+    Mismo estado para todos los empleados activos de un centro en un rango
+    de días. Si alguno ya tenía estado ese día se sobrescribe.
+    """
+    centro = get_admin_centro() or request.form.get("centro")
+    if not centro:
+        flash("Selecciona el centro.", "danger")
+        return redirect(url_for("admin.admin_calendar"))
+    try:
+        start, end, values = _parse_status_form(request.form)
+    except ValueError as exc:
+        flash(str(exc), "danger")
+        return redirect(url_for("admin.admin_calendar"))
+
+    user_ids = [
+        user_id for (user_id,) in db.session.query(User.id).filter(
+            User.centro == centro,
+            User.is_active.is_(True),
+            User.is_admin.is_(False),
+        )
+    ]
+    if not user_ids:
+        flash(f"No hay empleados activos en {centro}.", "warning")
+        return redirect(url_for("admin.admin_calendar"))
+
+    upsert_status_range(db.session.connection(), user_ids, start, end, **values)
+    db.session.commit()
+    flash(f"Estado guardado para {len(user_ids)} empleado(s) de {centro}.", "success")
+    return redirect(url_for("admin.admin_calendar"))
+
 # --------------------------------------------------------------------
 #  FICHAS ABIERTAS DE EMPLEADOS
 # --------------------------------------------------------------------
 @admin_bp.route("/open_records", methods=["GET", "POST"])
 @admin_required
 def open_records():
-    # Limitar por centro del admin si aplica y excluir admins
-    centro_admin = get_admin_centro()
-    q = (
-        TimeRecord.query
-        .join(User, TimeRecord.user_id == User.id)
-        .filter(
-            TimeRecord.check_in.isnot(None),
-            TimeRecord.check_out.is_(None),
-            User.is_admin == False
-        )
-    )
-    if centro_admin:
-        q = q.filter(User.centro == centro_admin)
-    open_records = q.all()
-
     if request.method == "POST":
         record_id = request.form.get("record_id")
         close_time = request.form.get("close_time")
@@ -980,6 +1049,22 @@ def open_records():
                 flash(f"Error al cerrar: {e}", "danger")
         return redirect(url_for("admin.open_records"))
 
+    # Limitar por centro del admin si aplica y excluir admins
+    centro_admin = get_admin_centro()
+    q = (
+        TimeRecord.query
+        .join(User, TimeRecord.user_id == User.id)
+        .options(contains_eager(TimeRecord.user))
+        .filter(
+            TimeRecord.check_in.isnot(None),
+            TimeRecord.check_out.is_(None),
+            User.is_admin == False
+        )
+    )
+    if centro_admin:
+        q = q.filter(User.centro == centro_admin)
+    open_records = q.all()
+
     return render_template("open_records.html", open_records=open_records)
 
 # --------------------------------------------------------------------
@@ -1,11 +1,55 @@
 from functools import wraps
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g
 from models.models import User
 from models.database import db
 
 auth_bp = Blueprint("auth", __name__)  # Usa la carpeta global de templates
 
+_NOT_LOADED = object()
+
+
+def get_current_user():
+    """
+    Usuario de la sesión, cargado como mucho una vez por petición (se guarda
+    en flask.g). Lo comparten admin_required, get_admin_centro, los permisos
+    de admin y el context processor. None si no hay sesión o ya no existe.
+    """
+    user = g.get("current_user", _NOT_LOADED)
+    if user is _NOT_LOADED:
+        user_id = session.get("user_id")
+        user = db.session.get(User, user_id) if user_id else None
+        g.current_user = user
+    return user
+
+
+# Context processor para hacer disponible el usuario actual y saludo
+@auth_bp.app_context_processor
+def inject_user():
+    user = get_current_user()
+    greeting = ""
+
+    if user:
+        # Obtener solo el primer nombre
+        first_name = user.full_name.split()[0] if user.full_name else user.username
+
+        # Determinar saludo según la hora
+        hour = datetime.now().hour
+        if 6 <= hour < 12:
+            greeting = f"Buenos días, {first_name}"
+        elif 12 <= hour < 20:
+            greeting = f"Buenas tardes, {first_name}"
+        else:
+            greeting = f"Buenas noches, {first_name}"
+
+    return dict(
+        current_user=user,
+        greeting=greeting,
+    )
+
+
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
@@ -96,7 +140,7 @@ def admin_required(f):
             flash("Acceso no autorizado. Se requieren permisos de administrador.", "danger")
             return redirect(url_for("auth.login"))
         # Check if user still exists and is admin in DB for extra seguridad
-        user = User.query.get(session.get("user_id"))
+        user = get_current_user()
         if not user or not user.is_admin:
             session.clear()
             flash("Tu cuenta ya no tiene permisos de administrador.", "danger")
@@ -0,0 +1,171 @@
+"""
+Volcados masivos de fichajes (CSV, CSV comprimido y Parquet) para cargar en
+otras herramientas.
+
+Las filas llegan del mismo cruce fichajes/estados que el Excel
+(_iter_export_rows en routes/export.py) y se escriben con valores
+en crudo (fechas ISO, horas decimales), sin formato de hoja de cálculo. CSV y
+CSV.gz se generan por trozos mientras se lee el cursor, sin retener filas;
+Parquet necesita el pie del fichero al final, así que se escribe por grupos de
+filas en un fichero temporal y se envía al acabar. Parquet solo está
+disponible si pyarrow está instalado.
+"""
+
+import csv
+import tempfile
+import zlib
+from io import StringIO
+from itertools import islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+BULK_FORMATS = ("csv", "csv.gz", "parquet")
+# Filas por trozo de CSV y por grupo de filas de Parquet
+BULK_CHUNK_ROWS = 5000
+BULK_SPOOL_MAX_BYTES = 32 * 1024 * 1024
+GZIP_LEVEL = 6
+# Textos de fechas/horas memorizados en el CSV antes de vaciar la caché
+TEMPORAL_CACHE_SIZE = 65536
+
+BULK_COLUMNS = [
+    "ID Usuario", "Usuario", "Nombre completo", "Categoría", "Centro",
+    "Fecha", "Entrada", "Salida", "Entrada Admin", "Salida Admin",
+    "Horas Trabajadas", "Notas", "Notas Admin", "Modificado Por",
+    "Última Actualización",
+]
+# Fecha, Entrada, Salida, Entrada Admin, Salida Admin, Última Actualización
+_TEMPORAL_COLUMNS = (5, 6, 7, 8, 9, 14)
+
+
+def parquet_available():
+    return pq is not None
+
+
+def bulk_rows(rows, users):
+    """Tuplas con los valores en crudo de BULK_COLUMNS para cada (record, status)."""
+    # Columnas del empleado precalculadas: por fila solo se busca una tupla
+    user_columns = {
+        user_id: (user.username, user.full_name, user.categoria, user.centro)
+        for user_id, user in users.items()
+    }
+    no_user = (None, None, None, None)
+    for record, status in rows:
+        user_id, check_in, check_out = record.user_id, record.check_in, record.check_out
+        editor = users.get(record.modified_by) if record.modified_by else None
+        hours = None
+        if check_in and check_out:
+            hours = round((check_out - check_in).total_seconds() / 3600, 2)
+        if status is None:
+            entry = exit_ = admin_notes = None
+        else:
+            entry, exit_, admin_notes = status.entry_time, status.exit_time, status.notes
+        yield (
+            user_id,
+            *user_columns.get(user_id, no_user),
+            record.date,
+            check_in,
+            check_out,
+            entry,
+            exit_,
+            hours,
+            record.notes,
+            admin_notes,
+            editor.username if editor else None,
+            record.updated_at,
+        )
+
+
+def _csv_values(values):
+    """
+    Sustituye fechas y horas por su texto ISO. Se repiten mucho (mismo día,
+    mismas horas de entrada) y convertirlas es lo más caro del CSV, así que se
+    memorizan en una caché acotada.
+    """
+    cache = {}
+    for row in values:
+        row = list(row)
+        for index in _TEMPORAL_COLUMNS:
+            value = row[index]
+            if value is not None:
+                text = cache.get(value)
+                if text is None:
+                    if len(cache) >= TEMPORAL_CACHE_SIZE:
+                        cache.clear()
+                    text = cache[value] = str(value)
+                row[index] = text
+        yield row
+
+
+def csv_chunks(values):
+    """Texto CSV por trozos de BULK_CHUNK_ROWS filas, empezando por la cabecera."""
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(BULK_COLUMNS)
+    values = _csv_values(values)
+    while True:
+        writer.writerows(islice(values, BULK_CHUNK_ROWS))
+        chunk = buffer.getvalue()
+        if not chunk:
+            return
+        yield chunk
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzip_chunks(chunks):
+    """Comprime en gzip, en flujo, los trozos de texto recibidos."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("ID Usuario", pa.int64()),
+        ("Usuario", pa.string()),
+        ("Nombre completo", pa.string()),
+        ("Categoría", pa.string()),
+        ("Centro", pa.string()),
+        ("Fecha", pa.date32()),
+        ("Entrada", pa.timestamp("s")),
+        ("Salida", pa.timestamp("s")),
+        ("Entrada Admin", pa.time32("s")),
+        ("Salida Admin", pa.time32("s")),
+        ("Horas Trabajadas", pa.float64()),
+        ("Notas", pa.string()),
+        ("Notas Admin", pa.string()),
+        ("Modificado Por", pa.string()),
+        ("Última Actualización", pa.timestamp("s")),
+    ])
+
+
+def write_parquet(values):
+    """
+    Fichero temporal (rebobinado) con las filas en Parquet, un grupo de filas
+    por cada BULK_CHUNK_ROWS. Requiere pyarrow (ver parquet_available).
+    """
+    if pq is None:
+        raise RuntimeError("pyarrow no está instalado")
+    schema = _parquet_schema()
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_MAX_BYTES)
+    values = iter(values)
+    with pq.ParquetWriter(spool, schema, compression="zstd") as writer:
+        while True:
+            batch = list(islice(values, BULK_CHUNK_ROWS))
+            if not batch:
+                break
+            columns = [
+                pa.array(column, type=field.type)
+                for column, field in zip(zip(*batch), schema)
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+    spool.seek(0)
+    return spool
@@ -1,108 +1,362 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file
-from functools import wraps
-from models.models import User, TimeRecord, EmployeeStatus
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app,
+    Response, stream_with_context,
+)
+from models.models import User, TimeRecord, EmployeeStatus, WeeklyUserTotal
 from models.database import db
+from models.user_options import filter_options
+from routes.auth import admin_required
+from routes.bulk_export import (
+    BULK_FORMATS, bulk_rows, csv_chunks, gzip_chunks, parquet_available, write_parquet,
+)
+from routes.pdf_report import bundle_reports, render_records_report
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta, date
-from types import SimpleNamespace
+from collections import namedtuple
+from itertools import chain, groupby
+from io import BytesIO
 import os
 import tempfile
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
-from collections import defaultdict
+from sqlalchemy import and_, exists, func, null, or_, select, union_all
+from models.expressions import seconds_between, week_start as week_start_of
 
 export_bp = Blueprint("export", __name__, template_folder="../templates")
 
-# Decorator to check if user is admin
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not session.get("is_admin"):
-            flash("Acceso no autorizado. Se requieren permisos de administrador.", "danger")
-            return redirect(url_for("auth.login"))
-        user = User.query.get(session.get("user_id"))
-        if not user or not user.is_admin:
-            session.clear()
-            flash("Tu cuenta ya no tiene permisos de administrador.", "danger")
-            return redirect(url_for("auth.login"))
-        return f(*args, **kwargs)
-    return decorated_function
-
-
-def _fetch_statuses(start_date, end_date, *, centro=None, user_id=None,
-                    categoria=None, weekly_hours=None):
-    """Return EmployeeStatus rows matching the provided filters."""
-    query = EmployeeStatus.query.join(User, EmployeeStatus.user_id == User.id)
-    query = query.filter(EmployeeStatus.date >= start_date)
-    query = query.filter(EmployeeStatus.date <= end_date)
-
-    if user_id:
-        query = query.filter(EmployeeStatus.user_id == user_id)
+# Filas que se piden a la BD por lote al generar exportaciones (cursor de servidor)
+EXPORT_BATCH_SIZE = 1000
+# Tamaño a partir del cual el fichero temporal de la exportación pasa a disco
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Rango máximo de los informes PDF de varios días (un mes holgado)
+PDF_REPORT_MAX_DAYS = 62
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Export rows as named tuples: reading a field by name from a SQLAlchemy Row
+# costs ~20x more, which dominates loops over millions of rows.
+_ExportRecord = namedtuple(
+    "_ExportRecord", "user_id date check_in check_out notes modified_by updated_at"
+)
+_ExportStatus = namedtuple(
+    "_ExportStatus", "user_id date notes entry_time exit_time created_at updated_at"
+)
+# Weekly subtotal of one employee, as written in the monthly Excel and PDF report
+_WeekSummary = namedtuple(
+    "_WeekSummary", "worked_seconds worked_hours contract_hours difference"
+)
+
+
+# Campos del formulario de exportación que usa cada botón de Excel
+_BUTTON_FILTER_FIELDS = {
+    "excel_centro_usuario": {"centro": "centro1", "user_id": "usuario1"},
+    "excel_centro_categoria": {"centro": "centro2", "categoria": "categoria2"},
+    "excel_centro_horas": {"centro": "centro3", "weekly_hours": "horas3"},
+    "excel_solo_centro": {"centro": "centro4"},
+    "excel_solo_usuario": {"user_id": "usuario4"},
+    "excel_solo_categoria": {"categoria": "categoria4"},
+    "excel_solo_horas": {"weekly_hours": "horas4"},
+}
+# Los informes del periodo (PDF, CSV) del mismo formulario usan la fila de
+# filtros avanzados completa
+_PANEL_FILTER_FIELDS = {
+    "centro": "centro4", "user_id": "usuario4", "categoria": "categoria4", "weekly_hours": "horas4",
+}
+# Peticiones sin el formulario (enlaces, scripts): nombres directos
+_PLAIN_FILTER_FIELDS = {
+    "centro": "centro", "user_id": "user_id", "categoria": "categoria", "weekly_hours": "weekly_hours",
+}
+
+
+def _request_filters(values):
+    """
+    Export filters (centro, user_id, categoria, weekly_hours) sent by the
+    export form or given directly. Raises ValueError if weekly_hours is not
+    numeric.
+    """
+    # El botón pulsado es el último excel_* recibido
+    buttons = [k for k in values.keys() if k.startswith("excel_")]
+    if buttons and buttons[-1] in _BUTTON_FILTER_FIELDS:
+        fields = _BUTTON_FILTER_FIELDS[buttons[-1]]
+    elif not buttons and "centro4" in values:
+        fields = _PANEL_FILTER_FIELDS
+    else:
+        fields = _PLAIN_FILTER_FIELDS
+    filters = {key: (values.get(fields[key]) or None) if key in fields else None
+               for key in _PLAIN_FILTER_FIELDS}
+    if fields is _PLAIN_FILTER_FIELDS:
+        filters["weekly_hours"] = filters["weekly_hours"] or values.get("jornada") or None
+    if filters["weekly_hours"] is not None:
+        filters["weekly_hours"] = int(filters["weekly_hours"])
+    return filters
+
+
+def _filter_by_user(query, *, centro=None, user_id=None, categoria=None,
+                    weekly_hours=None):
+    """Apply the export user filters to a query already joined with User."""
     if centro:
         query = query.filter(User.centro == centro)
+    if user_id:
+        query = query.filter(User.id == user_id)
     if categoria:
         query = query.filter(User.categoria == categoria)
     if weekly_hours is not None:
         query = query.filter(User.weekly_hours.isnot(None))
         query = query.filter(db.cast(User.weekly_hours, db.Integer) == weekly_hours)
+    return query
 
-    return query.all()
 
+def _supports_full_outer_join():
+    return db.engine.dialect.name == "postgresql"
 
-def _status_notes_map(statuses):
-    """Return {(user_id, date): notes} for the provided EmployeeStatus rows."""
-    return {
-        (status.user_id, status.date): status.notes
-        for status in statuses
-    }
 
+def _export_rows_query(start_date, end_date, **filters):
+    """
+    Single query with the export rows already merged and ordered by
+    (user_id, date, check_in), entries without check-in first.
 
-def _status_times_map(statuses):
-    """Return {(user_id, date): (entry_time, exit_time)} for the provided EmployeeStatus rows."""
-    return {
-        (status.user_id, status.date): (status.entry_time, status.exit_time)
-        for status in statuses
-    }
+    Every time record comes with the status of its day (employee_status is
+    unique per user and day) and status days without records come as one row
+    whose record columns are NULL. PostgreSQL does it with a FULL OUTER JOIN;
+    elsewhere it is the LEFT JOIN plus the status-only days (UNION ALL).
+    """
+    records = _filter_by_user(
+        db.session.query(
+            TimeRecord.id.label("record_id"), TimeRecord.user_id, TimeRecord.date,
+            TimeRecord.check_in, TimeRecord.check_out, TimeRecord.notes,
+            TimeRecord.modified_by, TimeRecord.updated_at,
+        )
+        .join(User, TimeRecord.user_id == User.id)
+        .filter(TimeRecord.date >= start_date, TimeRecord.date <= end_date),
+        **filters,
+    ).subquery("records")
+    statuses = _filter_by_user(
+        db.session.query(
+            EmployeeStatus.user_id, EmployeeStatus.date, EmployeeStatus.notes,
+            EmployeeStatus.entry_time, EmployeeStatus.exit_time,
+            EmployeeStatus.created_at, EmployeeStatus.updated_at,
+        )
+        .join(User, EmployeeStatus.user_id == User.id)
+        .filter(EmployeeStatus.date >= start_date, EmployeeStatus.date <= end_date),
+        **filters,
+    ).subquery("statuses")
+
+    same_day = and_(statuses.c.user_id == records.c.user_id, statuses.c.date == records.c.date)
+    record_columns = [
+        records.c.record_id, records.c.check_in, records.c.check_out, records.c.notes,
+        records.c.modified_by, records.c.updated_at,
+    ]
+    status_columns = [
+        statuses.c.user_id.label("status_user_id"), statuses.c.notes.label("status_notes"),
+        statuses.c.entry_time, statuses.c.exit_time,
+        statuses.c.created_at.label("status_created_at"),
+        statuses.c.updated_at.label("status_updated_at"),
+    ]
+    if _supports_full_outer_join():
+        merged = select(
+            func.coalesce(records.c.user_id, statuses.c.user_id).label("user_id"),
+            func.coalesce(records.c.date, statuses.c.date).label("date"),
+            *record_columns, *status_columns,
+        ).select_from(records.join(statuses, same_day, full=True))
+    else:
+        with_records = select(
+            records.c.user_id, records.c.date, *record_columns, *status_columns,
+        ).select_from(records.outerjoin(statuses, same_day))
+        status_only = select(
+            statuses.c.user_id, statuses.c.date,
+            *(null().label(column.name) for column in record_columns),
+            *status_columns,
+        ).where(~exists().where(
+            TimeRecord.user_id == statuses.c.user_id, TimeRecord.date == statuses.c.date
+        ))
+        merged = union_all(with_records, status_only)
+
+    merged = merged.subquery("merged")
+    return db.session.query(merged).order_by(
+        merged.c.user_id,
+        merged.c.date,
+        merged.c.check_in.asc().nulls_first(),
+        merged.c.record_id,
+    )
 
 
-def _combine_records_with_statuses(records, statuses):
-    """Append placeholder records for statuses without time records."""
-    combined = list(records)
-    existing_keys = {
-        (record.user_id, record.date)
-        for record in records
-    }
+def _iter_export_rows(start_date, end_date, **filters):
+    """
+    Stream the (record, status) pairs of the exports from _export_rows_query:
+    status is None for days without one and status-only days get a
+    placeholder record. Rows are fetched in batches, so memory does not grow
+    with the range.
+    """
+    for (user_id, day, record_id, check_in, check_out, notes, modified_by, updated_at,
+         status_user_id, status_notes, entry_time, exit_time, status_created_at,
+         status_updated_at) in _export_rows_query(start_date, end_date, **filters).yield_per(EXPORT_BATCH_SIZE):
+        status = None
+        if status_user_id is not None:
+            status = _ExportStatus(
+                user_id, day, status_notes, entry_time, exit_time, status_created_at, status_updated_at
+            )
+        if record_id is None:
+            yield _status_placeholder(status), status
+        else:
+            yield _ExportRecord(user_id, day, check_in, check_out, notes, modified_by, updated_at), status
+
+
+def _status_placeholder(status):
+    """Placeholder record for a status day without time records."""
+    return _ExportRecord(
+        user_id=status.user_id,
+        date=status.date,
+        check_in=None,
+        check_out=None,
+        notes=None,
+        modified_by=None,
+        updated_at=(
+            status.updated_at
+            or status.created_at
+            or datetime.combine(status.date, datetime.min.time())
+        ),
+    )
 
-    for status in statuses:
-        key = (status.user_id, status.date)
-        if key in existing_keys:
-            continue
-
-        combined.append(
-            SimpleNamespace(
-                user_id=status.user_id,
-                date=status.date,
-                check_in=None,
-                check_out=None,
-                notes=None,
-                modified_by=None,
-                updated_at=(
-                    status.updated_at
-                    or status.created_at
-                    or datetime.combine(status.date, datetime.min.time())
-                ),
+
+def _export_users_map(start_date, end_date, **filters):
+    """
+    Return {user_id: User} for every user an export can reference: the users
+    matching the filters plus whoever last modified one of their records.
+    """
+    scoped = _filter_by_user(db.session.query(User.id), **filters)
+    editors = _filter_by_user(
+        db.session.query(TimeRecord.modified_by)
+        .join(User, TimeRecord.user_id == User.id)
+        .filter(
+            TimeRecord.date >= start_date,
+            TimeRecord.date <= end_date,
+            TimeRecord.modified_by.isnot(None),
+        ),
+        **filters,
+    )
+    users = User.query.filter(
+        or_(User.id.in_(scoped.scalar_subquery()), User.id.in_(editors.scalar_subquery()))
+    ).all()
+    return {user.id: user for user in users}
+
+
+def _week_summary(worked_seconds, weekly_hours):
+    contract_hours = weekly_hours or 0
+    worked_hours = (worked_seconds or 0) / 3600
+    return _WeekSummary(worked_seconds or 0, worked_hours, contract_hours, contract_hours - worked_hours)
+
+
+def _week_summaries(start_date, end_date, **filters):
+    """
+    Return {(user_id, week_start): _WeekSummary} for the employee weeks of the
+    range with completed records, aggregated by the database in one query:
+    weeks lying entirely inside the range come from weekly_user_totals and the
+    partial edge weeks are grouped from time_record (only their days inside
+    the range count).
+    """
+    week_col = week_start_of(TimeRecord.date)
+    partial = (
+        db.session.query(
+            TimeRecord.user_id,
+            week_col.label("week_start"),
+            func.sum(seconds_between(TimeRecord.check_in, TimeRecord.check_out)).label("worked_seconds"),
+            User.weekly_hours,
+        )
+        .join(User, TimeRecord.user_id == User.id)
+        .filter(
+            TimeRecord.date >= start_date,
+            TimeRecord.date <= end_date,
+            TimeRecord.check_in.isnot(None),
+            TimeRecord.check_out.isnot(None),
+        )
+    )
+    first_week = start_date + timedelta(days=(7 - start_date.weekday()) % 7)
+    last_sunday = end_date - timedelta(days=(end_date.weekday() + 1) % 7)
+    last_week = last_sunday - timedelta(days=6)
+    full = None
+    if first_week <= last_week:
+        partial = partial.filter(or_(TimeRecord.date < first_week, TimeRecord.date > last_sunday))
+        full = _filter_by_user(
+            db.session.query(
+                WeeklyUserTotal.user_id, WeeklyUserTotal.week_start,
+                WeeklyUserTotal.worked_seconds, User.weekly_hours,
             )
+            .join(User, WeeklyUserTotal.user_id == User.id)
+            .filter(WeeklyUserTotal.week_start >= first_week, WeeklyUserTotal.week_start <= last_week),
+            **filters,
         )
+    query = _filter_by_user(partial, **filters).group_by(TimeRecord.user_id, week_col, User.weekly_hours)
+    if full is not None:
+        query = query.union_all(full)
+    return {
+        (user_id, week): _week_summary(seconds, weekly_hours)
+        for user_id, week, seconds, weekly_hours in query
+    }
 
-    combined.sort(
-        key=lambda record: (
-            record.user_id,
-            record.date,
-            record.check_in or datetime.min
-        )
+
+def _export_workbook(title, header, header_fill=True):
+    """
+    Write-only workbook (rows go straight to disk) with shared named styles,
+    so cells reference one style instead of carrying their own objects.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    header_style = NamedStyle(name="tt_header", font=Font(bold=True), alignment=Alignment(horizontal='center'))
+    if header_fill:
+        header_style.fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
+    wb.add_named_style(header_style)
+    total_fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
+    wb.add_named_style(NamedStyle(
+        name="tt_total", font=Font(bold=True), alignment=Alignment(horizontal='center'), fill=total_fill
+    ))
+    wb.add_named_style(NamedStyle(
+        name="tt_total_plain", alignment=Alignment(horizontal='center'), fill=total_fill
+    ))
+    wb.add_named_style(NamedStyle(name="tt_center", alignment=Alignment(horizontal='center')))
+
+    ws = wb.create_sheet(title)
+    # En modo write_only los anchos deben fijarse antes de la primera fila
+    for col_num in range(1, len(header) + 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = 17
+    ws.append([_styled_cell(ws, value, "tt_header") for value in header])
+    return wb, ws
+
+
+def _styled_cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def _send_workbook(wb, filename):
+    """
+    Save the workbook into a spooled temporary file (memory first, disk when
+    large) and send it; the file is closed, and so removed, with the response.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    wb.save(spool)
+    spool.seek(0)
+    return send_file(
+        spool,
+        as_attachment=True,
+        download_name=filename,
+        mimetype=XLSX_MIMETYPE
     )
-    return combined
+
+
+def _format_hours(record):
+    if record.check_in and record.check_out:
+        return f"{(record.check_out - record.check_in).total_seconds() / 3600:.2f}"
+    return ""
+
+
+def _format_updated_at(record):
+    return record.updated_at.strftime("%d/%m/%Y %H:%M:%S") if record.updated_at else "-"
+
+
+def _daily_rows(fecha):
+    """(record, status) pairs of one day, from the same query as the range exports."""
+    return list(_iter_export_rows(fecha, fecha))
 
 
 def _users_map(user_ids):
@@ -143,33 +397,12 @@ def export_excel():
         print('start_date:', request.form.get('start_date'))
         print('end_date:', request.form.get('end_date'))
 
-        # Inicializar filtros
-        centro = user_id = categoria = weekly_hours = None
-
-        # Usar los campos correctos según el botón realmente pulsado
-        if boton_pulsado == "excel_centro_usuario":
-            centro = request.form.get("centro1")
-            user_id = request.form.get("usuario1")
-        elif boton_pulsado == "excel_centro_categoria":
-            centro = request.form.get("centro2")
-            categoria = request.form.get("categoria2")
-        elif boton_pulsado == "excel_centro_horas":
-            centro = request.form.get("centro3")
-            weekly_hours = request.form.get("horas3")
-        elif boton_pulsado == "excel_solo_centro":
-            centro = request.form.get("centro4")
-        elif boton_pulsado == "excel_solo_usuario":
-            user_id = request.form.get("usuario4")
-        elif boton_pulsado == "excel_solo_categoria":
-            categoria = request.form.get("categoria4")
-        elif boton_pulsado == "excel_solo_horas":
-            weekly_hours = request.form.get("horas4")
-        else:
-            # Compatibilidad con los filtros antiguos
-            centro = request.form.get("centro")
-            user_id = request.form.get("user_id")
-            categoria = request.form.get("categoria")
-            weekly_hours = request.form.get("weekly_hours") or request.form.get("jornada")
+        # Campos del botón realmente pulsado (o los nombres antiguos sin botón)
+        try:
+            filters = _request_filters(request.form)
+        except ValueError:
+            flash("La jornada debe ser numérica.", "danger")
+            return redirect(url_for("export.export_excel"))
 
         start_date = request.form.get("start_date")
         end_date = request.form.get("end_date")
@@ -192,132 +425,54 @@ def export_excel():
             return redirect(url_for("export.export_excel"))
 
         print('Valores usados para filtrar:')
-        print('centro:', centro)
-        print('user_id:', user_id)
-        print('categoria:', categoria)
-        print('weekly_hours:', weekly_hours)
+        for key, value in filters.items():
+            print(f'{key}:', value)
         print('--------------------------')
 
-        weekly_hours_value = None
-        if weekly_hours:
-            try:
-                weekly_hours_value = int(weekly_hours)
-            except ValueError:
-                flash("La jornada debe ser numérica.", "danger")
-                return redirect(url_for("export.export_excel"))
-
-        # JOIN explícito para evitar AmbiguousForeignKeysError
-        query = TimeRecord.query.join(User, TimeRecord.user_id == User.id).filter(
-            TimeRecord.date >= start_date,
-            TimeRecord.date <= end_date
-        )
-
-        # El filtro de centro debe aplicarse siempre que se seleccione (antes que cualquier otro)
-        if centro:
-            query = query.filter(User.centro == centro)
-        # El filtro de usuario solo si se selecciona uno concreto
-        if user_id:
-            query = query.filter(TimeRecord.user_id == user_id)
-        # El filtro de categoría solo si se selecciona una concreta
-        if categoria:
-            query = query.filter(User.categoria == categoria)
-        # El filtro de horas solo si se selecciona una concreta
-        if weekly_hours_value is not None:
-            query = query.filter(User.weekly_hours.isnot(None))
-            query = query.filter(db.cast(User.weekly_hours, db.Integer) == weekly_hours_value)
-
-        records = query.order_by(TimeRecord.user_id, TimeRecord.date).all()
-        statuses = _fetch_statuses(
-            start_date,
-            end_date,
-            centro=centro,
-            user_id=user_id,
-            categoria=categoria,
-            weekly_hours=weekly_hours_value,
-        )
-        status_notes = _status_notes_map(statuses)
-        status_times = _status_times_map(statuses)
-        records = _combine_records_with_statuses(records, statuses)
-        if not records:
+        rows = _iter_export_rows(start_date, end_date, **filters)
+        first = next(rows, None)
+        if first is None:
             flash("No hay registros para el período y filtros seleccionados.", "warning")
             return redirect(url_for("export.export_excel"))
+        rows = chain([first], rows)
 
-        users_cache = _users_map(
-            {
-                record.user_id
-                for record in records
-            }
-            | {
-                getattr(record, "modified_by", None)
-                for record in records
-                if getattr(record, "modified_by", None)
-            }
-        )
+        users_cache = _export_users_map(start_date, end_date, **filters)
 
         # ========== GENERAR EXCEL ORIGINAL (sin funcionalidades avanzadas) ==========
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Registros de Fichaje"
-
         header = [
             "Usuario", "Nombre completo", "Categoría", "Centro",
             "Fecha", "Entrada", "Salida", "Entrada Admin", "Salida Admin",
             "Horas Trabajadas", "Notas", "Notas Admin", "Modificado Por",
             "Última Actualización"
         ]
-        for col_num, header_text in enumerate(header, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header_text
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-            cell.fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-
-        row_num = 2
-        for record in records:
+        wb, ws = _export_workbook("Registros de Fichaje", header)
+
+        for record, status in rows:
             user = users_cache.get(record.user_id)
             modified_by = (
                 users_cache.get(record.modified_by)
                 if record.modified_by else None
             )
-
-            # Calcular horas
-            hours_worked = ""
-            if record.check_in and record.check_out:
-                time_diff = record.check_out - record.check_in
-                hours = time_diff.total_seconds() / 3600
-                hours_worked = f"{hours:.2f}"
-
-            admin_entry, admin_exit = status_times.get(
-                (record.user_id, record.date),
-                (None, None),
-            )
-
-            ws.cell(row=row_num, column=1).value = user.username if user else f"ID: {record.user_id}"
-            ws.cell(row=row_num, column=2).value = user.full_name if user else "-"
-            ws.cell(row=row_num, column=3).value = user.categoria if user and user.categoria else "-"
-            ws.cell(row=row_num, column=4).value = user.centro if user and user.centro else "-"
-            ws.cell(row=row_num, column=5).value = record.date.strftime("%d/%m/%Y")
-            ws.cell(row=row_num, column=6).value = record.check_in.strftime("%H:%M:%S") if record.check_in else "-"
-            ws.cell(row=row_num, column=7).value = record.check_out.strftime("%H:%M:%S") if record.check_out else "-"
-            ws.cell(row=row_num, column=8).value = admin_entry.strftime("%H:%M") if admin_entry else "-"
-            ws.cell(row=row_num, column=9).value = admin_exit.strftime("%H:%M") if admin_exit else "-"
-            ws.cell(row=row_num, column=10).value = hours_worked
-            ws.cell(row=row_num, column=11).value = record.notes or ""
-            ws.cell(row=row_num, column=12).value = status_notes.get(
-                (record.user_id, record.date), ""
-            ) or ""
-            ws.cell(row=row_num, column=13).value = modified_by.username if modified_by else "-"
-            ws.cell(row=row_num, column=14).value = record.updated_at.strftime("%d/%m/%Y %H:%M:%S")
-            row_num += 1
-
-        for col_num, _ in enumerate(header, 1):
-            col_letter = get_column_letter(col_num)
-            ws.column_dimensions[col_letter].width = 17
-
-        fd, temp_path = tempfile.mkstemp(suffix='.xlsx')
-        os.close(fd)
-        wb.save(temp_path)
+            admin_entry = status.entry_time if status else None
+            admin_exit = status.exit_time if status else None
+
+            ws.append([
+                user.username if user else f"ID: {record.user_id}",
+                user.full_name if user else "-",
+                user.categoria if user and user.categoria else "-",
+                user.centro if user and user.centro else "-",
+                record.date.strftime("%d/%m/%Y"),
+                record.check_in.strftime("%H:%M:%S") if record.check_in else "-",
+                record.check_out.strftime("%H:%M:%S") if record.check_out else "-",
+                admin_entry.strftime("%H:%M") if admin_entry else "-",
+                admin_exit.strftime("%H:%M") if admin_exit else "-",
+                _format_hours(record),
+                record.notes or "",
+                (status.notes if status else "") or "",
+                modified_by.username if modified_by else "-",
+                _format_updated_at(record),
+            ])
 
         # Generar nombre con rango de fechas
         months_es = {
@@ -327,23 +482,15 @@ def export_excel():
         start_formatted = f"{start_date.day} {months_es[start_date.month]}"
         end_formatted = f"{end_date.day} {months_es[end_date.month]}"
         filename = f"{start_formatted}_{end_formatted} MissSushi.xlsx"
-        return send_file(
-            temp_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return _send_workbook(wb, filename)
 
     # GET
     from routes.admin import get_admin_centro
     centro_admin = get_admin_centro()
-    q = User.query.filter_by(is_active=True)
-    if centro_admin:
-        q = q.filter(User.centro == centro_admin)
-    users = q.order_by(User.username).all()
-
-    # Calcular lista de horas únicas y ordenadas ascendentemente para el desplegable "horas4"
-    horas_sorted = sorted({u.weekly_hours for u in users if u.weekly_hours is not None})
+    options = filter_options(centro_admin)
+    users = options.active_users
+    # Lista de horas únicas y ordenadas ascendentemente para el desplegable "horas4"
+    horas_sorted = options.active_hours
 
     today = date.today().strftime('%Y-%m-%d')
     return render_template("export_excel.html", users=users, today=today, centro_admin=centro_admin, horas_sorted=horas_sorted)
@@ -355,32 +502,11 @@ def export_excel():
 def export_excel_monthly():
     if request.method == "POST":
         # Reutilizar la misma lógica de filtros que la función principal
-        botones = [k for k in request.form.keys() if k.startswith('excel_')]
-        boton_pulsado = botones[-1] if botones else None
-
-        centro = user_id = categoria = weekly_hours = None
-        if boton_pulsado == "excel_centro_usuario":
-            centro = request.form.get("centro1")
-            user_id = request.form.get("usuario1")
-        elif boton_pulsado == "excel_centro_categoria":
-            centro = request.form.get("centro2")
-            categoria = request.form.get("categoria2")
-        elif boton_pulsado == "excel_centro_horas":
-            centro = request.form.get("centro3")
-            weekly_hours = request.form.get("horas3")
-        elif boton_pulsado == "excel_solo_centro":
-            centro = request.form.get("centro4")
-        elif boton_pulsado == "excel_solo_usuario":
-            user_id = request.form.get("usuario4")
-        elif boton_pulsado == "excel_solo_categoria":
-            categoria = request.form.get("categoria4")
-        elif boton_pulsado == "excel_solo_horas":
-            weekly_hours = request.form.get("horas4")
-        else:
-            centro = request.form.get("centro")
-            user_id = request.form.get("user_id")
-            categoria = request.form.get("categoria")
-            weekly_hours = request.form.get("weekly_hours") or request.form.get("jornada")
+        try:
+            filters = _request_filters(request.form)
+        except ValueError:
+            flash("La jornada debe ser numérica.", "danger")
+            return redirect(url_for("export.export_excel_monthly"))
 
         start_date = request.form.get("start_date")
         end_date = request.form.get("end_date")
@@ -402,79 +528,18 @@ def export_excel_monthly():
             flash("Formato de fecha inválido. Use YYYY-MM-DD.", "danger")
             return redirect(url_for("export.export_excel_monthly"))
 
-        weekly_hours_value = None
-        if weekly_hours:
-            try:
-                weekly_hours_value = int(weekly_hours)
-            except ValueError:
-                flash("La jornada debe ser numérica.", "danger")
-                return redirect(url_for("export.export_excel_monthly"))
-
-        # JOIN explícito
-        query = TimeRecord.query.join(User, TimeRecord.user_id == User.id).filter(
-            TimeRecord.date >= start_date,
-            TimeRecord.date <= end_date
-        )
-
-        if centro:
-            query = query.filter(User.centro == centro)
-        if user_id:
-            query = query.filter(TimeRecord.user_id == user_id)
-        if categoria:
-            query = query.filter(User.categoria == categoria)
-        if weekly_hours_value is not None:
-            query = query.filter(User.weekly_hours.isnot(None))
-            query = query.filter(db.cast(User.weekly_hours, db.Integer) == weekly_hours_value)
-
-        records = query.order_by(TimeRecord.user_id, TimeRecord.date).all()
-
-        statuses = _fetch_statuses(
-            start_date,
-            end_date,
-            centro=centro,
-            user_id=user_id,
-            categoria=categoria,
-            weekly_hours=weekly_hours_value,
-        )
-        status_notes = _status_notes_map(statuses)
-        status_times = _status_times_map(statuses)
-        records = _combine_records_with_statuses(records, statuses)
-
-        if not records:
+        rows = _iter_export_rows(start_date, end_date, **filters)
+        first = next(rows, None)
+        if first is None:
             flash("No hay registros para el período y filtros seleccionados.", "warning")
             return redirect(url_for("export.export_excel_monthly"))
+        rows = chain([first], rows)
 
-        users_cache = _users_map(
-            {
-                record.user_id
-                for record in records
-            }
-            | {
-                getattr(record, "modified_by", None)
-                for record in records
-                if getattr(record, "modified_by", None)
-            }
-        )
+        users_cache = _export_users_map(start_date, end_date, **filters)
+        summaries = _week_summaries(start_date, end_date, **filters)
 
-        # Usar la misma lógica de sumas semanales que ya tenemos implementada
         def get_week_start(date_obj):
             return date_obj - timedelta(days=date_obj.weekday())
-        
-        weekly_data = defaultdict(lambda: defaultdict(list))
-        weekly_totals = defaultdict(lambda: defaultdict(float))
-        
-        for record in records:
-            week_start = get_week_start(record.date)
-            weekly_data[record.user_id][week_start].append(record)
-            
-            if record.check_in and record.check_out:
-                time_diff = record.check_out - record.check_in
-                hours = time_diff.total_seconds() / 3600
-                weekly_totals[record.user_id][week_start] += hours
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Registros Mensuales"
 
         header = [
             "Usuario", "Nombre completo", "Categoría", "Centro", "Horas Semanales",
@@ -482,196 +547,85 @@ def export_excel_monthly():
             "Horas Trabajadas", "Diferencia Horas",
             "Notas", "Notas Admin", "Modificado Por", "Última Actualización"
         ]
-        for col_num, header_text in enumerate(header, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header_text
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-            cell.fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-
-        row_num = 2
-        
-        for user_id in sorted(weekly_data.keys()):
+        wb, ws = _export_workbook("Registros Mensuales", header)
+
+        def total_cell(value):
+            return _styled_cell(ws, value, "tt_total")
+
+        def dash_cell():
+            return _styled_cell(ws, "-", "tt_total_plain")
+
+        def body_cell(value):
+            return _styled_cell(ws, value, "tt_center")
+
+        # Las filas llegan ordenadas por empleado y fecha: cada semana de cada
+        # empleado es un bloque contiguo. Los totales vienen ya calculados por
+        # la BD (_week_summaries), así que cada semana se escribe sin retenerla.
+        for (user_id, week_start), week_rows in groupby(
+            rows, key=lambda item: (item[0].user_id, get_week_start(item[0].date))
+        ):
             user = users_cache.get(user_id)
-            
-            for week_start in sorted(weekly_data[user_id].keys()):
-                week_end = week_start + timedelta(days=6)
-                total_hours = weekly_totals[user_id][week_start]
-                
-                # Fila de total semanal
-                cell = ws.cell(row=row_num, column=1)
-                cell.value = f"TOTAL SEMANA ({week_start.strftime('%d/%m')} - {week_end.strftime('%d/%m')})"
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-                cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                cell = ws.cell(row=row_num, column=2)
-                cell.value = user.full_name if user else "-"
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-                cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                # Columnas 3 y 4: "-"
-                for col in range(3, 5):
-                    cell = ws.cell(row=row_num, column=col)
-                    cell.value = "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                # Columna 5: Mostrar las horas semanales contractuales
-                cell = ws.cell(row=row_num, column=5)
-                cell.value = user.weekly_hours if user and user.weekly_hours else "-"
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-                cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                # Columnas 6 a 10: "-"
-                for col in range(6, 11):
-                    cell = ws.cell(row=row_num, column=col)
-                    cell.value = "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                cell = ws.cell(row=row_num, column=11)
-                cell.value = f"{total_hours:.2f}"
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-                cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                # Calcular diferencia
-                weekly_hours_contract = user.weekly_hours if user and user.weekly_hours else 0
-                difference = weekly_hours_contract - total_hours
-                cell = ws.cell(row=row_num, column=12)
-                cell.value = f"{difference:.2f}"
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-                cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                for col in range(13, 17):
-                    cell = ws.cell(row=row_num, column=col)
-                    cell.value = "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    cell.fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-                
-                row_num += 1
-                
-                # Registros individuales
-                for record in weekly_data[user_id][week_start]:
-                    modified_by = (
-                        users_cache.get(record.modified_by)
-                        if record.modified_by else None
-                    )
-                    hours_worked = ""
-                    if record.check_in and record.check_out:
-                        time_diff = record.check_out - record.check_in
-                        hours = time_diff.total_seconds() / 3600
-                        hours_worked = f"{hours:.2f}"
-                    admin_note = status_notes.get((record.user_id, record.date), "") or ""
-                    admin_entry, admin_exit = status_times.get(
-                        (record.user_id, record.date),
-                        (None, None),
-                    )
-
-                    cell = ws.cell(row=row_num, column=1)
-                    cell.value = user.username if user else f"ID: {record.user_id}"
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=2)
-                    cell.value = user.full_name if user else "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=3)
-                    cell.value = user.categoria if user and user.categoria else "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=4)
-                    cell.value = user.centro if user and user.centro else "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=5)
-                    cell.value = user.weekly_hours if user and user.weekly_hours else "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=6)
-                    cell.value = record.date.strftime("%d/%m/%Y")
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=7)
-                    cell.value = record.check_in.strftime("%H:%M:%S") if record.check_in else "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=8)
-                    cell.value = record.check_out.strftime("%H:%M:%S") if record.check_out else "-"
-                    cell.alignment = Alignment(horizontal='center')
-                    
-                    cell = ws.cell(row=row_num, column=9)
-                    cell.value = admin_entry.strftime("%H:%M") if admin_entry else "-"
-                    cell.alignment = Alignment(horizontal='center')
-
-                    cell = ws.cell(row=row_num, column=10)
-                    cell.value = admin_exit.strftime("%H:%M") if admin_exit else "-"
-                    cell.alignment = Alignment(horizontal='center')
-
-                    cell = ws.cell(row=row_num, column=11)
-                    cell.value = hours_worked
-                    cell.alignment = Alignment(horizontal='center')
-
-                    cell = ws.cell(row=row_num, column=12)
-                    cell.value = "-"
-                    cell.alignment = Alignment(horizontal='center')
-
-                    cell = ws.cell(row=row_num, column=13)
-                    cell.value = record.notes or ""
-                    cell.alignment = Alignment(horizontal='center')
-
-                    cell = ws.cell(row=row_num, column=14)
-                    cell.value = admin_note
-                    cell.alignment = Alignment(horizontal='center')
-
-                    cell = ws.cell(row=row_num, column=15)
-                    cell.value = modified_by.username if modified_by else "-"
-                    cell.alignment = Alignment(horizontal='center')
-
-                    cell = ws.cell(row=row_num, column=16)
-                    cell.value = record.updated_at.strftime("%d/%m/%Y %H:%M:%S")
-                    cell.alignment = Alignment(horizontal='center')
-                    row_num += 1
-                
-                row_num += 1
-
-        for col_num, _ in enumerate(header, 1):
-            col_letter = get_column_letter(col_num)
-            ws.column_dimensions[col_letter].width = 17
-
-        fd, temp_path = tempfile.mkstemp(suffix='.xlsx')
-        os.close(fd)
-        wb.save(temp_path)
+            week_end = week_start + timedelta(days=6)
+            summary = summaries.get((user_id, week_start)) or _week_summary(0, user.weekly_hours if user else 0)
+
+            # Fila de total semanal
+            ws.append(
+                [
+                    total_cell(f"TOTAL SEMANA ({week_start.strftime('%d/%m')} - {week_end.strftime('%d/%m')})"),
+                    total_cell(user.full_name if user else "-"),
+                ]
+                + [dash_cell() for _ in range(3, 5)]
+                # Columna 5: horas semanales contractuales
+                + [total_cell(user.weekly_hours if user and user.weekly_hours else "-")]
+                + [dash_cell() for _ in range(6, 11)]
+                + [total_cell(f"{summary.worked_hours:.2f}"), total_cell(f"{summary.difference:.2f}")]
+                + [dash_cell() for _ in range(13, 17)]
+            )
+
+            # Registros individuales
+            for record, status in week_rows:
+                modified_by = (
+                    users_cache.get(record.modified_by)
+                    if record.modified_by else None
+                )
+                admin_entry = status.entry_time if status else None
+                admin_exit = status.exit_time if status else None
+                ws.append([body_cell(value) for value in (
+                    user.username if user else f"ID: {record.user_id}",
+                    user.full_name if user else "-",
+                    user.categoria if user and user.categoria else "-",
+                    user.centro if user and user.centro else "-",
+                    user.weekly_hours if user and user.weekly_hours else "-",
+                    record.date.strftime("%d/%m/%Y"),
+                    record.check_in.strftime("%H:%M:%S") if record.check_in else "-",
+                    record.check_out.strftime("%H:%M:%S") if record.check_out else "-",
+                    admin_entry.strftime("%H:%M") if admin_entry else "-",
+                    admin_exit.strftime("%H:%M") if admin_exit else "-",
+                    _format_hours(record),
+                    "-",
+                    record.notes or "",
+                    (status.notes if status else "") or "",
+                    modified_by.username if modified_by else "-",
+                    _format_updated_at(record),
+                )])
+
+            ws.append([])
 
         # Generar nombre con fecha actual para Excel mensual
-        from datetime import date as dt_date
-        today = dt_date.today()
+        today = date.today()
         months_es = {
             1: 'ene', 2: 'feb', 3: 'mar', 4: 'abr', 5: 'may', 6: 'jun',
             7: 'jul', 8: 'ago', 9: 'sept', 10: 'oct', 11: 'nov', 12: 'dic'
         }
         day_month = f"{today.day} - {months_es[today.month]}"
         filename = f"Mensual ({day_month}) MissSushi.xlsx"
-        
-        return send_file(
-            temp_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return _send_workbook(wb, filename)
 
     # GET - usar el mismo template
     from routes.admin import get_admin_centro
     centro_admin = get_admin_centro()
-    q = User.query.filter_by(is_active=True)
-    if centro_admin:
-        q = q.filter(User.centro == centro_admin)
-    users = q.order_by(User.username).all()
-    horas_sorted = sorted({u.weekly_hours for u in users if u.weekly_hours is not None})
+    options = filter_options(centro_admin)
+    users, horas_sorted = options.active_users, options.active_hours
     today = date.today().strftime('%Y-%m-%d')
     return render_template("export_excel.html", users=users, today=today, centro_admin=centro_admin, horas_sorted=horas_sorted)
 
@@ -687,25 +641,14 @@ def export_excel_daily():
         flash("Formato de fecha inválido.", "danger")
         return redirect(url_for("export.export_excel"))
 
-    records = TimeRecord.query.filter(TimeRecord.date == fecha).order_by(TimeRecord.user_id).all()
-    statuses = _fetch_statuses(fecha, fecha)
-    status_notes = _status_notes_map(statuses)
-    status_times = _status_times_map(statuses)
-    records = _combine_records_with_statuses(records, statuses)
-    if not records:
+    rows = _daily_rows(fecha)
+    if not rows:
         flash("No hay registros para ese día.", "warning")
         return redirect(url_for("export.export_excel"))
 
     users_cache = _users_map(
-        {
-            record.user_id
-            for record in records
-        }
-        | {
-            getattr(record, "modified_by", None)
-            for record in records
-            if getattr(record, "modified_by", None)
-        }
+        {record.user_id for record, _ in rows}
+        | {record.modified_by for record, _ in rows if record.modified_by}
     )
 
     wb = openpyxl.Workbook()
@@ -723,7 +666,7 @@ def export_excel_daily():
         cell.alignment = Alignment(horizontal='center')
 
     row_num = 2
-    for record in records:
+    for record, status in rows:
         user = users_cache.get(record.user_id)
         hours_worked = ""
         if record.check_in and record.check_out:
@@ -731,10 +674,7 @@ def export_excel_daily():
             hours = time_diff.total_seconds() / 3600
             hours_worked = f"{hours:.2f}"
 
-        admin_entry, admin_exit = status_times.get(
-            (record.user_id, record.date),
-            (None, None),
-        )
+        admin_entry, admin_exit = (status.entry_time, status.exit_time) if status else (None, None)
 
         ws.cell(row=row_num, column=1).value = user.username if user else f"ID: {record.user_id}"
         ws.cell(row=row_num, column=2).value = user.full_name if user else "-"
@@ -747,9 +687,7 @@ def export_excel_daily():
         ws.cell(row=row_num, column=9).value = admin_exit.strftime("%H:%M") if admin_exit else "-"
         ws.cell(row=row_num, column=10).value = hours_worked
         ws.cell(row=row_num, column=11).value = record.notes or ""
-        ws.cell(row=row_num, column=12).value = status_notes.get(
-            (record.user_id, record.date), ""
-        ) or ""
+        ws.cell(row=row_num, column=12).value = (status.notes if status else "") or ""
         row_num += 1
 
     for col_num, _ in enumerate(header, 1):
@@ -782,25 +720,14 @@ def export_pdf_daily():
         flash("Formato de fecha inválido.", "danger")
         return redirect(url_for("export.export_excel"))
 
-    records = TimeRecord.query.filter(TimeRecord.date == fecha).order_by(TimeRecord.user_id).all()
-    statuses = _fetch_statuses(fecha, fecha)
-    status_notes = _status_notes_map(statuses)
-    status_times = _status_times_map(statuses)
-    records = _combine_records_with_statuses(records, statuses)
-    if not records:
+    rows = _daily_rows(fecha)
+    if not rows:
         flash("No hay registros para ese día.", "warning")
         return redirect(url_for("export.export_excel"))
 
     users_cache = _users_map(
-        {
-            record.user_id
-            for record in records
-        }
-        | {
-            getattr(record, "modified_by", None)
-            for record in records
-            if getattr(record, "modified_by", None)
-        }
+        {record.user_id for record, _ in rows}
+        | {record.modified_by for record, _ in rows if record.modified_by}
     )
 
     pdf = FPDF(orientation="L", unit="mm", format="A4")
@@ -821,7 +748,7 @@ def export_pdf_daily():
     pdf.ln()
 
     pdf.set_font("Arial", "", 9)
-    for record in records:
+    for record, status in rows:
         user = users_cache.get(record.user_id)
         hours_worked = ""
         if record.check_in and record.check_out:
@@ -829,10 +756,7 @@ def export_pdf_daily():
             hours = time_diff.total_seconds() / 3600
             hours_worked = f"{hours:.2f}"
 
-        admin_entry, admin_exit = status_times.get(
-            (record.user_id, record.date),
-            (None, None),
-        )
+        admin_entry, admin_exit = (status.entry_time, status.exit_time) if status else (None, None)
 
         row = [
             user.username if user else f"ID: {record.user_id}",
@@ -845,20 +769,179 @@ def export_pdf_daily():
             admin_exit.strftime("%H:%M") if admin_exit else "-",
             hours_worked,
             record.notes or "",
-            status_notes.get((record.user_id, record.date), "") or ""
+            (status.notes if status else "") or ""
         ]
         for i, item in enumerate(row):
             pdf.cell(col_widths[i], 8, str(item), border=1, align="C")
         pdf.ln()
 
-    fd, temp_path = tempfile.mkstemp(suffix='.pdf')
-    os.close(fd)
-    pdf.output(temp_path)
-
     filename = f"registros_{fecha.strftime('%d%m%Y')}.pdf"
+    return _send_pdf(pdf.output(dest="S").encode("latin-1"), filename)
+
+
+def _send_pdf(content, filename):
     return send_file(
-        temp_path,
+        BytesIO(content),
         as_attachment=True,
         download_name=filename,
         mimetype='application/pdf'
     )
+
+# ========== PDF SEMANAL / MENSUAL ==========
+
+def _pdf_report_builder(start_date, end_date, **filters):
+    """Función que genera el PDF del rango con esos filtros y devuelve sus bytes, o None sin filas."""
+    def build():
+        rows = _iter_export_rows(start_date, end_date, **filters)
+        first = next(rows, None)
+        if first is None:
+            return None
+        summaries = _week_summaries(start_date, end_date, **filters)
+        return render_records_report(
+            f"Registros de fichaje - {filters.get('centro') or 'Todos los centros'}",
+            f"Del {start_date.strftime('%d/%m/%Y')} al {end_date.strftime('%d/%m/%Y')}",
+            chain([first], rows),
+            _export_users_map(start_date, end_date, **filters),
+            {key: summary.worked_seconds for key, summary in summaries.items()},
+        )
+    return build
+
+
+def _report_centros(start_date, end_date, **filters):
+    """Centros con algún fichaje en el rango (y los filtros), para el zip de un PDF por centro."""
+    return [
+        centro for (centro,) in
+        _filter_by_user(
+            db.session.query(User.centro)
+            .join(TimeRecord, TimeRecord.user_id == User.id)
+            .filter(
+                TimeRecord.date >= start_date,
+                TimeRecord.date <= end_date,
+                User.centro.isnot(None),
+            ),
+            **filters,
+        )
+        .distinct()
+        .order_by(User.centro)
+    ]
+
+
+@export_bp.route("/pdf_report", methods=["GET", "POST"])
+@admin_required
+def export_pdf_report():
+    """
+    PDF de fichajes de varios días con subtotales semanales por empleado.
+    Filtra como el Excel (_request_filters: desde el formulario de exportación,
+    la fila de filtros avanzados). Con ``por_centro`` (y sin centro fijado)
+    devuelve un zip con un PDF por centro.
+    """
+    from routes.admin import get_admin_centro
+
+    params = request.values
+    try:
+        start_date = datetime.strptime(params.get("start_date", ""), "%Y-%m-%d").date()
+        end_date = datetime.strptime(params.get("end_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        flash("Indica las fechas de inicio y fin del informe (YYYY-MM-DD).", "danger")
+        return redirect(url_for("export.export_excel"))
+    if end_date < start_date:
+        flash("La fecha de fin no puede ser anterior a la fecha de inicio.", "danger")
+        return redirect(url_for("export.export_excel"))
+    if (end_date - start_date).days + 1 > PDF_REPORT_MAX_DAYS:
+        flash(f"El informe PDF admite como máximo {PDF_REPORT_MAX_DAYS} días.", "danger")
+        return redirect(url_for("export.export_excel"))
+
+    try:
+        filters = _request_filters(params)
+    except ValueError:
+        flash("La jornada debe ser numérica.", "danger")
+        return redirect(url_for("export.export_excel"))
+    centro = filters["centro"] = get_admin_centro() or filters["centro"]
+    period = f"{start_date.strftime('%d%m%Y')}-{end_date.strftime('%d%m%Y')}"
+
+    if params.get("por_centro") and centro is None:
+        others = {key: value for key, value in filters.items() if key != "centro"}
+        centros = _report_centros(start_date, end_date, **others)
+        if not centros:
+            flash("No hay registros para el período seleccionado.", "warning")
+            return redirect(url_for("export.export_excel"))
+        bundle = bundle_reports(current_app._get_current_object(), [
+            (f"registros_{c}_{period}.pdf", _pdf_report_builder(start_date, end_date, centro=c, **others))
+            for c in centros
+        ])
+        return send_file(
+            bundle,
+            as_attachment=True,
+            download_name=f"registros_por_centro_{period}.zip",
+            mimetype='application/zip'
+        )
+
+    content = _pdf_report_builder(start_date, end_date, **filters)()
+    if content is None:
+        flash("No hay registros para el período y filtros seleccionados.", "warning")
+        return redirect(url_for("export.export_excel"))
+    return _send_pdf(content, f"registros_{centro or 'todos'}_{period}.pdf")
+
+
+# ========== VOLCADO MASIVO (CSV / CSV.GZ / PARQUET) ==========
+
+@export_bp.route("/export/csv", methods=["GET", "POST"])
+@admin_required
+def export_bulk_csv():
+    """
+    Volcado de fichajes con valores en crudo para cargar en otras herramientas.
+    Acepta los mismos filtros que el Excel (_request_filters: los de la fila de
+    filtros avanzados del formulario, o centro, user_id, categoria y
+    weekly_hours) y ``format`` = csv (por defecto), csv.gz o parquet. CSV y
+    CSV.gz se envían en flujo según se leen las filas de la BD.
+    """
+    from routes.admin import get_admin_centro
+
+    params = request.values
+    try:
+        start_date = datetime.strptime(params.get("start_date", ""), "%Y-%m-%d").date()
+        end_date = datetime.strptime(params.get("end_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        flash("Indica las fechas de inicio y fin del volcado (YYYY-MM-DD).", "danger")
+        return redirect(url_for("export.export_excel"))
+    if end_date < start_date:
+        flash("La fecha de fin no puede ser anterior a la fecha de inicio.", "danger")
+        return redirect(url_for("export.export_excel"))
+
+    fmt = params.get("format") or "csv"
+    if fmt not in BULK_FORMATS:
+        flash(f"Formato no soportado: {fmt}.", "danger")
+        return redirect(url_for("export.export_excel"))
+    if fmt == "parquet" and not parquet_available():
+        flash("La exportación Parquet no está disponible en este servidor (falta pyarrow).", "danger")
+        return redirect(url_for("export.export_excel"))
+
+    try:
+        filters = _request_filters(params)
+    except ValueError:
+        flash("La jornada debe ser numérica.", "danger")
+        return redirect(url_for("export.export_excel"))
+    filters["centro"] = get_admin_centro() or filters["centro"]
+    users = _export_users_map(start_date, end_date, **filters)
+    values = bulk_rows(_iter_export_rows(start_date, end_date, **filters), users)
+    filename = f"registros_{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}.{fmt}"
+
+    if fmt == "parquet":
+        return send_file(
+            write_parquet(values),
+            as_attachment=True,
+            download_name=filename,
+            mimetype='application/vnd.apache.parquet'
+        )
+
+    chunks = csv_chunks(values)
+    if fmt == "csv.gz":
+        chunks, mimetype = gzip_chunks(chunks), 'application/gzip'
+    else:
+        mimetype = 'text/csv; charset=utf-8'
+    # stream_with_context mantiene la sesión de BD abierta mientras se envía
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
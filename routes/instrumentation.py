@@ -0,0 +1,244 @@
+"""
+Instrumentación opcional de peticiones: nº de consultas SQL, tiempo en BD,
+latencia total y sentencias más lentas por endpoint.
+
+Se activa con la configuración INSTRUMENTATION_ENABLED (env TT_INSTRUMENTATION=1).
+Los contadores son por proceso y se publican en /internal/metrics en formato
+texto de Prometheus; además cada petición deja una línea JSON en el logger
+"timetracker.requests".
+"""
+
+import heapq
+import json
+import logging
+import sys
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+EXTENSION_KEY = "tt_instrumentation"
+SLOWEST_PER_ENDPOINT = 5
+STATEMENT_MAX_CHARS = 200
+
+request_logger = logging.getLogger("timetracker.requests")
+
+
+def _statement_label(statement):
+    return " ".join(statement.split())[:STATEMENT_MAX_CHARS]
+
+
+def _keep_slowest(heap, seconds, statement):
+    entry = (seconds, statement)
+    if len(heap) < SLOWEST_PER_ENDPOINT:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+class _RequestStats:
+    __slots__ = ("started", "queries", "db_seconds", "slowest")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest = []
+
+    def add(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        _keep_slowest(self.slowest, seconds, statement)
+
+
+class _EndpointStats:
+    __slots__ = ("responses", "latency_sum", "latency_max", "queries", "db_seconds", "slowest")
+
+    def __init__(self):
+        self.responses = {}  # (method, status) -> peticiones
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest = []
+
+
+class MetricsRegistry:
+    """Acumulados por endpoint desde que arrancó el proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def record(self, endpoint, method, status, latency, stats):
+        with self._lock:
+            ep = self._endpoints.setdefault(endpoint, _EndpointStats())
+            key = (method, status)
+            ep.responses[key] = ep.responses.get(key, 0) + 1
+            ep.latency_sum += latency
+            ep.latency_max = max(ep.latency_max, latency)
+            ep.queries += stats.queries
+            ep.db_seconds += stats.db_seconds
+            for seconds, statement in stats.slowest:
+                _keep_slowest(ep.slowest, seconds, statement)
+
+    def render_prometheus(self):
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+
+            def family(name, kind, help_text, samples):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+
+            family(
+                "timetracker_requests_total", "counter", "Peticiones atendidas por endpoint.",
+                [
+                    f"timetracker_requests_total{_labels(endpoint=e, method=m, status=s)} {n}"
+                    for e, ep in endpoints
+                    for (m, s), n in sorted(ep.responses.items())
+                ],
+            )
+            family(
+                "timetracker_request_duration_seconds", "summary", "Latencia total de la petición.",
+                [
+                    sample
+                    for e, ep in endpoints
+                    for sample in (
+                        f"timetracker_request_duration_seconds_sum{_labels(endpoint=e)} {ep.latency_sum:.6f}",
+                        f"timetracker_request_duration_seconds_count{_labels(endpoint=e)} {sum(ep.responses.values())}",
+                    )
+                ],
+            )
+            family(
+                "timetracker_request_duration_max_seconds", "gauge", "Petición más lenta por endpoint.",
+                [f"timetracker_request_duration_max_seconds{_labels(endpoint=e)} {ep.latency_max:.6f}"
+                 for e, ep in endpoints],
+            )
+            family(
+                "timetracker_db_queries_total", "counter", "Sentencias SQL ejecutadas.",
+                [f"timetracker_db_queries_total{_labels(endpoint=e)} {ep.queries}" for e, ep in endpoints],
+            )
+            family(
+                "timetracker_db_duration_seconds_total", "counter", "Tiempo acumulado en la base de datos.",
+                [f"timetracker_db_duration_seconds_total{_labels(endpoint=e)} {ep.db_seconds:.6f}"
+                 for e, ep in endpoints],
+            )
+            family(
+                "timetracker_db_slow_statement_seconds", "gauge", "Sentencias SQL más lentas por endpoint.",
+                [
+                    f"timetracker_db_slow_statement_seconds"
+                    f"{_labels(endpoint=e, rank=str(rank), statement=statement)} {seconds:.6f}"
+                    for e, ep in endpoints
+                    for rank, (seconds, statement) in enumerate(sorted(ep.slowest, reverse=True), 1)
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels):
+    def escape(value):
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+registry = MetricsRegistry()
+
+
+# Eventos del motor: se registran una sola vez sobre Engine y solo trabajan
+# dentro de una petición instrumentada (g._sql_stats).
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "_sql_stats" in g:
+        conn.info.setdefault("tt_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("tt_query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_request_context() and "_sql_stats" in g:
+        g._sql_stats.add(_statement_label(statement), elapsed)
+
+
+def _discard_failed_query(exception_context):
+    # after_cursor_execute no llega si la sentencia falla
+    conn = exception_context.connection
+    started = conn.info.get("tt_query_started") if conn is not None else None
+    if started:
+        started.pop()
+
+
+def _install_sql_listeners():
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _discard_failed_query)
+
+
+def _start_request():
+    g._sql_stats = _RequestStats()
+
+
+def _finish_request(response):
+    _record_request(response.status_code)
+    return response
+
+
+def _teardown_request(exception=None):
+    # Una excepción sin manejar (o un after_request que falla) se salta
+    # _finish_request: las estadísticas siguen en g y se cuentan como 500
+    if "_sql_stats" in g:
+        _record_request(500)
+
+
+def _record_request(status_code):
+    stats = g.pop("_sql_stats", None)
+    if stats is None:
+        return
+    latency = time.perf_counter() - stats.started
+    endpoint = request.endpoint or "unmatched"
+    registry.record(endpoint, request.method, str(status_code), latency, stats)
+
+    slowest = max(stats.slowest, default=None)
+    request_logger.info(json.dumps({
+        "event": "request",
+        "method": request.method,
+        "path": request.path,
+        "endpoint": endpoint,
+        "status": status_code,
+        "duration_ms": round(latency * 1000, 2),
+        "db_queries": stats.queries,
+        "db_ms": round(stats.db_seconds * 1000, 2),
+        "slowest_sql_ms": round(slowest[0] * 1000, 2) if slowest else None,
+        "slowest_sql": slowest[1] if slowest else None,
+    }, ensure_ascii=False))
+
+
+def init_instrumentation(app):
+    """Engancha los hooks si INSTRUMENTATION_ENABLED está activo; si no, no hace nada."""
+    if not app.config.get("INSTRUMENTATION_ENABLED"):
+        return None
+    _install_sql_listeners()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    app.extensions[EXTENSION_KEY] = registry
+
+    if not request_logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        request_logger.addHandler(handler)
+        request_logger.setLevel(logging.INFO)
+        request_logger.propagate = False
+    return registry
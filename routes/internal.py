@@ -1,6 +1,8 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
+import hmac
 import os
 
+from routes.instrumentation import EXTENSION_KEY
 from tasks.scheduler import auto_close_open_records
 
 
@@ -28,3 +30,28 @@ def internal_auto_close():
         current_app.logger.error(f"internal_auto_close error: {e}")
         return jsonify({"ok": False, "error": str(e)}), 500
 
+
+
+@internal_bp.route("/metrics", methods=["GET"])
+def internal_metrics():
+    """
+    Instrumentation counters in Prometheus text format (see routes/instrumentation.py).
+    Returns 404 unless INSTRUMENTATION_ENABLED is set.
+
+    Requires header X-METRICS-TOKEN (or "Authorization: Bearer <token>")
+    matching env METRICS_TOKEN.
+    """
+    registry = current_app.extensions.get(EXTENSION_KEY)
+    if registry is None:
+        return jsonify({"ok": False, "error": "instrumentation disabled"}), 404
+
+    expected = os.getenv("METRICS_TOKEN")
+    provided = request.headers.get("X-METRICS-TOKEN")
+    auth = request.headers.get("Authorization", "")
+    if not provided and auth.startswith("Bearer "):
+        provided = auth[len("Bearer "):]
+    if not expected or not provided or not hmac.compare_digest(provided, expected):
+        current_app.logger.warning("Unauthorized internal metrics attempt")
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    return Response(registry.render_prometheus(), mimetype="text/plain; version=0.0.4")
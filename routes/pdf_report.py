@@ -0,0 +1,191 @@
+"""
+Informes PDF de fichajes para varios días (semana, mes) con subtotales
+semanales por empleado, como los del Excel mensual.
+
+Las filas llegan ya ordenadas por empleado y fecha desde un cursor de servidor
+(ver _iter_export_rows en routes/export.py) y se van escribiendo sin retenerlas;
+cada página repite el título y la cabecera de columnas. bundle_reports genera
+un PDF por centro en hilos, cada uno con su propio contexto de aplicación (y
+por tanto su propia sesión y conexión), y los empaqueta en un zip que pasa a
+disco cuando crece.
+"""
+
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from itertools import groupby
+
+from fpdf import FPDF
+
+from models.database import db
+
+
+PDF_REPORT_MAX_WORKERS = 4
+# Tamaño a partir del cual el zip pasa a disco
+PDF_ZIP_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+ROW_HEIGHT = 6
+HEADER_ROW_HEIGHT = 7
+# (título, ancho en mm): suman 277 mm, el ancho útil de un A4 apaisado
+REPORT_COLUMNS = [
+    ("Fecha", 20), ("Usuario", 24), ("Nombre completo", 40), ("Categoría", 20),
+    ("Entrada", 18), ("Salida", 18), ("Entrada Admin", 20), ("Salida Admin", 20),
+    ("Horas", 16), ("Notas", 40), ("Notas Admin", 41),
+]
+SUBTOTAL_FILL = (230, 243, 255)
+HEADER_FILL = (221, 221, 221)
+
+
+def _latin1(value):
+    # Las fuentes estándar de fpdf 1.7 solo cubren latin-1
+    return str(value).encode("latin-1", "replace").decode("latin-1")
+
+
+class _ReportPDF(FPDF):
+    """A4 apaisado que repite título y cabecera de columnas en cada página."""
+
+    def __init__(self, title, subtitle):
+        super().__init__(orientation="L", unit="mm", format="A4")
+        self.report_title = _latin1(title)
+        self.report_subtitle = _latin1(subtitle)
+        self.set_margins(10, 10, 10)
+        self.set_auto_page_break(True, margin=12)
+        self.alias_nb_pages()
+
+    def header(self):
+        self.set_font("Arial", "B", 12)
+        self.cell(0, 7, self.report_title, ln=1, align="C")
+        self.set_font("Arial", "", 9)
+        self.cell(0, 5, self.report_subtitle, ln=1, align="C")
+        self.ln(2)
+        self.set_font("Arial", "B", 8)
+        self.set_fill_color(*HEADER_FILL)
+        for title, width in REPORT_COLUMNS:
+            self.cell(width, HEADER_ROW_HEIGHT, _latin1(title), border=1, align="C", fill=True)
+        self.ln()
+
+    def footer(self):
+        self.set_y(-10)
+        self.set_font("Arial", "", 7)
+        self.cell(0, 5, f"Página {self.page_no()}/{{nb}}", align="R")
+
+    def row(self, values):
+        self.set_font("Arial", "", 7)
+        for (_, width), value in zip(REPORT_COLUMNS, values):
+            self.cell(width, ROW_HEIGHT, self._fit(value, width), border=1, align="C")
+        self.ln()
+
+    def subtotal(self, label, name, contract, hours, difference):
+        """Fila de total semanal: agrupa columnas para que quepan los textos."""
+        widths = [width for _, width in REPORT_COLUMNS]
+        spans = (
+            (sum(widths[0:2]), label),
+            (widths[2], name),
+            (sum(widths[3:8]), contract),
+            (widths[8], hours),
+            (sum(widths[9:]), difference),
+        )
+        self.set_font("Arial", "B", 7)
+        self.set_fill_color(*SUBTOTAL_FILL)
+        for width, value in spans:
+            self.cell(width, ROW_HEIGHT, self._fit(value, width), border=1, align="C", fill=True)
+        self.ln()
+
+    def _fit(self, value, width):
+        text = _latin1(value)
+        limit = width - 2
+        if self.get_string_width(text) <= limit:
+            return text
+        while text and self.get_string_width(text + "...") > limit:
+            text = text[:-1]
+        return text + "..."
+
+
+def _hours(seconds):
+    return f"{seconds / 3600:.2f}"
+
+
+def render_records_report(title, subtitle, rows, users, week_totals):
+    """
+    PDF (bytes) de las filas (record, status) ordenadas por empleado y fecha,
+    con una fila de subtotal tras cada semana de cada empleado. ``week_totals``
+    trae los segundos trabajados de cada semana ya agregados en la BD
+    (_week_summaries); si falta una semana se suman sus filas.
+    """
+    pdf = _ReportPDF(title, subtitle)
+    pdf.add_page()
+
+    for (user_id, week_start), week_rows in groupby(
+        rows, key=lambda item: (item[0].user_id, item[0].date - timedelta(days=item[0].date.weekday()))
+    ):
+        user = users.get(user_id)
+        summed = 0.0
+        for record, status in week_rows:
+            worked = None
+            if record.check_in and record.check_out:
+                worked = (record.check_out - record.check_in).total_seconds()
+                summed += worked
+            admin_entry = status.entry_time if status else None
+            admin_exit = status.exit_time if status else None
+            pdf.row((
+                record.date.strftime("%d/%m/%Y"),
+                user.username if user else f"ID: {record.user_id}",
+                user.full_name if user else "-",
+                user.categoria if user and user.categoria else "-",
+                record.check_in.strftime("%H:%M") if record.check_in else "-",
+                record.check_out.strftime("%H:%M") if record.check_out else "-",
+                admin_entry.strftime("%H:%M") if admin_entry else "-",
+                admin_exit.strftime("%H:%M") if admin_exit else "-",
+                _hours(worked) if worked is not None else "",
+                record.notes or "",
+                (status.notes if status else "") or "",
+            ))
+
+        worked_seconds = week_totals.get((user_id, week_start), summed)
+        contract = user.weekly_hours if user and user.weekly_hours else 0
+        week_end = week_start + timedelta(days=6)
+        pdf.subtotal(
+            f"TOTAL SEMANA {week_start.strftime('%d/%m')} - {week_end.strftime('%d/%m')}",
+            user.full_name if user else "-",
+            f"Contrato: {contract}h" if contract else "Contrato: -",
+            _hours(worked_seconds),
+            f"Diferencia: {contract - worked_seconds / 3600:.2f}" if contract else "-",
+        )
+
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def bundle_reports(app, builders, workers=None):
+    """
+    Ejecuta ``builders`` [(nombre_fichero, función sin argumentos -> bytes)]
+    y devuelve un fichero temporal (ya rebobinado) con el zip de los PDF no
+    vacíos. Cada función corre en un hilo con su propio contexto de
+    aplicación; con SQLite (una única conexión compartida) van en serie.
+    """
+    workers = workers or app.config.get("PDF_REPORT_WORKERS", PDF_REPORT_MAX_WORKERS)
+    with app.app_context():
+        serial = db.engine.dialect.name == "sqlite"
+
+    def run(builder):
+        with app.app_context():
+            return builder()
+
+    spool = tempfile.SpooledTemporaryFile(max_size=PDF_ZIP_SPOOL_MAX_BYTES)
+    with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        if serial or workers <= 1 or len(builders) <= 1:
+            for filename, builder in builders:
+                content = run(builder)
+                if content:
+                    bundle.writestr(filename, content)
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(builders)),
+                                    thread_name_prefix="tt-pdf") as pool:
+                futures = {pool.submit(run, builder): filename for filename, builder in builders}
+                # Cada PDF se escribe en cuanto termina y deja de ocupar memoria
+                for future in as_completed(futures):
+                    content = future.result()
+                    if content:
+                        bundle.writestr(futures[future], content)
+    spool.seek(0)
+    return spool
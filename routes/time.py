@@ -1,15 +1,20 @@
 from flask import (
     Blueprint, render_template, request, redirect,
-    url_for, flash, session
+    url_for, flash, session, jsonify, current_app, abort
 )
-from sqlalchemy import desc, text, and_
+from sqlalchemy import desc, text, and_, or_, false, func, case
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from datetime import datetime, date, timedelta, time as dt_time
+from collections import namedtuple
 import calendar
+import hmac
 import logging
+import os
 
-from models.models import TimeRecord, User, EmployeeStatus
+from models.models import TimeRecord, User, EmployeeStatus, WeeklyUserTotal, PunchRequest
 from models.database import db
+from tasks.autofill import BLOCKING_STATUSES
+from tasks.punch_batch import BATCH_MAX_EVENTS, ingest_punches
 time_bp = Blueprint("time", __name__)
 logger = logging.getLogger(__name__)
 
@@ -35,91 +40,145 @@ def format_timedelta(td):
     return f"-{result}" if is_negative else result
 
 
+# Espacio de nombres de los bloqueos consultivos de fichaje: pg_advisory_xact_lock(ns, user_id)
+PUNCH_LOCK_NAMESPACE = 7301
+
+
+def _lock_user_punches(user_id):
+    """
+    Serializa los fichajes de UN empleado en vez de bloquear toda la tabla.
+
+    En Postgres toma un bloqueo consultivo de transacción con clave user_id: dos
+    fichajes simultáneos del mismo empleado se esperan (y el segundo ve el
+    registro abierto del primero), pero empleados distintos no se bloquean. Se
+    libera solo en el commit/rollback. En SQLite la escritura ya es exclusiva.
+    """
+    bind = db.session.get_bind()
+    if bind and bind.dialect.name == "postgresql":
+        db.session.execute(
+            text("SELECT pg_advisory_xact_lock(:ns, :uid)"),
+            {"ns": PUNCH_LOCK_NAMESPACE, "uid": user_id},
+        )
+
+
 # ------------------------------------------------------------------
-#  FICHAR ENTRADA
+#  VALIDACIÓN DE FICHAJES (formularios y API JSON)
 # ------------------------------------------------------------------
-@time_bp.route("/check_in", methods=["POST"])
-def check_in():
-    if "user_id" not in session:
-        return redirect(url_for("auth.login"))
-    user_id = session["user_id"]
+class PunchRejected(Exception):
+    """Fichaje no permitido. ``code`` lo identifica en la API JSON."""
 
-     # BUSCA REGISTRO ABIERTO
-    existing_open = TimeRecord.query.filter_by(user_id=user_id, check_out=None).order_by(desc(TimeRecord.id)).first()
-    if existing_open and existing_open.date < date.today():
+    def __init__(self, code, message, category="warning"):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.category = category
+
+
+def _open_record(user_id):
+    """Último fichaje sin salida del empleado (o None)."""
+    return (
+        TimeRecord.query
+        .filter_by(user_id=user_id, check_out=None)
+        .order_by(desc(TimeRecord.id))
+        .first()
+    )
+
+
+def _validate_check_in(open_record, today_status, today):
+    if open_record and open_record.date < today:
         # Fichaje de un día anterior sin salida: el empleado confirma/corrige
         # entrada y salida antes de poder fichar hoy.
-        return redirect(url_for("time.close_pending"))
-    if existing_open:
-        # Permite al usuario cerrarlo desde aquí
-        flash(f"Tienes un fichaje abierto desde {existing_open.check_in.strftime('%d-%m-%Y %H:%M:%S')}. Debes cerrarlo antes de fichar entrada.", "warning")
-        # Opcional: Puedes redirigir a un formulario donde el usuario pueda cerrarlo, o incluso cerrarlo automáticamente con la hora actual.
-        return redirect(url_for("time.dashboard_employee"))
+        raise PunchRejected("pending_close", "Tienes un fichaje de un día anterior sin cerrar.")
+    if open_record:
+        raise PunchRejected(
+            "already_open",
+            f"Tienes un fichaje abierto desde {open_record.check_in.strftime('%d-%m-%Y %H:%M:%S')}. "
+            "Debes cerrarlo antes de fichar entrada.",
+        )
+    if today_status and today_status.status in BLOCKING_STATUSES:
+        raise PunchRejected(
+            "blocked_status",
+            f"No puedes fichar — tu estado de hoy es «{today_status.status}».",
+            "danger",
+        )
+
 
+def _validate_check_out(open_record, today):
+    if open_record is None:
+        raise PunchRejected("not_open", "No tienes ningún fichaje abierto.")
+    if open_record.date < today:
+        # Cerrarlo con la hora de ahora crearía un turno de varios días:
+        # el empleado confirma/corrige entrada y salida de ese día.
+        raise PunchRejected("pending_close", "Tienes un fichaje de un día anterior sin cerrar.")
+
+
+def _start_punch(user_id, now, today_status):
+    """Añade a la sesión el fichaje de entrada y, si hoy no hay estado, «Trabajado»."""
+    record = TimeRecord(user_id=user_id, check_in=now, date=now.date())
+    db.session.add(record)
+    if not today_status:
+        db.session.add(EmployeeStatus(
+            user_id  = user_id,
+            date     = now.date(),
+            status   = "Trabajado",
+            notes    = "Registro automático de fichaje"
+        ))
+    return record
+
+
+def _check_in_once(user_id):
+    """
+    Bloquea, valida y registra la entrada del empleado. Devuelve la redirección
+    si se rechaza o None si queda registrada (y confirmada).
+    """
+    # 1) Bloqueo por empleado (solo serializa sus propios fichajes)
+    _lock_user_punches(user_id)
+
+    # 2) Fichaje abierto y estado de hoy (no trabajable = no se ficha)
+    today = date.today()
+    today_status = EmployeeStatus.query.filter_by(user_id=user_id, date=today).first()
     try:
-        # 1) Bloqueo en Postgres/MySQL al inicio
-        bind = db.session.get_bind()
-        if bind and bind.dialect.name == "postgresql":
-            db.session.execute(
-                text("LOCK TABLE public.time_record IN SHARE ROW EXCLUSIVE MODE")
-            )
-
-        # 2) ¿Tiene hoy un estado NO trabajable?
-        today_status = EmployeeStatus.query.filter_by(
-            user_id=user_id, date=date.today()
-        ).first()
-        if today_status and today_status.status in ("Vacaciones", "Baja", "Ausente"):
-            flash(
-                f"No puedes fichar — tu estado de hoy es «{today_status.status}».",
-                "danger"
-            )
-            return redirect(url_for("time.dashboard_employee"))
+        _validate_check_in(_open_record(user_id), today_status, today)
+    except PunchRejected as rejected:
+        db.session.rollback()
+        if rejected.code == "pending_close":
+            return redirect(url_for("time.close_pending"))
+        flash(rejected.message, rejected.category)
+        return redirect(url_for("time.dashboard_employee"))
 
-        # 3) ¿Ya hay un fichaje abierto?
-        existing_open = (
-            TimeRecord.query
-            .filter_by(user_id=user_id, check_out=None)
-            .order_by(desc(TimeRecord.id))
-            .first()
-        )
-        if existing_open:
-            flash(
-                f"Ya tienes un registro abierto desde "
-                f"{existing_open.check_in.strftime('%d-%m-%Y %H:%M:%S')}.",
-                "warning"
-            )
-        else:
-            now = datetime.now()
+    # 3) Fichaje de entrada (+ estado Trabajado si hoy no hay ninguno)
+    _start_punch(user_id, datetime.now(), today_status)
+    db.session.commit()
+    flash("Entrada registrada correctamente.", "success")
+    return None
 
-            # --- crear TimeRecord ---
-            new_rec = TimeRecord(user_id=user_id, check_in=now, date=now.date())
-            db.session.add(new_rec)
 
-            # --- si no existe EmployeeStatus hoy, crearlo como Trabajado ---
-            if not today_status:
-                db.session.add(EmployeeStatus(
-                    user_id  = user_id,
-                    date     = now.date(),
-                    status   = "Trabajado",
-                    notes    = "Registro automático de fichaje"
-                ))
+# ------------------------------------------------------------------
+#  FICHAR ENTRADA
+# ------------------------------------------------------------------
+@time_bp.route("/check_in", methods=["POST"])
+def check_in():
+    if "user_id" not in session:
+        return redirect(url_for("auth.login"))
+    user_id = session["user_id"]
 
-            db.session.commit()
-            flash("Entrada registrada correctamente.", "success")
+    try:
+        rejected = _check_in_once(user_id)
+        if rejected is not None:
+            return rejected
 
     except IntegrityError as e:
         db.session.rollback()
         logger.error(f"IntegrityError en check_in: {e}", exc_info=True)
         # Si es violación de unique constraint en employee_status, es porque
         # ya existe el status para hoy (creado por otro proceso concurrente)
-        # En ese caso, solo creamos el TimeRecord
+        # En ese caso se repite todo el fichaje: el otro proceso puede haber
+        # abierto ya un fichaje o dejado un estado que bloquea la entrada
         if "employee_status" in str(e.orig) or "uix_employee_date" in str(e.orig):
             try:
-                now = datetime.now()
-                new_rec = TimeRecord(user_id=user_id, check_in=now, date=now.date())
-                db.session.add(new_rec)
-                db.session.commit()
-                flash("Entrada registrada correctamente.", "success")
+                rejected = _check_in_once(user_id)
+                if rejected is not None:
+                    return rejected
             except SQLAlchemyError as e2:
                 db.session.rollback()
                 logger.error(f"Error en retry de check_in: {e2}", exc_info=True)
@@ -145,31 +204,22 @@ def check_out():
     user_id = session["user_id"]
 
     try:
-        bind = db.session.get_bind()
-        if bind and bind.dialect.name == "postgresql":
-            db.session.execute(
-                text("LOCK TABLE public.time_record IN SHARE ROW EXCLUSIVE MODE")
-            )
-
-        open_record = (
-            TimeRecord.query
-            .filter_by(user_id=user_id, check_out=None)
-            .order_by(desc(TimeRecord.id))
-            .first()
-        )
-        if open_record and open_record.date < date.today():
-            # Cerrarlo con la hora de ahora crearía un turno de varios días:
-            # el empleado confirma/corrige entrada y salida de ese día.
+        _lock_user_punches(user_id)
+
+        open_record = _open_record(user_id)
+        try:
+            _validate_check_out(open_record, date.today())
+        except PunchRejected as rejected:
             db.session.rollback()
-            return redirect(url_for("time.close_pending"))
-        if open_record:
-            now = datetime.now()
-            open_record.check_out = now
-            open_record.notes = request.form.get("notes", "")
-            db.session.commit()
-            flash("Salida registrada correctamente.", "success")
-        else:
-            flash("No tienes ningún fichaje abierto.", "warning")
+            if rejected.code == "pending_close":
+                return redirect(url_for("time.close_pending"))
+            flash(rejected.message, rejected.category)
+            return redirect(url_for("time.dashboard_employee"))
+
+        open_record.check_out = datetime.now()
+        open_record.notes = request.form.get("notes", "")
+        db.session.commit()
+        flash("Salida registrada correctamente.", "success")
 
     except SQLAlchemyError:
         db.session.rollback()
@@ -178,6 +228,188 @@ def check_out():
     return redirect(url_for("time.dashboard_employee"))
 
 
+# ------------------------------------------------------------------
+#  API JSON DE FICHAJE (quioscos / tabletas)
+# ------------------------------------------------------------------
+PUNCH_ACTIONS = ("in", "out", "toggle")
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+
+def _punch_snapshot(user_id, today, key):
+    """
+    Lo que necesita un fichaje de la API en UNA consulta: fichaje abierto más
+    reciente, estado de hoy y respuesta ya guardada para la clave de
+    idempotencia. Devuelve (user_id, TimeRecord, EmployeeStatus, PunchRequest),
+    con None en lo que no exista, o None si el usuario ya no existe.
+    """
+    key_match = (
+        and_(PunchRequest.user_id == User.id, PunchRequest.idempotency_key == key)
+        if key else false()
+    )
+    return (
+        db.session.query(User.id, TimeRecord, EmployeeStatus, PunchRequest)
+        .outerjoin(TimeRecord, and_(TimeRecord.user_id == User.id, TimeRecord.check_out.is_(None)))
+        .outerjoin(EmployeeStatus, and_(EmployeeStatus.user_id == User.id, EmployeeStatus.date == today))
+        .outerjoin(PunchRequest, key_match)
+        .filter(User.id == user_id)
+        .order_by(TimeRecord.id.desc().nulls_last())
+        .first()
+    )
+
+
+def _punch_body(action, record):
+    duration = None
+    if record.check_in and record.check_out:
+        duration = int((record.check_out - record.check_in).total_seconds())
+    return {
+        "action": action,
+        "state": "in" if record.check_out is None else "out",
+        "record": {
+            "id": record.id,
+            "date": record.date.isoformat(),
+            "check_in": record.check_in.isoformat(timespec="seconds") if record.check_in else None,
+            "check_out": record.check_out.isoformat(timespec="seconds") if record.check_out else None,
+            "duration_seconds": duration,
+        },
+    }
+
+
+def _punch_replay(body):
+    response = jsonify(body)
+    response.status_code = 201
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+@time_bp.route("/api/v1/punch", methods=["POST"])
+def api_punch():
+    """
+    Fichaje en JSON para quioscos: {"action": "in" | "out" | "toggle", "notes"}
+    y cabecera opcional Idempotency-Key. Aplica las mismas reglas que
+    check_in/check_out y devuelve solo el nuevo estado, con una consulta de
+    lectura y una transacción de escritura. Repetir la clave devuelve la
+    respuesta del primer fichaje sin volver a fichar.
+    """
+    if "user_id" not in session:
+        return jsonify({"error": "unauthenticated", "message": "No autenticado"}), 401
+    user_id = session["user_id"]
+
+    payload = request.get_json(silent=True) or {}
+    requested = payload.get("action") or "toggle"
+    key = (request.headers.get("Idempotency-Key") or "").strip() or None
+    if requested not in PUNCH_ACTIONS:
+        return jsonify({"error": "invalid_action", "message": "Acción no válida (in, out o toggle)."}), 400
+    if key and len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return jsonify({"error": "invalid_key", "message": "Idempotency-Key demasiado larga."}), 400
+
+    try:
+        _lock_user_punches(user_id)
+        today = date.today()
+        snapshot = _punch_snapshot(user_id, today, key)
+        if snapshot is None:
+            db.session.rollback()
+            return jsonify({"error": "unauthenticated", "message": "No autenticado"}), 401
+        _, open_record, today_status, stored = snapshot
+
+        if stored is not None:
+            # Reintento: se devuelve lo ya respondido (leído antes del rollback,
+            # que caduca los objetos y libera el bloqueo)
+            stored_action, body = stored.action, stored.response
+            db.session.rollback()
+            if stored_action != requested:
+                return jsonify({"error": "key_reused", "message": "La clave ya se usó con otra acción."}), 422
+            return _punch_replay(body)
+
+        action = requested
+        if action == "toggle":
+            action = "out" if open_record else "in"
+        try:
+            if action == "in":
+                _validate_check_in(open_record, today_status, today)
+            else:
+                _validate_check_out(open_record, today)
+        except PunchRejected as rejected:
+            db.session.rollback()
+            return jsonify({"error": rejected.code, "message": rejected.message}), 409
+
+        now = datetime.now()
+        if action == "in":
+            record = _start_punch(user_id, now, today_status)
+        else:
+            record = open_record
+            record.check_out = now
+            record.notes = payload.get("notes") or ""
+        # El flush asigna el id; la respuesta se arma antes del commit, que caduca los objetos
+        db.session.flush()
+        body = _punch_body(action, record)
+        if key:
+            db.session.add(PunchRequest(
+                user_id=user_id, idempotency_key=key, action=requested, response=body
+            ))
+        db.session.commit()
+
+    except IntegrityError as e:
+        db.session.rollback()
+        # Misma clave en dos peticiones simultáneas: gana la primera y esta la repite
+        stored = PunchRequest.query.filter_by(user_id=user_id, idempotency_key=key).first() if key else None
+        if stored is not None and stored.action == requested:
+            return _punch_replay(stored.response)
+        logger.error(f"IntegrityError en api_punch: {e}", exc_info=True)
+        return jsonify({"error": "conflict", "message": "Fichaje simultáneo. Intenta de nuevo."}), 409
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"SQLAlchemyError en api_punch: {e}", exc_info=True)
+        return jsonify({"error": "db_error", "message": "Error al registrar el fichaje."}), 500
+
+    return jsonify(body), 201
+
+
+def _kiosk_authorized():
+    """Cabecera X-KIOSK-TOKEN (o "Authorization: Bearer <token>") igual a env KIOSK_TOKEN."""
+    expected = os.getenv("KIOSK_TOKEN")
+    provided = request.headers.get("X-KIOSK-TOKEN")
+    auth = request.headers.get("Authorization", "")
+    if not provided and auth.startswith("Bearer "):
+        provided = auth[len("Bearer "):]
+    return bool(expected and provided and hmac.compare_digest(provided, expected))
+
+
+@time_bp.route("/api/v1/punch/batch", methods=["POST"])
+def api_punch_batch():
+    """
+    Fichajes guardados sin conexión por un quiosco: {"events": [{"id",
+    "user_id", "action": "in" | "out", "timestamp", "notes"}, ...]}. Se validan
+    y aplican en una sola transacción (ver tasks/punch_batch.py) y se devuelve
+    el resultado de cada evento: applied, duplicate o rejected con su error.
+    """
+    if not _kiosk_authorized():
+        current_app.logger.warning("Unauthorized kiosk punch batch attempt")
+        return jsonify({"error": "unauthorized"}), 401
+
+    payload = request.get_json(silent=True)
+    events = payload.get("events") if isinstance(payload, dict) else None
+    if not isinstance(events, list):
+        return jsonify({"error": "invalid_payload", "message": "Se espera {\"events\": [...]}."}), 400
+    if len(events) > BATCH_MAX_EVENTS:
+        return jsonify({
+            "error": "too_many_events",
+            "message": f"Máximo {BATCH_MAX_EVENTS} eventos por lote.",
+        }), 413
+
+    try:
+        results = ingest_punches(events)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"SQLAlchemyError en api_punch_batch: {e}", exc_info=True)
+        return jsonify({"error": "db_error", "message": "No se aplicó ningún fichaje del lote."}), 500
+
+    summary = {"applied": 0, "duplicate": 0, "rejected": 0}
+    for result in results:
+        summary[result.status] += 1
+    return jsonify({**summary, "results": [r.as_dict() for r in results]}), 200
+
+
 # ------------------------------------------------------------------
 #  CERRAR FICHAJE PENDIENTE DE UN DÍA ANTERIOR
 # ------------------------------------------------------------------
@@ -243,7 +475,7 @@ def close_pending():
     from tasks.autofill import estimate_auto_close_time
 
     try:
-        suggested_exit = estimate_auto_close_time(record)
+        suggested_exit = estimate_auto_close_time(record, store=False)
     except Exception:
         suggested_exit = None
     if suggested_exit is None:
@@ -265,85 +497,206 @@ def dashboard():
     return redirect(url_for("time.dashboard_employee"))
 
 
-@time_bp.route("/employee/dashboard")
-def dashboard_employee():
-    if "user_id" not in session:
-        return redirect(url_for("auth.login"))
-    user_id = session["user_id"]
-    user = User.query.get_or_404(user_id)
+DASHBOARD_RECENT_RECORDS = 3
 
-    today = date.today()
+EmployeeDashboard = namedtuple(
+    "EmployeeDashboard",
+    "user worked_seconds allowed_seconds remaining_seconds open_record recent_records",
+)
+
+
+def employee_dashboard_data(user_id, today=None):
+    """
+    Datos del panel del empleado en dos consultas: el usuario con los segundos
+    trabajados de la semana (weekly_user_totals, fichajes cerrados), lo que le
+    queda de contrato y su fichaje abierto de hoy; y sus últimos fichajes.
+    Devuelve un EmployeeDashboard, o None si el usuario no existe.
+    """
+    today = today or date.today()
     start_week = today - timedelta(days=today.weekday())
-    end_week   = start_week + timedelta(days=7)
 
-    weekly_records = TimeRecord.query.filter(
-        and_(
-            TimeRecord.user_id == user_id,
-            TimeRecord.date >= start_week,
-            TimeRecord.date <  end_week,
-            TimeRecord.check_in.isnot(None),
-            TimeRecord.check_out.isnot(None)
+    worked = func.coalesce(WeeklyUserTotal.worked_seconds, 0)
+    allowed = func.coalesce(User.weekly_hours, 0) * 3600
+    row = (
+        db.session.query(
+            User,
+            worked.label("worked_seconds"),
+            allowed.label("allowed_seconds"),
+            case((allowed > worked, allowed - worked), else_=0).label("remaining_seconds"),
+            TimeRecord,
         )
-    ).all()
-
-    worked_secs   = sum((r.check_out - r.check_in).total_seconds() for r in weekly_records)
-    allowed_secs  = (user.weekly_hours or 0) * 3600
-    remain_secs   = max(allowed_secs - worked_secs, 0)
+        .outerjoin(WeeklyUserTotal, and_(
+            WeeklyUserTotal.user_id == User.id, WeeklyUserTotal.week_start == start_week,
+        ))
+        .outerjoin(TimeRecord, and_(
+            TimeRecord.user_id == User.id, TimeRecord.date == today, TimeRecord.check_out.is_(None),
+        ))
+        .filter(User.id == user_id)
+        .order_by(TimeRecord.id.desc().nulls_last())
+        .first()
+    )
+    if row is None:
+        return None
+    user, worked_seconds, allowed_seconds, remaining_seconds, open_record = row
 
     recent = (
         TimeRecord.query
         .filter_by(user_id=user_id)
         .order_by(desc(TimeRecord.date), desc(TimeRecord.check_in))
-        .limit(3)
+        .limit(DASHBOARD_RECENT_RECORDS)
         .all()
     )
+    return EmployeeDashboard(user, worked_seconds, allowed_seconds, remaining_seconds, open_record, recent)
+
+
+@time_bp.route("/employee/dashboard")
+def dashboard_employee():
+    if "user_id" not in session:
+        return redirect(url_for("auth.login"))
+    data = employee_dashboard_data(session["user_id"])
+    if data is None:
+        abort(404)
 
+    # Lo que queda de contrato es el mismo para todas las filas
+    remaining = format_timedelta(timedelta(seconds=data.remaining_seconds))
     recent_fmt = []
-    for rec in recent:
+    for rec in data.recent_records:
         dur = rec.check_out - rec.check_in if rec.check_in and rec.check_out else None
         recent_fmt.append({
             "record": rec,
             "duration_formatted": format_timedelta(dur),
-            "remaining": format_timedelta(timedelta(seconds=remain_secs)),
-            "is_over": remain_secs == 0
+            "remaining": remaining,
+            "is_over": data.remaining_seconds == 0
         })
 
-    today_record = (
-        TimeRecord.query
-        .filter_by(user_id=user_id, date=today, check_out=None)
-        .order_by(desc(TimeRecord.id))
-        .first()
-    )
-
     return render_template(
         "employee_dashboard.html",
-        user=user,
-        today_record=today_record,
+        user=data.user,
+        today_record=data.open_record,
         recent_records=recent_fmt
     )
 
 
+@time_bp.route("/api/v1/dashboard")
+def api_dashboard():
+    """Panel del empleado en JSON (mismos datos que /employee/dashboard)."""
+    if "user_id" not in session:
+        return jsonify({"error": "unauthenticated", "message": "No autenticado"}), 401
+    data = employee_dashboard_data(session["user_id"])
+    if data is None:
+        return jsonify({"error": "not_found", "message": "Usuario no encontrado"}), 404
+
+    open_record = data.open_record
+    return jsonify({
+        "user": {
+            "id": data.user.id,
+            "username": data.user.username,
+            "full_name": data.user.full_name,
+            "centro": data.user.centro,
+            "weekly_hours": data.user.weekly_hours,
+        },
+        "week": {
+            "worked_seconds": data.worked_seconds,
+            "allowed_seconds": data.allowed_seconds,
+            "remaining_seconds": data.remaining_seconds,
+            "remaining_formatted": format_timedelta(timedelta(seconds=data.remaining_seconds)),
+        },
+        "open_record": {
+            "id": open_record.id,
+            "date": open_record.date.isoformat(),
+            "check_in": open_record.check_in.isoformat(timespec="seconds") if open_record.check_in else None,
+        } if open_record else None,
+        "recent_records": [_history_item(r) for r in data.recent_records],
+    })
+
+
 # ------------------------------------------------------------------
 #  HISTÓRICO INDIVIDUAL
 # ------------------------------------------------------------------
+# Fichajes por página del historial (configurable con app.config["HISTORY_PAGE_SIZE"])
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+
+def _history_page_size():
+    try:
+        size = int(current_app.config.get("HISTORY_PAGE_SIZE", HISTORY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        size = HISTORY_PAGE_SIZE
+    return max(1, min(size, HISTORY_MAX_PAGE_SIZE))
+
+
+def _encode_history_cursor(record):
+    return f"{record.date.isoformat()}_{record.id}"
+
+
+def _decode_history_cursor(cursor):
+    """'AAAA-MM-DD_id' -> (date, id); ValueError si no es válido."""
+    day, _, record_id = cursor.partition("_")
+    return datetime.strptime(day, "%Y-%m-%d").date(), int(record_id)
+
+
+def _history_page(user_id, cursor=None):
+    """
+    Una página del historial ordenada por (date, id) descendente, empezando
+    justo después del cursor. Usa el índice (user_id, date), así que cada
+    página cuesta lo mismo sea cual sea la antigüedad del empleado.
+    Devuelve (registros, cursor_siguiente o None).
+    """
+    size = _history_page_size()
+    q = TimeRecord.query.filter(TimeRecord.user_id == user_id)
+    if cursor:
+        last_date, last_id = _decode_history_cursor(cursor)
+        q = q.filter(or_(
+            TimeRecord.date < last_date,
+            and_(TimeRecord.date == last_date, TimeRecord.id < last_id),
+        ))
+    recs = q.order_by(desc(TimeRecord.date), desc(TimeRecord.id)).limit(size + 1).all()
+    next_cursor = _encode_history_cursor(recs[size - 1]) if len(recs) > size else None
+    return recs[:size], next_cursor
+
+
+def _history_item(r):
+    dur = r.check_out - r.check_in if r.check_in and r.check_out else None
+    return {
+        "date": r.date.strftime("%Y-%m-%d"),
+        "check_in": r.check_in.strftime("%H:%M:%S") if r.check_in else "-",
+        "check_out": r.check_out.strftime("%H:%M:%S") if r.check_out else "-",
+        "duration_formatted": format_timedelta(dur),
+        "notes": r.notes or "",
+        "modified_by": r.modified_by or "-",
+        "updated_at": r.updated_at.strftime("%Y-%m-%d %H:%M:%S") if r.updated_at else "-",
+    }
+
+
 @time_bp.route("/history")
 def history():
     if "user_id" not in session:
         return redirect(url_for("auth.login"))
     user_id = session["user_id"]
 
-    recs = (
-        TimeRecord.query
-        .filter_by(user_id=user_id)
-        .order_by(desc(TimeRecord.id))
-        .all()
+    recs, next_cursor = _history_page(user_id)
+    return render_template(
+        "history.html",
+        records=[_history_item(r) for r in recs],
+        next_cursor=next_cursor,
     )
-    data = []
-    for r in recs:
-        dur = r.check_out - r.check_in if r.check_in and r.check_out else None
-        data.append({"record": r, "duration_formatted": format_timedelta(dur)})
 
-    return render_template("history.html", records=data)
+
+@time_bp.route("/history/more")
+def history_more():
+    """Siguiente página del historial en JSON para el botón «Cargar más»."""
+    if "user_id" not in session:
+        return jsonify({"error": "No autenticado"}), 401
+
+    try:
+        recs, next_cursor = _history_page(session["user_id"], request.args.get("cursor", ""))
+    except ValueError:
+        return jsonify({"error": "Cursor inválido"}), 400
+    return jsonify({
+        "records": [_history_item(r) for r in recs],
+        "next_cursor": next_cursor,
+    })
 
 
 # ------------------------------------------------------------------
@@ -9,9 +9,11 @@ from datetime import date, datetime, time as dt_time, timedelta
 from hashlib import sha256
 
 from flask import current_app
+from sqlalchemy import insert, select
 
-from models.database import db
-from models.models import EmployeeStatus, TimeRecord, User
+from models.database import db, upsert_insert
+from models.models import EmployeeStatus, ShiftPattern, TimeRecord, User
+from models.shift_patterns import HISTORY_WEEKS
 
 
 AUTO_FILL_RECORD_NOTE = "AA"
@@ -22,7 +24,10 @@ TOP_UP_SEED = "topup"
 DURATION_SEED = "duration"
 SHORTFALL_SEED = "shortfall"
 BLOCKING_STATUSES = {"Baja", "Ausente", "Vacaciones"}
-HISTORY_WEEKS = 8
+PATTERN_BATCH_SIZE = 500
+# Empleados entre dos avisos de avance (latido de la tarea en la cola)
+PROGRESS_USERS = 50
+USER_PATTERN_SOURCE = "histórico empleado"
 JITTER_MINUTES = 5
 DURATION_JITTER_MINUTES = 6
 WEEK_DAYS = 7
@@ -110,12 +115,21 @@ def autofill_week(
     centro: str | None = None,
     modified_by: int | None = None,
     commit: bool = True,
+    batched: bool = True,
+    progress=None,
 ) -> AutoFillResult:
     """
     Fill missing records for active non-admin employees in a complete week.
 
     The operation is idempotent because it only creates records on dates where
     the employee has no TimeRecord yet.
+
+    With ``batched`` (default) the week's records, statuses and history of all
+    target employees are loaded up front in a few range queries; otherwise each
+    employee queries its own data. Both modes produce the same result.
+
+    ``progress(users_done, users_total)`` is called every PROGRESS_USERS
+    employees (the job queue uses it as heartbeat).
     """
     app = _get_app(app)
     if app is None:
@@ -127,6 +141,8 @@ def autofill_week(
                 normalize_week_start(week_start),
                 centro=centro,
                 modified_by=modified_by,
+                batched=batched,
+                progress=progress,
             )
             if commit:
                 db.session.commit()
@@ -140,23 +156,31 @@ def _autofill_week_impl(
     week_start: date,
     centro: str | None = None,
     modified_by: int | None = None,
+    batched: bool = False,
+    progress=None,
 ) -> AutoFillResult:
     week_days = [week_start + timedelta(days=i) for i in range(WEEK_DAYS)]
     week_end = week_days[-1]
     result = AutoFillResult(week_start=week_start)
     pattern_cache: dict[tuple[str, str, int], tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]] = {}
 
-    query = User.query.filter(
-        User.is_admin.is_(False),
-        User.is_active.is_(True),
+    conditions = _target_user_conditions(centro)
+    users = (
+        User.query.filter(*conditions)
+        .order_by(User.full_name.asc(), User.username.asc())
+        .all()
     )
-    if centro:
-        query = query.filter(User.centro == centro)
-
-    users = query.order_by(User.full_name.asc(), User.username.asc()).all()
     result.processed_users = len(users)
 
-    for user in users:
+    prefetch = None
+    if batched and users:
+        prefetch = _prefetch_week(
+            db.select(User.id).where(*conditions), week_start, week_end, [user.id for user in users]
+        )
+
+    if progress is not None:
+        progress(0, len(users))
+    for done, user in enumerate(users, start=1):
         user_result = _autofill_user_week(
             user,
             week_days,
@@ -164,14 +188,65 @@ def _autofill_week_impl(
             week_end,
             modified_by,
             pattern_cache,
+            prefetch,
         )
         result.user_results.append(user_result)
         result.created_records += user_result.created_records
         result.created_seconds += user_result.created_seconds
+        if progress is not None and (done % PROGRESS_USERS == 0 or done == len(users)):
+            progress(done, len(users))
 
     return result
 
 
+def _target_user_conditions(centro: str | None = None) -> list:
+    conditions = [
+        User.is_admin.is_(False),
+        User.is_active.is_(True),
+    ]
+    if centro:
+        conditions.append(User.centro == centro)
+    return conditions
+
+
+@dataclass
+class _WeekPrefetch:
+    """Week records, statuses and shift patterns of every target user, by user_id."""
+    records: dict[int, list[TimeRecord]]
+    statuses: dict[int, list[EmployeeStatus]]
+    patterns: dict[int, tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]]
+
+
+def _prefetch_week(user_ids, week_start: date, week_end: date, target_ids: list[int]) -> _WeekPrefetch:
+    """
+    Load in a few queries what _autofill_user_week would otherwise query per
+    employee. ``user_ids`` is a SELECT of the target ids, so the IN never
+    grows with the number of employees; ``target_ids`` are the same ids as a
+    list, used to look up the stored shift patterns.
+    """
+    records: dict[int, list[TimeRecord]] = {}
+    for record in TimeRecord.query.filter(
+        TimeRecord.user_id.in_(user_ids),
+        TimeRecord.date >= week_start,
+        TimeRecord.date <= week_end,
+    ).order_by(TimeRecord.user_id.asc(), TimeRecord.date.asc(), TimeRecord.check_in.asc()):
+        records.setdefault(record.user_id, []).append(record)
+
+    statuses: dict[int, list[EmployeeStatus]] = {}
+    for status in EmployeeStatus.query.filter(
+        EmployeeStatus.user_id.in_(user_ids),
+        EmployeeStatus.date >= week_start,
+        EmployeeStatus.date <= week_end,
+    ):
+        statuses.setdefault(status.user_id, []).append(status)
+
+    return _WeekPrefetch(
+        records=records,
+        statuses=statuses,
+        patterns=_user_patterns(target_ids, week_start),
+    )
+
+
 def _autofill_user_week(
     user: User,
     week_days: list[date],
@@ -179,6 +254,7 @@ def _autofill_user_week(
     week_end: date,
     modified_by,
     pattern_cache: dict[tuple[str, str, int], tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]],
+    prefetch: _WeekPrefetch | None = None,
 ):
     user_result = AutoFillUserResult(
         user_id=user.id,
@@ -197,16 +273,20 @@ def _autofill_user_week(
         user_result.skipped_reason = "fuera de rango de baja"
         return user_result
 
-    records = TimeRecord.query.filter(
-        TimeRecord.user_id == user.id,
-        TimeRecord.date >= week_start,
-        TimeRecord.date <= week_end,
-    ).order_by(TimeRecord.date.asc(), TimeRecord.check_in.asc()).all()
-    statuses = EmployeeStatus.query.filter(
-        EmployeeStatus.user_id == user.id,
-        EmployeeStatus.date >= week_start,
-        EmployeeStatus.date <= week_end,
-    ).all()
+    if prefetch is not None:
+        records = prefetch.records.get(user.id, [])
+        statuses = prefetch.statuses.get(user.id, [])
+    else:
+        records = TimeRecord.query.filter(
+            TimeRecord.user_id == user.id,
+            TimeRecord.date >= week_start,
+            TimeRecord.date <= week_end,
+        ).order_by(TimeRecord.date.asc(), TimeRecord.check_in.asc()).all()
+        statuses = EmployeeStatus.query.filter(
+            EmployeeStatus.user_id == user.id,
+            EmployeeStatus.date >= week_start,
+            EmployeeStatus.date <= week_end,
+        ).all()
     status_by_date = {status.date: status for status in statuses}
 
     worked_seconds = sum(_record_seconds(record) for record in records)
@@ -218,9 +298,10 @@ def _autofill_user_week(
     # empleado y semana para que ninguna semana quede clavada a las horas exactas.
     target_seconds = _weekly_target_seconds(user, week_start, required_seconds)
 
-    history_records = _user_history_records(user.id, week_start)
-    user_templates = _templates_by_weekday(history_records, "histórico empleado")
-    user_day_patterns = _day_patterns_by_weekday(history_records)
+    if prefetch is not None:
+        user_templates, user_day_patterns = prefetch.patterns[user.id]
+    else:
+        user_templates, user_day_patterns = _user_patterns([user.id], week_start)[user.id]
     group_templates, group_day_patterns = _get_group_history(user, week_start, pattern_cache)
 
     records_by_date: dict[date, list[TimeRecord]] = {}
@@ -336,30 +417,31 @@ def _autofill_user_week(
     return user_result
 
 
-def _user_history_records(user_id: int, week_start: date) -> list[TimeRecord]:
+def _history_query(week_start: date):
     history_start = week_start - timedelta(days=HISTORY_WEEKS * 7)
     return TimeRecord.query.filter(
-        TimeRecord.user_id == user_id,
         TimeRecord.date >= history_start,
         TimeRecord.date < week_start,
         TimeRecord.check_in.isnot(None),
         TimeRecord.check_out.isnot(None),
-    ).all()
+    )
 
 
 def _get_group_history(
     user: User,
     week_start: date,
     cache: dict[tuple[str, str, int], tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]],
+    store: bool = True,
 ) -> tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]:
     weekly_hours = int(user.weekly_hours or 0)
     category = user.categoria or ""
     primary_key = ("category", category, weekly_hours)
     if primary_key not in cache:
-        cache[primary_key] = _build_group_history(
+        cache[primary_key] = _group_patterns(
             week_start,
             weekly_hours=weekly_hours,
             category=user.categoria,
+            store=store,
         )
     templates, day_patterns = cache[primary_key]
     if templates or day_patterns:
@@ -367,14 +449,199 @@ def _get_group_history(
 
     fallback_key = ("weekly_hours", "", weekly_hours)
     if fallback_key not in cache:
-        cache[fallback_key] = _build_group_history(
+        cache[fallback_key] = _group_patterns(
             week_start,
             weekly_hours=weekly_hours,
             category=None,
+            store=store,
         )
     return cache[fallback_key]
 
 
+# --------------------------------------------------------------------
+#  PATRONES PERSISTIDOS (tabla shift_pattern)
+# --------------------------------------------------------------------
+# Los turnos típicos de una semana se calculan una vez a partir del histórico
+# y se guardan; las siguientes consultas los leen directamente. Los borra
+# models/shift_patterns.py cuando cambian los fichajes de los que salieron.
+
+_PATTERN_COLUMNS = (
+    ShiftPattern.user_id,
+    ShiftPattern.weekday,
+    ShiftPattern.start_seconds,
+    ShiftPattern.duration_seconds,
+    ShiftPattern.sample_count,
+    ShiftPattern.day_seconds,
+    ShiftPattern.second_start_seconds,
+)
+
+
+def _user_patterns(
+    user_ids: list[int],
+    week_start: date,
+    store: bool = True,
+) -> dict[int, tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]]:
+    """
+    Own-history templates and day patterns of each employee for ``week_start``.
+    Read from shift_pattern; employees without stored rows are computed from
+    their history in one query and, with ``store``, stored. Read-only paths
+    (a GET that rolls back) pass store=False.
+    """
+    rows_by_user: dict[int, list] = {}
+    for chunk in _chunks(user_ids):
+        for row in db.session.execute(
+            select(*_PATTERN_COLUMNS).where(
+                ShiftPattern.user_id.in_(chunk),
+                ShiftPattern.week_start == week_start,
+            )
+        ):
+            rows_by_user.setdefault(row.user_id, []).append(row)
+
+    patterns = {
+        user_id: _patterns_from_rows(rows, USER_PATTERN_SOURCE)
+        for user_id, rows in rows_by_user.items()
+    }
+    missing = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in patterns]
+    if not missing:
+        return patterns
+
+    history: dict[int, list[TimeRecord]] = {}
+    for chunk in _chunks(missing):
+        for record in _history_query(week_start).filter(TimeRecord.user_id.in_(chunk)):
+            history.setdefault(record.user_id, []).append(record)
+
+    new_rows = []
+    for user_id in missing:
+        records = history.get(user_id, [])
+        templates = _templates_by_weekday(records, USER_PATTERN_SOURCE)
+        day_patterns = _day_patterns_by_weekday(records)
+        patterns[user_id] = (templates, day_patterns)
+        new_rows.extend(_pattern_rows(week_start, templates, day_patterns, user_id=user_id))
+    if store:
+        _store_pattern_rows(new_rows)
+    return patterns
+
+
+def _group_patterns(
+    week_start: date,
+    weekly_hours: int,
+    category: str | None,
+    store: bool = True,
+) -> tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]:
+    """Stored group history (see _build_group_history), computed (and stored) on first use."""
+    category = category or None
+    rows = db.session.execute(
+        select(*_PATTERN_COLUMNS).where(
+            ShiftPattern.user_id.is_(None),
+            ShiftPattern.week_start == week_start,
+            ShiftPattern.group_hours == weekly_hours,
+            ShiftPattern.group_categoria == category if category else ShiftPattern.group_categoria.is_(None),
+        )
+    ).all()
+    if rows:
+        return _patterns_from_rows(rows, _group_source(category))
+
+    templates, day_patterns = _build_group_history(week_start, weekly_hours=weekly_hours, category=category)
+    if store:
+        _store_pattern_rows(_pattern_rows(
+            week_start, templates, day_patterns, group_hours=weekly_hours, group_categoria=category,
+        ))
+    return templates, day_patterns
+
+
+def _group_source(category: str | None) -> str:
+    return "histórico categoría" if category else "histórico jornada"
+
+
+def _patterns_from_rows(rows, source: str) -> tuple[dict[int, ShiftTemplate], dict[int, DayPattern]]:
+    templates: dict[int, ShiftTemplate] = {}
+    day_patterns: dict[int, DayPattern] = {}
+    for row in sorted(rows, key=lambda item: item.weekday):
+        if row.weekday == ShiftPattern.EMPTY_WEEKDAY:
+            continue
+        if row.sample_count:
+            templates[row.weekday] = ShiftTemplate(
+                weekday=row.weekday,
+                start_seconds=row.start_seconds,
+                duration_seconds=row.duration_seconds,
+                count=row.sample_count,
+                source=source,
+            )
+        if row.day_seconds is not None:
+            day_patterns[row.weekday] = DayPattern(
+                weekday=row.weekday,
+                total_seconds=row.day_seconds,
+                second_start_seconds=row.second_start_seconds,
+            )
+    return templates, day_patterns
+
+
+def _pattern_rows(
+    week_start: date,
+    templates: dict[int, ShiftTemplate],
+    day_patterns: dict[int, DayPattern],
+    user_id: int | None = None,
+    group_hours: int | None = None,
+    group_categoria: str | None = None,
+) -> list[dict]:
+    base = {
+        "week_start": week_start,
+        "user_id": user_id,
+        "group_hours": group_hours,
+        "group_categoria": group_categoria,
+        "start_seconds": None,
+        "duration_seconds": None,
+        "sample_count": None,
+        "day_seconds": None,
+        "second_start_seconds": None,
+        "updated_at": datetime.utcnow(),
+    }
+    weekdays = sorted(set(templates) | set(day_patterns))
+    if not weekdays:
+        # Marcador: el histórico se ha consultado y no hay turnos que aprovechar
+        return [{**base, "weekday": ShiftPattern.EMPTY_WEEKDAY}]
+
+    rows = []
+    for weekday in weekdays:
+        row = {**base, "weekday": weekday}
+        template = templates.get(weekday)
+        if template is not None:
+            row.update(
+                start_seconds=template.start_seconds,
+                duration_seconds=template.duration_seconds,
+                sample_count=template.count,
+            )
+        pattern = day_patterns.get(weekday)
+        if pattern is not None:
+            row.update(
+                day_seconds=pattern.total_seconds,
+                second_start_seconds=pattern.second_start_seconds,
+            )
+        rows.append(row)
+    return rows
+
+
+def _store_pattern_rows(rows: list[dict]) -> None:
+    """
+    Inserta los patrones calculados. Dos procesos pueden calcular a la vez la
+    misma semana (un job y el cierre nocturno): el índice único
+    uix_shift_pattern_scope y ON CONFLICT DO NOTHING dejan solo una copia.
+    Ojo: en PostgreSQL el segundo INSERT de la misma clave espera a que la
+    transacción del primero termine, así que las transacciones largas que
+    corren en paralelo (lotes de regularize_parallel) no deben guardar filas
+    compartidas de grupo; ver store=False.
+    """
+    dialect_insert = upsert_insert(db.session.get_bind().dialect.name)
+    stmt = insert(ShiftPattern) if dialect_insert is None else dialect_insert(ShiftPattern).on_conflict_do_nothing()
+    for chunk in _chunks(rows):
+        db.session.execute(stmt, chunk)
+
+
+def _chunks(items: list, size: int = PATTERN_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 def _build_group_history(
     week_start: date,
     weekly_hours: int,
@@ -398,7 +665,7 @@ def _build_group_history(
         query = query.filter(User.categoria == category)
 
     records = query.all()
-    source = "histórico categoría" if category else "histórico jornada"
+    source = _group_source(category)
     return _templates_by_weekday(records, source), _day_patterns_by_weekday(records)
 
 
@@ -628,11 +895,12 @@ def _top_up_start(
     return _floor_to_minute(last_out + timedelta(minutes=TOP_UP_BREAK_MINUTES) + jitter)
 
 
-def estimate_auto_close_time(record: TimeRecord) -> datetime | None:
+def estimate_auto_close_time(record: TimeRecord, *, store: bool = True) -> datetime | None:
     """
     Estimate a plausible check-out for an open record, based on the employee's
     typical shift duration (own history, then group history, then weekly hours).
-    Returns None when no sensible estimate can be made.
+    Returns None when no sensible estimate can be made. Read-only callers pass
+    store=False so missing patterns are computed without being written.
     """
     if not record.check_in:
         return None
@@ -641,13 +909,55 @@ def estimate_auto_close_time(record: TimeRecord) -> datetime | None:
         return None
 
     week_start = normalize_week_start(record.date)
-    history_records = _user_history_records(user.id, week_start)
-    user_templates = _templates_by_weekday(history_records, "histórico empleado")
+    user_templates, _ = _user_patterns([user.id], week_start, store=store)[user.id]
+    return _estimate_close_time(record, user, user_templates, {}, store=store)
+
+
+def estimate_auto_close_times(records: list[TimeRecord]) -> list[datetime | None]:
+    """
+    Same estimates as estimate_auto_close_time for many open records, in the
+    same order. Employees are loaded in one query, their own patterns in one
+    query per week and group patterns are shared by every record of the week,
+    so the cost does not grow per record.
+    """
+    candidates = [record for record in records if record.check_in]
+    users: dict[int, User] = {}
+    for chunk in _chunks(sorted({record.user_id for record in candidates})):
+        users.update((user.id, user) for user in User.query.filter(User.id.in_(chunk)))
+
+    ids_by_week: dict[date, set[int]] = {}
+    for record in candidates:
+        if record.user_id in users:
+            ids_by_week.setdefault(normalize_week_start(record.date), set()).add(record.user_id)
+    patterns = {week: _user_patterns(sorted(ids), week) for week, ids in ids_by_week.items()}
+    # La caché de grupos de _get_group_history no distingue semanas: una por semana
+    group_caches: dict[date, dict] = {week: {} for week in ids_by_week}
+
+    estimates = []
+    for record in records:
+        user = users.get(record.user_id) if record.check_in else None
+        if user is None:
+            estimates.append(None)
+            continue
+        week_start = normalize_week_start(record.date)
+        user_templates, _ = patterns[week_start][user.id]
+        estimates.append(_estimate_close_time(record, user, user_templates, group_caches[week_start]))
+    return estimates
+
+
+def _estimate_close_time(
+    record: TimeRecord,
+    user: User,
+    user_templates: dict[int, ShiftTemplate],
+    pattern_cache: dict,
+    store: bool = True,
+) -> datetime | None:
+    week_start = normalize_week_start(record.date)
     weekday = record.date.weekday()
 
     template = user_templates.get(weekday)
     if template is None:
-        group_templates, _ = _get_group_history(user, week_start, {})
+        group_templates, _ = _get_group_history(user, week_start, pattern_cache, store=store)
         template = (
             group_templates.get(weekday)
             or _strongest_template(user_templates)
@@ -25,7 +25,7 @@ import sys
 from datetime import date, datetime, timedelta
 
 from tasks.autofill import autofill_week, normalize_week_start
-from tasks.scheduler import close_open_record
+from tasks.scheduler import close_open_records
 from models.database import db
 from models.models import TimeRecord
 
@@ -66,9 +66,8 @@ def _close_open_records_in_week(week_start: date, centro: str | None = None) ->
     )
     if centro:
         query = query.join(User, TimeRecord.user_id == User.id).filter(User.centro == centro)
-    open_records = query.all()
-    for record in open_records:
-        close_open_record(record)
+    open_records = query.order_by(TimeRecord.date.asc(), TimeRecord.id.asc()).all()
+    close_open_records(open_records)
     return len(open_records)
 
 
@@ -0,0 +1,306 @@
+"""
+Cola persistente de tareas largas de administración (tabla job).
+
+La web encola con enqueue_job y responde al momento con el id de la tarea;
+la ejecuta run_pending_jobs según JOB_RUNNER:
+
+    thread  -> un hilo en segundo plano del propio proceso web
+    worker  -> un proceso aparte: python -m tasks.worker
+    inline  -> dentro de la misma petición (por defecto con SQLite, donde la
+               conexión es única y no admite trabajo concurrente)
+
+Cada tarea se reclama con un UPDATE condicionado a status='queued' (y en
+PostgreSQL además con SELECT ... FOR UPDATE SKIP LOCKED), así que pueden
+convivir varios workers sin ejecutar dos veces la misma.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, update
+
+from models.database import db
+from models.models import Job
+
+
+JOB_RUNNERS = ("thread", "worker", "inline")
+# Una tarea 'running' sin latido en este tiempo se da por perdida (reinicio
+# del proceso a mitad) y vuelve a la cola; autofill y regularize son idempotentes.
+JOB_STALE_AFTER = timedelta(minutes=30)
+# Con JOB_RUNNER='thread' el proceso web revisa la cola cada tanto: recoge
+# tareas que quedaron en cola o perdidas tras un reinicio
+JOB_POLL_INTERVAL = timedelta(minutes=5)
+
+logger = logging.getLogger(__name__)
+
+_HANDLERS = {}
+_executor = None
+_poller = None
+
+
+def job_handler(kind: str):
+    """Registra la función que ejecuta las tareas de tipo ``kind``."""
+    def register(func):
+        _HANDLERS[kind] = func
+        return func
+    return register
+
+
+def _default_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _jsonable(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+# --------------------------------------------------------------------
+#  TIPOS DE TAREA
+# --------------------------------------------------------------------
+
+@job_handler("autofill")
+def _run_autofill(app, params, created_by, progress):
+    from tasks.autofill import autofill_week
+
+    result = autofill_week(
+        date.fromisoformat(params["week_start"]),
+        app=app,
+        centro=params.get("centro"),
+        modified_by=created_by,
+        progress=progress,
+    )
+    return {
+        "week_start": result.week_start,
+        "processed_users": result.processed_users,
+        "created_records": result.created_records,
+        "created_seconds": result.created_seconds,
+        "skipped_users": len(result.skipped_users),
+    }
+
+
+@job_handler("regularize")
+def _run_regularize(app, params, created_by, progress):
+    from tasks.regularize import regularize_range
+
+    summary = regularize_range(
+        date.fromisoformat(params["range_start"]),
+        date.fromisoformat(params["range_end"]),
+        app=app,
+        today=date.fromisoformat(params["today"]) if params.get("today") else None,
+        dry_run=bool(params.get("dry_run")),
+        centro=params.get("centro"),
+        modified_by=created_by,
+        progress=progress,
+    )
+    return {
+        "range_start": summary.range_start,
+        "range_end": summary.range_end,
+        "dry_run": summary.dry_run,
+        "weeks": summary.weeks,
+        "created_records": summary.created_records,
+        "adjusted_records": summary.adjusted_records,
+        "removed_records": summary.removed_records,
+        "overtime_alerts": summary.overtime_alerts,
+        "affected_users": len(summary.user_results),
+    }
+
+
+# --------------------------------------------------------------------
+#  COLA
+# --------------------------------------------------------------------
+
+def enqueue_job(kind: str, params: dict, created_by: int | None = None, app=None) -> Job:
+    """Guarda la tarea en la cola y la despacha según JOB_RUNNER."""
+    if kind not in _HANDLERS:
+        raise ValueError(f"Tipo de tarea desconocido: {kind}")
+    job = Job(kind=kind, params=_jsonable(params), created_by=created_by, status=Job.STATUS_QUEUED)
+    db.session.add(job)
+    db.session.commit()
+
+    from tasks.autofill import _get_app  # reutiliza la resolución de app
+
+    app = _get_app(app)
+    runner = app.config.get("JOB_RUNNER", "thread")
+    if runner not in JOB_RUNNERS:
+        raise ValueError(f"JOB_RUNNER no válido: {runner}")
+    if runner == "inline":
+        run_pending_jobs(app, job_id=job.id)
+        db.session.refresh(job)
+    elif runner == "thread":
+        _dispatch_thread(app)
+    return job
+
+
+def start_thread_runner(app) -> bool:
+    """
+    Arranque del ejecutor en hilo, SOLO desde el proceso web (gunicorn.conf.py
+    o `python main.py`): importar main desde un CLI, el cron o el worker no
+    debe reclamar tareas. Con JOB_RUNNER='thread' lanza un hilo demonio que
+    llama a resume_thread_jobs al arrancar y cada JOB_POLL_INTERVAL.
+    """
+    global _poller
+    if app.config.get("JOB_RUNNER") != "thread":
+        return False
+    if _poller is None:
+        _poller = threading.Thread(target=_poll_jobs, args=(app,), name="tt-jobs-poll", daemon=True)
+        _poller.start()
+    return True
+
+
+def _poll_jobs(app) -> None:
+    while True:
+        try:
+            resume_thread_jobs(app)
+        except Exception:
+            logger.exception("No se pudo revisar la cola de tareas")
+        time.sleep(JOB_POLL_INTERVAL.total_seconds())
+
+
+def resume_thread_jobs(app) -> bool:
+    """
+    Con JOB_RUNNER='thread', devuelve a la cola las tareas sin latido y lanza el
+    hilo que ejecuta las pendientes. Lo llama periódicamente start_thread_runner;
+    sin ello solo se ejecutarían al encolar una tarea nueva.
+    """
+    if app.config.get("JOB_RUNNER", "thread") != "thread":
+        return False
+    _dispatch_thread(app)
+    return True
+
+
+def _dispatch_thread(app) -> None:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tt-jobs")
+    _executor.submit(_run_in_context, app)
+
+
+def _run_in_context(app) -> None:
+    try:
+        with app.app_context():
+            requeue_stale_jobs()
+            run_pending_jobs(app)
+    except Exception:
+        logger.exception("Fallo del ejecutor de tareas en segundo plano")
+
+
+def _claim(worker_name: str, job_id: int | None = None) -> Job | None:
+    stmt = select(Job.id).where(Job.status == Job.STATUS_QUEUED)
+    if job_id is not None:
+        stmt = stmt.where(Job.id == job_id)
+    stmt = stmt.order_by(Job.id).limit(1).with_for_update(skip_locked=True)
+    candidate = db.session.scalar(stmt)
+    if candidate is None:
+        db.session.rollback()
+        return None
+
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate, Job.status == Job.STATUS_QUEUED)
+        .values(status=Job.STATUS_RUNNING, worker=worker_name, started_at=now, heartbeat_at=now)
+    ).rowcount
+    db.session.commit()
+    return db.session.get(Job, candidate) if claimed else None
+
+
+def _report_progress(job_id: int, done: int, total: int) -> None:
+    # Conexión propia para que el avance se vea antes de que la tarea confirme.
+    # En SQLite la conexión es única (StaticPool): confirmar aquí confirmaría
+    # también el trabajo a medias, así que solo se informa al terminar.
+    if db.engine.dialect.name == "sqlite":
+        return
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(progress_done=done, progress_total=total, heartbeat_at=datetime.utcnow())
+        )
+
+
+def _finish(job_id: int, **values) -> None:
+    db.session.execute(
+        update(Job).where(Job.id == job_id).values(finished_at=datetime.utcnow(), **values)
+    )
+    db.session.commit()
+
+
+def run_job(app, job: Job) -> None:
+    """Ejecuta una tarea ya reclamada y guarda su resultado o su error."""
+    job_id, kind, params, created_by = job.id, job.kind, dict(job.params or {}), job.created_by
+    handler = _HANDLERS.get(kind)
+    last_progress = [0, 0]
+
+    def progress(done, total):
+        last_progress[:] = [done, total]
+        _report_progress(job_id, done, total)
+
+    try:
+        if handler is None:
+            raise ValueError(f"Tipo de tarea desconocido: {kind}")
+        result = handler(app, params, created_by, progress)
+    except Exception as exc:
+        db.session.rollback()
+        logger.exception("Tarea %s (%s) fallida", job_id, kind)
+        _finish(
+            job_id,
+            status=Job.STATUS_FAILED,
+            error=f"{type(exc).__name__}: {exc}",
+            progress_done=last_progress[0],
+            progress_total=last_progress[1],
+        )
+        return
+
+    total = max(last_progress[1], 1)
+    _finish(
+        job_id,
+        status=Job.STATUS_DONE,
+        result=_jsonable(result),
+        progress_done=total,
+        progress_total=total,
+    )
+
+
+def run_pending_jobs(app, worker_name: str | None = None, job_id: int | None = None,
+                     should_stop=None) -> int:
+    """
+    Ejecuta tareas en cola hasta vaciarla (o solo ``job_id``). Devuelve cuántas
+    ha procesado. ``should_stop()`` permite al worker parar entre tareas.
+    """
+    worker_name = worker_name or _default_worker_name()
+    processed = 0
+    with app.app_context():
+        while not (should_stop and should_stop()):
+            job = _claim(worker_name, job_id=job_id)
+            if job is None:
+                break
+            run_job(app, job)
+            processed += 1
+            if job_id is not None:
+                break
+    return processed
+
+
+def requeue_stale_jobs(now: datetime | None = None) -> int:
+    """Devuelve a la cola las tareas 'running' sin latido reciente."""
+    limit = (now or datetime.utcnow()) - JOB_STALE_AFTER
+    requeued = db.session.execute(
+        update(Job)
+        .where(Job.status == Job.STATUS_RUNNING, Job.heartbeat_at < limit)
+        .values(status=Job.STATUS_QUEUED, worker=None)
+    ).rowcount
+    db.session.commit()
+    return requeued
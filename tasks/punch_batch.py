@@ -0,0 +1,272 @@
+"""
+Carga por lotes de fichajes hechos sin conexión en los quioscos.
+
+Cuando un centro pierde la conexión el quiosco guarda los fichajes y, al
+recuperarla, los sube de golpe (cientos de entradas/salidas de muchos
+empleados). Aquí se validan y se aplican:
+
+  - Los eventos de cada empleado se ordenan por hora y se recorren como en la
+    web: no hay entrada con un fichaje abierto, ni salida sin él, ni salida en
+    otro día que la entrada; la entrada en un día con estado bloqueante
+    (BLOCKING_STATUSES) se rechaza y los tramos no pueden pisar fichajes ya
+    cerrados.
+  - Los eventos repetidos (mismo empleado, acción y hora, dentro del lote o ya
+    guardados) se marcan como duplicados: el quiosco puede reenviar el lote.
+  - Todo se lee con unas pocas consultas por bloques de empleados y se escribe
+    con INSERT/UPDATE masivos en la transacción del llamante, que confirma.
+
+Las escrituras masivas no disparan los eventos del ORM: se llama a
+refresh_weekly_totals e invalidate_shift_patterns con lo tocado.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import insert, or_, select, text, update
+
+from models.database import db
+from models.models import EmployeeStatus, TimeRecord, User
+from models.shift_patterns import invalidate_shift_patterns
+from models.weekly_totals import refresh_weekly_totals
+from tasks.autofill import BLOCKING_STATUSES
+
+
+# Eventos por petición y empleados/filas por sentencia
+BATCH_MAX_EVENTS = 5000
+PUNCH_BATCH_SIZE = 500
+# Margen para relojes de quiosco algo adelantados
+FUTURE_TOLERANCE = timedelta(minutes=5)
+PUNCH_ACTIONS = ("in", "out")
+AUTO_STATUS_NOTE = "Registro automático de fichaje"
+
+APPLIED = "applied"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+
+@dataclass
+class PunchEventResult:
+    index: int
+    event_id: object = None
+    status: str = APPLIED
+    error: str | None = None
+
+    def as_dict(self):
+        result = {"index": self.index, "id": self.event_id, "status": self.status}
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+@dataclass
+class _Punch:
+    index: int
+    event_id: object
+    user_id: int
+    action: str
+    at: datetime
+    notes: str | None
+
+
+@dataclass
+class _OpenRecord:
+    """Fichaje abierto del empleado: guardado (id) o nuevo de este lote (row)."""
+    check_in: datetime
+    record_id: int | None = None
+    row: dict | None = None
+
+
+def _app_timezone():
+    try:
+        return ZoneInfo(os.getenv("APP_TIMEZONE", "Europe/Madrid"))
+    except Exception:
+        return ZoneInfo("Europe/Madrid")
+
+
+def _parse_event(index, raw):
+    """_Punch a partir del JSON del quiosco, o None si no es válido."""
+    if not isinstance(raw, dict):
+        return None
+    user_id, action, stamp = raw.get("user_id"), raw.get("action"), raw.get("timestamp")
+    notes = raw.get("notes")
+    if isinstance(user_id, bool) or not isinstance(user_id, int) or action not in PUNCH_ACTIONS:
+        return None
+    if not isinstance(stamp, str) or (notes is not None and not isinstance(notes, str)):
+        return None
+    try:
+        at = datetime.fromisoformat(stamp)
+    except ValueError:
+        return None
+    if at.tzinfo is not None:
+        # Las horas se guardan en hora local del centro, sin zona
+        at = at.astimezone(_app_timezone()).replace(tzinfo=None)
+    return _Punch(index, raw.get("id"), user_id, action, at.replace(microsecond=0), notes)
+
+
+def _chunks(items, size=PUNCH_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _lock_users(user_ids):
+    """Bloqueo consultivo de fichajes (el de check_in) de todos los empleados, en una sentencia."""
+    bind = db.session.get_bind()
+    if bind is None or bind.dialect.name != "postgresql":
+        return
+    from routes.time import PUNCH_LOCK_NAMESPACE
+
+    # En orden de id para que dos lotes simultáneos no se bloqueen mutuamente
+    db.session.execute(
+        text("SELECT pg_advisory_xact_lock(:ns, uid) FROM unnest(CAST(:uids AS integer[])) AS t(uid)"),
+        {"ns": PUNCH_LOCK_NAMESPACE, "uids": sorted(user_ids)},
+    )
+
+
+def _load_state(user_ids, first_day, last_day):
+    """
+    Empleados activos, fichajes del rango más los abiertos (de cualquier día)
+    y estados del rango de los empleados indicados.
+    """
+    active, records, statuses = set(), {}, {}
+    for chunk in _chunks(user_ids):
+        active.update(db.session.scalars(
+            select(User.id).where(User.id.in_(chunk), User.is_active.is_(True))
+        ))
+        for row in db.session.execute(
+            select(TimeRecord.id, TimeRecord.user_id, TimeRecord.check_in, TimeRecord.check_out)
+            .where(
+                TimeRecord.user_id.in_(chunk),
+                or_(TimeRecord.date.between(first_day, last_day), TimeRecord.check_out.is_(None)),
+            )
+            .order_by(TimeRecord.id)
+        ):
+            records.setdefault(row.user_id, []).append(row)
+        for user_id, day, status in db.session.execute(
+            select(EmployeeStatus.user_id, EmployeeStatus.date, EmployeeStatus.status).where(
+                EmployeeStatus.user_id.in_(chunk),
+                EmployeeStatus.date.between(first_day, last_day),
+            )
+        ):
+            statuses[(user_id, day)] = status
+    return active, records, statuses
+
+
+def _overlaps(spans, start, end):
+    """¿El tramo [start, end] pisa algún fichaje cerrado? (end == start: un instante)."""
+    if end == start:
+        return any(ci <= start < co for ci, co in spans)
+    return any(ci < end and start < co for ci, co in spans)
+
+
+def _plan_user(user_id, punches, records, statuses, results, plan):
+    """Recorre en orden los eventos de un empleado y acumula en ``plan`` lo que se escribe."""
+    known = {("in", r.check_in) for r in records if r.check_in}
+    known.update(("out", r.check_out) for r in records if r.check_out)
+    spans = [(r.check_in, r.check_out) for r in records if r.check_in and r.check_out]
+    open_record = None
+    for r in records:  # por id ascendente: queda el último abierto
+        if r.check_in and r.check_out is None:
+            open_record = _OpenRecord(r.check_in, record_id=r.id)
+
+    for punch in sorted(punches, key=lambda p: (p.at, p.index)):
+        result = results[punch.index]
+        day = punch.at.date()
+        if (punch.action, punch.at) in known:
+            result.status = DUPLICATE
+            continue
+        if punch.action == "in":
+            if open_record is not None:
+                result.error = "pending_close" if open_record.check_in.date() < day else "already_open"
+            elif statuses.get((user_id, day)) in BLOCKING_STATUSES:
+                result.error = "blocked_status"
+            elif _overlaps(spans, punch.at, punch.at):
+                result.error = "overlap"
+            else:
+                row = {"user_id": user_id, "date": day, "check_in": punch.at, "check_out": None, "notes": None}
+                plan["records"].append(row)
+                open_record = _OpenRecord(punch.at, row=row)
+                if (user_id, day) not in statuses:
+                    statuses[(user_id, day)] = "Trabajado"
+                    plan["statuses"].append({
+                        "user_id": user_id, "date": day, "status": "Trabajado", "notes": AUTO_STATUS_NOTE,
+                    })
+        else:
+            if open_record is None:
+                result.error = "not_open"
+            elif punch.at <= open_record.check_in:
+                result.error = "out_of_order"
+            elif open_record.check_in.date() != day:
+                # Igual que en la web: un turno de varios días lo confirma el empleado
+                result.error = "pending_close"
+            elif _overlaps(spans, open_record.check_in, punch.at):
+                result.error = "overlap"
+            else:
+                if open_record.row is not None:
+                    open_record.row.update(check_out=punch.at, notes=punch.notes)
+                else:
+                    plan["closes"].append({"id": open_record.record_id, "check_out": punch.at, "notes": punch.notes})
+                spans.append((open_record.check_in, punch.at))
+                open_record = None
+        if result.error:
+            result.status = REJECTED
+            continue
+        known.add((punch.action, punch.at))
+        plan["touched"].add((user_id, day))
+
+
+def ingest_punches(events, *, now: datetime | None = None) -> list[PunchEventResult]:
+    """
+    Valida y aplica (sin confirmar) una lista de eventos
+    {"id", "user_id", "action": "in" | "out", "timestamp": ISO 8601, "notes"}.
+    Devuelve un PunchEventResult por evento, en el orden recibido.
+    """
+    now = now or datetime.now()
+    results = []
+    by_user: dict[int, list[_Punch]] = {}
+    for index, raw in enumerate(events):
+        punch = _parse_event(index, raw)
+        event_id = raw.get("id") if isinstance(raw, dict) else None
+        results.append(PunchEventResult(index, event_id))
+        if punch is None:
+            results[index].status, results[index].error = REJECTED, "invalid_event"
+        elif punch.at > now + FUTURE_TOLERANCE:
+            results[index].status, results[index].error = REJECTED, "future_timestamp"
+        else:
+            by_user.setdefault(punch.user_id, []).append(punch)
+    if not by_user:
+        return results
+
+    user_ids = sorted(by_user)
+    _lock_users(user_ids)
+    days = [p.at.date() for punches in by_user.values() for p in punches]
+    active, records, statuses = _load_state(user_ids, min(days), max(days))
+
+    plan = {"records": [], "closes": [], "statuses": [], "touched": set()}
+    for user_id in user_ids:
+        if user_id not in active:
+            for punch in by_user[user_id]:
+                results[punch.index].status, results[punch.index].error = REJECTED, "unknown_user"
+            continue
+        _plan_user(user_id, by_user[user_id], records.get(user_id, []), statuses, results, plan)
+
+    for rows in _chunks(plan["records"]):
+        db.session.execute(insert(TimeRecord), rows)
+    if plan["closes"]:
+        db.session.execute(update(TimeRecord), plan["closes"])
+    for rows in _chunks(plan["statuses"]):
+        db.session.execute(insert(EmployeeStatus), rows)
+
+    touched = plan["touched"]
+    if touched:
+        connection = db.session.connection()
+        refresh_weekly_totals(connection, {(uid, _week_start(day)) for uid, day in touched})
+        invalidate_shift_patterns(connection, touched)
+    return results
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
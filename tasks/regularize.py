@@ -29,6 +29,8 @@ from flask import current_app
 
 from models.database import db
 from models.models import EmployeeStatus, OvertimeAlert, TimeRecord, User
+from models.shift_patterns import invalidate_shift_patterns
+from models.weekly_totals import refresh_weekly_totals
 from tasks.autofill import (
     AUTO_FILL_RECORD_NOTE,
     BLOCKING_STATUSES,
@@ -40,8 +42,7 @@ from tasks.autofill import (
     _stable_minute_offset,
     _stable_signed_offset,
     _target_workday_count,
-    _templates_by_weekday,
-    _user_history_records,
+    _user_patterns,
     normalize_week_start,
 )
 
@@ -52,6 +53,7 @@ REG_TARGET_JITTER_MIN = 12         # ±12 min de variación del total semanal (m
 REG_DURATION_JITTER_MIN = 8        # ±8 min de variación por día
 MIN_DAY_SECONDS = 30 * 60          # no crear días de menos de 30 min
 MAX_REG_WORKDAYS = 5               # tope de días laborables generados (2 libres seguidos)
+REG_BATCH_SIZE = 500               # ids por IN / filas por INSERT en el modo por lotes
 
 
 def _max_daily_seconds(user: User) -> int:
@@ -126,6 +128,16 @@ class RegResult:
     created_records: int = 0
     overtime_alerts: int = 0
     user_results: list[RegUserResult] = field(default_factory=list)
+    # Solo en regularize_range_parallel: lotes que fallaron (y se deshicieron)
+    failed_shards: list[dict] = field(default_factory=list)
+
+
+@dataclass
+class _WeekPlan:
+    """Cambios calculados para un empleado y semana, pendientes de aplicar."""
+    removed: list[TimeRecord] = field(default_factory=list)
+    new_records: list[dict] = field(default_factory=list)
+    new_statuses: list[dict] = field(default_factory=list)
 
 
 def _get_app(explicit_app=None):
@@ -232,7 +244,26 @@ def regularize_range(
     dry_run: bool = False,
     centro: str | None = None,
     modified_by: int | None = None,
+    batched: bool = True,
+    progress=None,
+    user_ids: list[int] | None = None,
+    store_group_patterns: bool = True,
 ) -> RegResult:
+    """
+    Regulariza las semanas completas del rango.
+
+    Con ``batched`` (por defecto) cada semana se resuelve para toda la plantilla
+    de una vez: carga en bloque fichajes, histórico y estados, calcula los
+    cambios en memoria y los aplica con DELETE/INSERT masivos. Sin él, cada
+    empleado consulta y aplica lo suyo con el ORM. El resultado es el mismo.
+
+    ``progress(semanas_hechas, semanas_totales)`` se llama tras cada semana
+    (lo usa la cola de tareas para informar del avance). ``user_ids`` limita
+    la plantilla a esos empleados (lo usan los lotes de regularize_parallel).
+    Con ``store_group_patterns`` a False los patrones de grupo que falten se
+    calculan sin guardarlos en shift_pattern (lotes en paralelo: ver
+    tasks/regularize_parallel.py).
+    """
     app = _get_app(app)
     if app is None:
         raise RuntimeError("Flask app no disponible para regularize_range")
@@ -244,6 +275,8 @@ def regularize_range(
         query = User.query.filter(User.is_admin.is_(False), User.is_active.is_(True))
         if centro:
             query = query.filter(User.centro == centro)
+        if user_ids is not None:
+            query = query.filter(User.id.in_(user_ids))
         users = query.order_by(User.full_name.asc(), User.username.asc()).all()
 
         weeks = _week_starts(range_start, range_end, today)
@@ -252,8 +285,16 @@ def regularize_range(
         try:
             for week_start in weeks:
                 w_created = w_adjusted = w_removed = w_overtime = 0
-                for user in users:
-                    ur = _regularize_user_week(user, week_start, modified_by, pattern_cache)
+                if batched:
+                    week_results = _regularize_week_batched(
+                        users, week_start, modified_by, pattern_cache, store_group_patterns,
+                    )
+                else:
+                    week_results = [
+                        _regularize_user_week(user, week_start, modified_by, pattern_cache, store_group_patterns)
+                        for user in users
+                    ]
+                for ur in week_results:
                     if ur.created_records or ur.adjusted_records or ur.removed_records or ur.overtime_alerts:
                         result.user_results.append(ur)
                     w_created += ur.created_records
@@ -271,6 +312,8 @@ def regularize_range(
                 result.adjusted_records += w_adjusted
                 result.removed_records += w_removed
                 result.overtime_alerts += w_overtime
+                if progress is not None:
+                    progress(len(result.weeks), len(weeks))
 
             if dry_run:
                 db.session.rollback()
@@ -283,23 +326,29 @@ def regularize_range(
         return result
 
 
+def _in_week_scope(user: User, week_start: date, week_end: date) -> bool:
+    """Empleado con contrato y dado de alta en algún día de la semana."""
+    if int((user.weekly_hours or 0) * 3600) <= 0:
+        return False
+    if user.hire_date and user.hire_date > week_end:
+        return False
+    if user.termination_date and user.termination_date < week_start:
+        return False
+    return True
+
+
 def _regularize_user_week(
     user: User,
     week_start: date,
     modified_by,
     pattern_cache: dict,
+    store_group_patterns: bool = True,
 ) -> RegUserResult:
     ur = RegUserResult(user_id=user.id, username=user.username, full_name=user.full_name)
 
-    required = int((user.weekly_hours or 0) * 3600)
-    if required <= 0:
-        return ur
-
     week_days = [week_start + timedelta(days=i) for i in range(WEEK_DAYS)]
     week_end = week_days[-1]
-    if user.hire_date and user.hire_date > week_end:
-        return ur
-    if user.termination_date and user.termination_date < week_start:
+    if not _in_week_scope(user, week_start, week_end):
         return ur
 
     records = TimeRecord.query.filter(
@@ -313,14 +362,133 @@ def _regularize_user_week(
         EmployeeStatus.date >= week_start,
         EmployeeStatus.date <= week_end,
     ).all()
-    status_by_date = {s.date: s for s in statuses}
 
     # El cliente NO quiere horas extra ni descuadres: la semana debe CUADRAR al
     # contrato y ningún día puede superar el tope, capando también los días REALES.
-    # Por eso ya no se conservan intactos los días "sólidos": todos los días con
-    # actividad se recalculan (preservando la ENTRADA real) y se capan al máximo.
     _clear_week_alerts(user, week_days)
 
+    plan = _plan_user_week(
+        user, week_start, records, statuses, modified_by, pattern_cache, ur,
+        store_group_patterns=store_group_patterns,
+    )
+    for r in plan.removed:
+        db.session.delete(r)
+    for values in plan.new_records:
+        db.session.add(TimeRecord(**values))
+    for values in plan.new_statuses:
+        db.session.add(EmployeeStatus(**values))
+    return ur
+
+
+def _regularize_week_batched(
+    users: list[User],
+    week_start: date,
+    modified_by,
+    pattern_cache: dict,
+    store_group_patterns: bool = True,
+) -> list[RegUserResult]:
+    """
+    Misma regularización que _regularize_user_week para toda la plantilla de
+    una semana: una consulta (por bloque de REG_BATCH_SIZE empleados) trae los
+    fichajes de la semana, otra los estados, los turnos típicos salen de
+    shift_pattern y los cambios se aplican al final con DELETE/INSERT masivos.
+
+    Las semanas se aplican en orden antes de cargar la siguiente porque el
+    histórico de una semana incluye lo regularizado en las anteriores (por eso
+    se invalidan los patrones de las semanas siguientes tras cada escritura).
+    """
+    week_days = [week_start + timedelta(days=i) for i in range(WEEK_DAYS)]
+    week_end = week_days[-1]
+    in_scope = [u.id for u in users if _in_week_scope(u, week_start, week_end)]
+
+    records: dict[int, list[TimeRecord]] = {}
+    statuses: dict[int, list[EmployeeStatus]] = {}
+    for ids in _chunks(in_scope):
+        for r in TimeRecord.query.filter(
+            TimeRecord.user_id.in_(ids),
+            TimeRecord.date >= week_start,
+            TimeRecord.date <= week_end,
+        ).order_by(TimeRecord.user_id.asc(), TimeRecord.date.asc(), TimeRecord.check_in.asc()):
+            records.setdefault(r.user_id, []).append(r)
+        for st in EmployeeStatus.query.filter(
+            EmployeeStatus.user_id.in_(ids),
+            EmployeeStatus.date >= week_start,
+            EmployeeStatus.date <= week_end,
+        ):
+            statuses.setdefault(st.user_id, []).append(st)
+        OvertimeAlert.query.filter(
+            OvertimeAlert.user_id.in_(ids),
+            OvertimeAlert.date >= week_start,
+            OvertimeAlert.date <= week_end,
+        ).delete(synchronize_session=False)
+
+    patterns = _user_patterns(in_scope, week_start)
+    scope = set(in_scope)
+    results: list[RegUserResult] = []
+    removed_ids: list[int] = []
+    touched: set[int] = set()
+    new_records: list[dict] = []
+    new_statuses: list[dict] = []
+    for user in users:
+        ur = RegUserResult(user_id=user.id, username=user.username, full_name=user.full_name)
+        results.append(ur)
+        if user.id not in scope:
+            continue
+        plan = _plan_user_week(
+            user, week_start, records.get(user.id, []), statuses.get(user.id, []),
+            modified_by, pattern_cache, ur, user_templates=patterns[user.id][0],
+            store_group_patterns=store_group_patterns,
+        )
+        if plan.removed or plan.new_records:
+            touched.add(user.id)
+        removed_ids.extend(r.id for r in plan.removed)
+        new_records.extend(plan.new_records)
+        new_statuses.extend(plan.new_statuses)
+
+    # Los estados existentes se han modificado en memoria y los vuelca el flush.
+    for ids in _chunks(removed_ids):
+        db.session.execute(db.delete(TimeRecord).where(TimeRecord.id.in_(ids)))
+    for rows in _chunks(new_records):
+        db.session.execute(db.insert(TimeRecord).values(rows))
+    for rows in _chunks(new_statuses):
+        db.session.execute(db.insert(EmployeeStatus).values(rows))
+    # Las escrituras masivas no disparan los eventos del ORM
+    refresh_weekly_totals(db.session.connection(), {(uid, week_start) for uid in touched})
+    invalidate_shift_patterns(
+        db.session.connection(),
+        {(uid, day) for uid in touched for day in (week_start, week_end)},
+    )
+    return results
+
+
+def _chunks(items: list, size: int = REG_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _plan_user_week(
+    user: User,
+    week_start: date,
+    records: list[TimeRecord],
+    statuses: list[EmployeeStatus],
+    modified_by,
+    pattern_cache: dict,
+    ur: RegUserResult,
+    user_templates: dict | None = None,
+    store_group_patterns: bool = True,
+) -> _WeekPlan:
+    """
+    Calcula la semana regularizada de un empleado sin escribir en la sesión:
+    devuelve los fichajes a borrar y las filas nuevas. Los estados existentes
+    se actualizan directamente sobre los objetos recibidos. Sin
+    ``user_templates`` los turnos del empleado se consultan solo si hace falta.
+    """
+    plan = _WeekPlan()
+    week_days = [week_start + timedelta(days=i) for i in range(WEEK_DAYS)]
+    status_by_date = {s.date: s for s in statuses}
+
+    # Ya no se conservan intactos los días "sólidos": todos los días con
+    # actividad se recalculan (preservando la ENTRADA real) y se capan al máximo.
     recs_by_day: dict[date, list[TimeRecord]] = {}
     for r in records:
         recs_by_day.setdefault(r.date, []).append(r)
@@ -371,20 +539,22 @@ def _regularize_user_week(
     # Borra TODOS los registros de la semana (se recrean capados y cuadrados).
     for day, day_recs in recs_by_day.items():
         for r in day_recs:
-            db.session.delete(r)
+            plan.removed.append(r)
             ur.removed_records += 1
 
     if target_seconds <= 0 or not target_days:
         for day in list(soft_days):
             _sync_status_after_clear(status_by_date, day, {})
-        return ur
+        return plan
 
     # Reparte el objetivo entre los días, cuadrando exacto dentro de [MIN, tope].
     cap_by_day = {d: _day_cap(d, soft_days.get(d)) for d in target_days}
     dur_by_day = _distribute_capped(target_seconds, target_days, cap_by_day, user)
 
-    templates = _templates_by_weekday(_user_history_records(user.id, week_start), "histórico empleado")
-    group_templates, _ = _get_group_history(user, week_start, pattern_cache)
+    templates = user_templates
+    if templates is None:
+        templates, _ = _user_patterns([user.id], week_start)[user.id]
+    group_templates, _ = _get_group_history(user, week_start, pattern_cache, store=store_group_patterns)
 
     for day in target_days:
         dur = dur_by_day.get(day, 0)
@@ -413,7 +583,7 @@ def _regularize_user_week(
         if check_out <= check_in:
             continue
 
-        db.session.add(TimeRecord(
+        plan.new_records.append(dict(
             user_id=user.id, check_in=check_in, check_out=check_out, date=day,
             notes=REG_REAL_IN_NOTE if has_real_in else REG_NOTE,
             modified_by=modified_by,
@@ -426,19 +596,17 @@ def _regularize_user_week(
             st.entry_time = check_in.time()
             st.exit_time = check_out.time()
         else:
-            new_st = EmployeeStatus(
+            plan.new_statuses.append(dict(
                 user_id=user.id, date=day, status="Trabajado",
                 entry_time=check_in.time(), exit_time=check_out.time(), notes=REG_NOTE,
-            )
-            db.session.add(new_st)
-            status_by_date[day] = new_st
+            ))
 
     # Días con actividad que quedaron fuera del reparto: limpia su estado colgante.
     for day in list(soft_days):
         if day not in target_days:
             _sync_status_after_clear(status_by_date, day, {})
 
-    return ur
+    return plan
 
 
 def _extend_with_generated_days(
@@ -0,0 +1,266 @@
+"""
+Regularización en paralelo por lotes de empleados.
+
+Cada empleado se regulariza con su propio histórico, así que la plantilla
+puede repartirse en lotes (por centro o por cubos de user_id) que se ejecutan
+en procesos distintos, cada uno con su propio engine y su propia transacción:
+si un lote falla se deshace entero y el resto se confirma igualmente. El
+informe final suma los RegResult de todos los lotes y lista los fallidos en
+``failed_shards``.
+
+Lo que los lotes SÍ comparten son las filas de grupo de shift_pattern (por
+jornada y categoría, con el histórico de todos los centros). Si cada lote las
+guardase o borrase dentro de su transacción, en PostgreSQL el segundo lote
+esperaría en el índice único (o en el DELETE) a que el primero confirmase
+todo el rango, y dos lotes que llegasen a dos grupos en orden contrario se
+bloquearían entre sí. Por eso, antes de repartir, el proceso padre guarda y
+confirma los patrones de grupo de la primera semana (la regularización no
+toca su histórico) y borra los de grupo de las semanas siguientes que el rango
+invalidará. Los lotes calculan esos patrones en memoria sin guardarlos
+(store_group_patterns=False), con lo confirmado más los cambios de su propio
+lote: en rangos de varias semanas la plantilla de grupo de las semanas
+posteriores puede diferir un poco de la de una ejecución en serie.
+
+Uso:
+    python -m tasks.regularize_parallel 2026-03-02 2026-06-28
+    python -m tasks.regularize_parallel 2026-03-02 2026-06-28 --workers 4 --shard-by users
+    python -m tasks.regularize_parallel 2026-03-02 2026-06-28 --dry-run
+
+Con SQLite en memoria no hay procesos que compartan la BD: los lotes se
+ejecutan uno tras otro en el propio proceso.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import delete
+from sqlalchemy.engine import make_url
+
+from models.database import db
+from models.models import ShiftPattern, User
+from models.shift_patterns import HISTORY_DAYS
+from tasks.autofill import _get_group_history
+from tasks.regularize import RegResult, _get_app, _week_starts, regularize_range
+
+
+SHARD_MODES = ("centro", "users")
+NO_CENTRO_LABEL = "(sin centro)"
+
+_shard_apps: dict[str, Flask] = {}
+
+
+def regularize_range_parallel(
+    range_start: date,
+    range_end: date,
+    app=None,
+    today: date | None = None,
+    dry_run: bool = False,
+    centro: str | None = None,
+    modified_by: int | None = None,
+    workers: int | None = None,
+    shard_by: str = "centro",
+) -> RegResult:
+    """
+    Igual que regularize_range pero repartiendo la plantilla en lotes
+    (``shard_by`` = "centro" o "users") sobre un ProcessPoolExecutor de
+    ``workers`` procesos (por defecto uno por lote, hasta el nº de CPUs).
+    """
+    if shard_by not in SHARD_MODES:
+        raise ValueError(f"shard_by debe ser uno de {SHARD_MODES}")
+    app = _get_app(app)
+    if app is None:
+        raise RuntimeError("Flask app no disponible para regularize_range_parallel")
+
+    today = today or date.today()
+    workers = workers or multiprocessing.cpu_count()
+    with app.app_context():
+        shards = _build_shards(centro, shard_by, workers)
+        uri = db.engine.url.render_as_string(hide_password=False)
+    if not shards:
+        return regularize_range(range_start, range_end, app=app, today=today,
+                                dry_run=dry_run, centro=centro, modified_by=modified_by)
+    with app.app_context():
+        _prepare_group_patterns(range_start, range_end, today, centro)
+
+    args = (range_start, range_end, today, dry_run, modified_by)
+    outcomes = []
+    if _is_memory_sqlite(uri):
+        for label, user_ids in shards:
+            outcomes.append(_run_shard_with_app(app, label, user_ids, *args))
+    else:
+        engine_options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+        # spawn: los procesos hijos no heredan conexiones ni hilos (scheduler) del padre
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=context) as pool:
+            futures = [
+                pool.submit(_run_shard, uri, engine_options, label, user_ids, *args)
+                for label, user_ids in shards
+            ]
+            outcomes = [future.result() for future in as_completed(futures)]
+
+    # Orden estable del informe, independiente de qué lote terminó antes
+    order = {label: i for i, (label, _) in enumerate(shards)}
+    outcomes.sort(key=lambda outcome: order[outcome[0]])
+    return _merge_results(range_start, range_end, dry_run, outcomes, dict(shards))
+
+
+def _build_shards(centro: str | None, shard_by: str, workers: int) -> list[tuple[str, list[int]]]:
+    """Lotes (etiqueta, user_ids) con la misma plantilla que regularize_range."""
+    query = db.session.query(User.id, User.centro).filter(
+        User.is_admin.is_(False), User.is_active.is_(True)
+    )
+    if centro:
+        query = query.filter(User.centro == centro)
+    rows = query.order_by(User.id).all()
+
+    groups: dict[str, list[int]] = {}
+    if shard_by == "centro":
+        for user_id, user_centro in rows:
+            groups.setdefault(user_centro or NO_CENTRO_LABEL, []).append(user_id)
+    else:
+        buckets = max(1, min(workers, len(rows)))
+        for user_id, _ in rows:
+            groups.setdefault(f"usuarios {user_id % buckets + 1}/{buckets}", []).append(user_id)
+    return sorted(groups.items())
+
+
+def _prepare_group_patterns(range_start: date, range_end: date, today: date, centro: str | None) -> None:
+    """
+    Deja confirmados los patrones de grupo que comparten los lotes (ver el
+    docstring del módulo): guarda los de la primera semana y borra los de las
+    semanas que la regularización del rango va a invalidar.
+    """
+    weeks = _week_starts(range_start, range_end, today)
+    if not weeks:
+        return
+    db.session.execute(
+        delete(ShiftPattern).where(
+            ShiftPattern.user_id.is_(None),
+            ShiftPattern.week_start > weeks[0],
+            ShiftPattern.week_start <= weeks[-1] + timedelta(days=6 + HISTORY_DAYS),
+        )
+    )
+    query = User.query.filter(User.is_admin.is_(False), User.is_active.is_(True))
+    if centro:
+        query = query.filter(User.centro == centro)
+    # Un empleado por jornada y categoría basta para calcular cada grupo
+    representatives = {(int(u.weekly_hours or 0), u.categoria or ""): u for u in query}
+    cache: dict = {}
+    for user in representatives.values():
+        _get_group_history(user, weeks[0], cache)
+    db.session.commit()
+
+
+def _is_memory_sqlite(uri: str) -> bool:
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _shard_app(uri: str, engine_options: dict) -> Flask:
+    """App mínima (solo la BD) por proceso: cada lote usa su propio engine."""
+    app = _shard_apps.get(uri)
+    if app is None:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = uri
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
+        app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        db.init_app(app)
+        _shard_apps[uri] = app
+    return app
+
+
+def _run_shard(uri, engine_options, label, user_ids, range_start, range_end, today,
+               dry_run, modified_by):
+    """Punto de entrada en el proceso hijo."""
+    return _run_shard_with_app(_shard_app(uri, engine_options), label, user_ids,
+                               range_start, range_end, today, dry_run, modified_by)
+
+
+def _run_shard_with_app(app, label, user_ids, range_start, range_end, today, dry_run, modified_by):
+    # regularize_range confirma al final o deshace todo el lote si algo falla.
+    # Los patrones de grupo no se guardan: los comparten todos los lotes
+    try:
+        result = regularize_range(
+            range_start, range_end, app=app, today=today, dry_run=dry_run,
+            modified_by=modified_by, user_ids=user_ids, store_group_patterns=False,
+        )
+    except Exception as exc:
+        return label, None, f"{type(exc).__name__}: {exc}"
+    return label, result, None
+
+
+def _merge_results(range_start, range_end, dry_run, outcomes, shard_users) -> RegResult:
+    merged = RegResult(range_start=range_start, range_end=range_end, dry_run=dry_run)
+    weeks: dict[date, dict] = {}
+    for label, result, error in outcomes:
+        if error is not None:
+            merged.failed_shards.append({
+                "shard": label,
+                "users": len(shard_users[label]),
+                "error": error,
+            })
+            continue
+        for week in result.weeks:
+            acc = weeks.setdefault(week["week_start"], {
+                "week_start": week["week_start"],
+                "created_records": 0,
+                "adjusted_records": 0,
+                "removed_records": 0,
+                "overtime_alerts": 0,
+            })
+            for key in ("created_records", "adjusted_records", "removed_records", "overtime_alerts"):
+                acc[key] += week[key]
+        merged.created_records += result.created_records
+        merged.adjusted_records += result.adjusted_records
+        merged.removed_records += result.removed_records
+        merged.overtime_alerts += result.overtime_alerts
+        merged.user_results.extend(result.user_results)
+    merged.weeks = [weeks[key] for key in sorted(weeks)]
+    return merged
+
+
+def _parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("range_start", type=_parse_date)
+    parser.add_argument("range_end", type=_parse_date)
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto nº de CPUs)")
+    parser.add_argument("--shard-by", choices=SHARD_MODES, default="centro")
+    parser.add_argument("--centro", default=None, help="Limitar a un centro")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    from main import app
+
+    result = regularize_range_parallel(
+        args.range_start, args.range_end, app=app, dry_run=args.dry_run,
+        centro=args.centro, workers=args.workers, shard_by=args.shard_by,
+    )
+    mode = "SIMULACIÓN" if args.dry_run else "APLICADO"
+    print(f"Regularización {args.range_start} … {args.range_end} ({mode}), lotes por {args.shard_by}:")
+    for week in result.weeks:
+        print(
+            f"  Semana {week['week_start']}: {week['created_records']} creado(s), "
+            f"{week['removed_records']} eliminado(s), {week['overtime_alerts']} aviso(s)"
+        )
+    print(
+        f"TOTAL: {result.created_records} creado(s), {result.removed_records} eliminado(s), "
+        f"{len(result.user_results)} empleado-semana(s) con cambios."
+    )
+    for failure in result.failed_shards:
+        print(f"  LOTE FALLIDO {failure['shard']} ({failure['users']} empleados): {failure['error']}")
+    if result.failed_shards:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
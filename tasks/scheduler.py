@@ -2,6 +2,7 @@
 Scheduled tasks for the TimeTracker application.
 """
 
+import logging
 import os
 from datetime import datetime, date, time as dt_time
 from zoneinfo import ZoneInfo
@@ -14,6 +15,8 @@ from models.database import db
 
 AUTO_CLOSE_NOTE = "CA"
 
+logger = logging.getLogger(__name__)
+
 
 def _get_app(explicit_app=None):
     """Return a Flask app instance whether we're inside a request/context or not."""
@@ -59,9 +62,65 @@ def close_open_record(record: TimeRecord):
         # Sin base para estimar: no inventamos una salida (nada de 23:59).
         return None
 
+    _apply_auto_close(record, auto_close_time)
+    return auto_close_time
+
+
+def close_open_records(records: list[TimeRecord]) -> list:
+    """
+    Batch version of close_open_record, with the same result as calling it
+    for each record in order: check-outs are estimated in bulk
+    (estimate_auto_close_times) and the records that can be closed are closed.
+    Returns the check-out used for each record, or None where it was left open.
+    """
+    from tasks.autofill import estimate_auto_close_times
+
+    closed = []
+    for batch in _independent_batches(records):
+        # Savepoint por lote: lo que la estimación llegase a escribir (patrones
+        # guardados) se deshace antes de repetir el lote registro a registro
+        savepoint = db.session.begin_nested()
+        try:
+            estimates = estimate_auto_close_times(batch)
+            savepoint.commit()
+        except Exception:
+            savepoint.rollback()
+            logger.exception(
+                "Batch auto-close estimate failed for %s records; falling back to one by one",
+                len(batch),
+            )
+            closed.extend(close_open_record(record) for record in batch)
+            continue
+        for record, auto_close_time in zip(batch, estimates):
+            if auto_close_time is not None:
+                _apply_auto_close(record, auto_close_time)
+        closed.extend(estimates)
+    return closed
+
+
+def _independent_batches(records: list[TimeRecord]):
+    """
+    Cerrar un fichaje cambia el histórico de las semanas POSTERIORES (y con él
+    su estimación), nunca el de la suya ni anteriores. Un lote se corta cuando
+    llega un registro de una semana posterior a alguna ya vista en el lote, así
+    ninguna estimación del lote depende de otro cierre del mismo lote.
+    """
+    batch = []
+    earliest_week = None
+    for record in records:
+        week = _monday_of(record.date)
+        if batch and week > earliest_week:
+            yield batch
+            batch = []
+        earliest_week = week if not batch else min(earliest_week, week)
+        batch.append(record)
+    if batch:
+        yield batch
+
+
+def _apply_auto_close(record: TimeRecord, auto_close_time) -> None:
     record.check_out = auto_close_time
     record.notes = (record.notes or "") + (" - " if record.notes else "") + AUTO_CLOSE_NOTE
-    return auto_close_time
 
 
 def auto_close_open_records(include_today: bool = True, app=None):
@@ -91,14 +150,14 @@ def auto_close_open_records(include_today: bool = True, app=None):
             if not include_today:
                 query = query.filter(TimeRecord.date < today)
 
-            open_records = query.all()
+            # Por fecha: cada semana se cierra con el histórico de las anteriores ya cerrado
+            open_records = query.order_by(TimeRecord.date.asc(), TimeRecord.id.asc()).all()
 
             if open_records:
                 app.logger.info(f"Auto-closing {len(open_records)} open time records")
 
                 closed = 0
-                for record in open_records:
-                    auto_close_time = close_open_record(record)
+                for record, auto_close_time in zip(open_records, close_open_records(open_records)):
                     if auto_close_time is None:
                         # No se pudo estimar: se deja abierto para la regularización.
                         continue
@@ -162,6 +221,16 @@ def run_scheduled_auto_tasks(app=None):
                     regularize_result.removed_records,
                     regularize_result.overtime_alerts,
                 )
+                # La semana que empieza hoy ya tiene todo su histórico cerrado
+                from tasks.shift_patterns import refresh as refresh_shift_patterns
+
+                employees, groups = refresh_shift_patterns(_monday_of(today), app=app, verbose=False)
+                app.logger.info(
+                    "Shift patterns precomputed for week %s: %s employees, %s groups",
+                    _monday_of(today),
+                    employees,
+                    groups,
+                )
             else:
                 app.logger.info("Weekly regularization skipped: today is not Monday")
     except Exception as e:
@@ -203,7 +272,7 @@ def manual_auto_close_records(target_date=None, app=None):
                 open_records = TimeRecord.query.filter(
                     TimeRecord.check_in.isnot(None),
                     TimeRecord.check_out.is_(None)
-                ).all()
+                ).order_by(TimeRecord.date.asc(), TimeRecord.id.asc()).all()
                 app.logger.info(f"Manual auto-closing ALL {len(open_records)} open time records")
             else:
                 open_records = TimeRecord.query.filter(
@@ -216,8 +285,7 @@ def manual_auto_close_records(target_date=None, app=None):
                 )
 
             if open_records:
-                for record in open_records:
-                    auto_close_time = close_open_record(record)
+                for record, auto_close_time in zip(open_records, close_open_records(open_records)):
                     app.logger.info(
                         f"Closed record {record.id} for user {record.user_id} at {auto_close_time}"
                     )
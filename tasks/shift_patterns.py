@@ -0,0 +1,71 @@
+"""
+Precálculo de la tabla shift_pattern.
+
+Los turnos típicos se calculan al primer uso y se invalidan solos cuando
+cambian los fichajes; este comando los recalcula para una semana completa
+(por defecto la actual) de una vez, para que autofichaje, regularización y
+cierre automático los encuentren ya hechos. El scheduler lo lanza cada lunes
+al cerrar la semana; también sirve tras cargas masivas o restauraciones.
+
+Uso:
+    python -m tasks.shift_patterns                 # semana en curso
+    python -m tasks.shift_patterns 2026-06-01      # semana de esa fecha
+"""
+
+from __future__ import annotations
+
+import sys
+from datetime import date, datetime
+
+from models.database import db
+from models.models import ShiftPattern, User
+
+
+def refresh(week_start: date | None = None, app=None, verbose: bool = True) -> tuple[int, int]:
+    """
+    Borra y recalcula los patrones de la semana de ``week_start`` para todos
+    los empleados activos y sus grupos. Devuelve (empleados, grupos).
+    """
+    from tasks.autofill import _get_app, _group_patterns, _user_patterns, normalize_week_start
+
+    app = _get_app(app)
+    if app is None:
+        raise RuntimeError("Flask app no disponible para recalcular shift_pattern")
+
+    week_start = normalize_week_start(week_start or date.today())
+    with app.app_context():
+        try:
+            db.session.execute(db.delete(ShiftPattern).where(ShiftPattern.week_start == week_start))
+            employees = db.session.execute(
+                db.select(User.id, User.weekly_hours, User.categoria)
+                .where(User.is_admin.is_(False), User.is_active.is_(True))
+                .order_by(User.id)
+            ).all()
+            _user_patterns([row.id for row in employees], week_start)
+
+            groups = set()
+            for row in employees:
+                hours = int(row.weekly_hours or 0)
+                groups.add((hours, row.categoria or None))
+                groups.add((hours, None))
+            for hours, category in sorted(groups, key=lambda item: (item[0], item[1] or "")):
+                _group_patterns(week_start, weekly_hours=hours, category=category)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    if verbose:
+        print(f"shift_pattern semana {week_start}: {len(employees)} empleado(s), {len(groups)} grupo(s).")
+    return len(employees), len(groups)
+
+
+def main(argv: list[str]) -> None:
+    from main import app
+
+    week_start = datetime.strptime(argv[0], "%Y-%m-%d").date() if argv else None
+    refresh(week_start=week_start, app=app)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
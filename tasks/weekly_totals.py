@@ -0,0 +1,51 @@
+"""
+Reconstrucción de la tabla weekly_user_totals.
+
+La tabla se mantiene sola con cada cambio de fichajes hecho con el ORM; este
+comando la recalcula desde time_record tras cargas masivas, restauraciones de
+copia o si se sospecha que se ha desincronizado.
+
+Uso:
+    python -m tasks.weekly_totals                 # toda la tabla
+    python -m tasks.weekly_totals 2026-06-01      # desde la semana de esa fecha
+"""
+
+from __future__ import annotations
+
+import sys
+from datetime import date, datetime
+
+from models.database import db
+from models.weekly_totals import rebuild_weekly_totals
+
+
+def rebuild(app=None, since: date | None = None, verbose: bool = True) -> int:
+    from tasks.autofill import _get_app  # reutiliza la resolución de app
+
+    app = _get_app(app)
+    if app is None:
+        raise RuntimeError("Flask app no disponible para reconstruir weekly_user_totals")
+
+    with app.app_context():
+        try:
+            rows = rebuild_weekly_totals(db.session.connection(), since=since)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    if verbose:
+        scope = f"desde {since}" if since else "completa"
+        print(f"weekly_user_totals reconstruida ({scope}): {rows} fila(s).")
+    return rows
+
+
+def main(argv: list[str]) -> None:
+    from main import app
+
+    since = datetime.strptime(argv[0], "%Y-%m-%d").date() if argv else None
+    rebuild(app=app, since=since)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+"""
+Worker de la cola de tareas (tabla job) para ejecutar autofichajes y
+regularizaciones fuera del proceso web (JOB_RUNNER=worker).
+
+Uso:
+    python -m tasks.worker                 # bucle; consulta la cola cada 5 s
+    python -m tasks.worker --poll 2
+    python -m tasks.worker --once          # vacía la cola y termina (cron)
+
+SIGTERM/SIGINT dejan terminar la tarea en curso antes de salir.
+"""
+
+from __future__ import annotations
+
+import argparse
+import signal
+import sys
+import threading
+
+from tasks.jobs import _default_worker_name, requeue_stale_jobs, run_pending_jobs
+
+
+def work(app, poll_seconds: float = 5.0, once: bool = False, name: str | None = None,
+         stop: threading.Event | None = None) -> int:
+    """Procesa la cola hasta que se pida parar (o hasta vaciarla con ``once``)."""
+    stop = stop or threading.Event()
+    name = name or _default_worker_name()
+    processed = 0
+    while not stop.is_set():
+        with app.app_context():
+            requeued = requeue_stale_jobs()
+        if requeued:
+            print(f"[worker] {requeued} tarea(s) colgada(s) devueltas a la cola", flush=True)
+        processed += run_pending_jobs(app, worker_name=name, should_stop=stop.is_set)
+        if once:
+            break
+        stop.wait(poll_seconds)
+    return processed
+
+
+def main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--poll", type=float, default=5.0, help="Segundos entre consultas a la cola")
+    parser.add_argument("--once", action="store_true", help="Vaciar la cola y terminar")
+    parser.add_argument("--name", help="Identificador del worker (por defecto host:pid)")
+    args = parser.parse_args(argv)
+
+    from main import app
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    print(f"[worker] escuchando la cola (poll {args.poll}s)", flush=True)
+    processed = work(app, poll_seconds=args.poll, once=args.once, name=args.name, stop=stop)
+    print(f"[worker] {processed} tarea(s) procesada(s)", flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
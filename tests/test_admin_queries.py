@@ -0,0 +1,175 @@
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import EmployeeStatus, TimeRecord, User
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.export import export_bp
+from routes.time import time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Consultas máximas por página del panel con 5 empleados y una semana de fichajes
+QUERY_BUDGETS = {
+    "/admin/dashboard": 6,
+    "/admin/users": 4,
+    "/admin/records": 4,
+    "/admin/records?time_from=09:00&time_to=18:00": 4,
+    "/admin/open_records": 2,
+    "/admin/calendar": 1,
+    "/excel": 2,
+}
+
+
+class AdminQueryCountTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        for bp in (auth_bp, time_bp, admin_bp, export_bp):
+            self.app.register_blueprint(bp)
+        # Cada petición del cliente abre su propio contexto (y su propio flask.g),
+        # como en producción: no se deja ningún contexto de aplicación empujado.
+        with self.app.app_context():
+            db.create_all()
+            admin_id = self._user("jefa", is_admin=True).id
+            today = date.today()
+            for i in range(5):
+                user = self._user(f"emp{i}")
+                for off in range(7):
+                    day = today - timedelta(days=off)
+                    ci = datetime.combine(day, time(9, 0))
+                    db.session.add(TimeRecord(user_id=user.id, date=day, check_in=ci,
+                                              check_out=ci + timedelta(hours=4)))
+                    db.session.add(EmployeeStatus(user_id=user.id, date=day, status="Trabajado"))
+            db.session.commit()
+            self.engine = db.engine
+        self.admin_id = admin_id
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = admin_id
+            sess["is_admin"] = True
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username, is_admin=False):
+        user = User(
+            username=username, full_name=username.title(),
+            email=f"{username}@example.com", is_admin=is_admin, is_active=True,
+            weekly_hours=20, categoria="Reparto", centro="Hortaleza",
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def _get(self, url):
+        return self._get_with(url, {})
+
+    def _get_with(self, url, headers):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(self.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get(url, headers=headers)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", record)
+        return response, statements
+
+    def test_admin_pages_stay_within_query_budget(self):
+        for url, budget in QUERY_BUDGETS.items():
+            with self.subTest(url=url):
+                response, statements = self._get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(statements), budget,
+                                     "\n".join(s for s, _ in statements))
+
+    def test_current_user_is_loaded_once_per_request(self):
+        for url in QUERY_BUDGETS:
+            with self.subTest(url=url):
+                _, statements = self._get(url)
+                lookups = [
+                    s for s, params in statements
+                    if "FROM user" in s and tuple(params) == (self.admin_id,)
+                ]
+                self.assertEqual(len(lookups), 1, "\n".join(lookups))
+
+    def test_query_count_does_not_grow_with_records(self):
+        pages = ["/admin/dashboard", "/admin/records", "/admin/open_records",
+                 f"/excel_daily?fecha={date.today()}"]
+        before = {url: len(self._get(url)[1]) for url in pages}
+
+        with self.app.app_context():
+            today = date.today()
+            for i in range(30):
+                user = self._user(f"extra{i}")
+                for off in range(7):
+                    day = today - timedelta(days=off)
+                    ci = datetime.combine(day, time(8, 0))
+                    db.session.add(TimeRecord(user_id=user.id, date=day, check_in=ci,
+                                              check_out=ci + timedelta(hours=3),
+                                              modified_by=self.admin_id))
+                # un fichaje abierto por empleado para open_records
+                db.session.add(TimeRecord(user_id=user.id, date=today,
+                                          check_in=datetime.combine(today, time(17, 0))))
+            db.session.commit()
+
+        after = {url: len(self._get(url)[1]) for url in pages}
+        self.assertEqual(after, before)
+
+    def test_calendar_events_require_bounded_window(self):
+        today = date.today()
+        self.assertEqual(self.client.get("/admin/api/events").status_code, 400)
+        too_wide = f"/admin/api/events?start={today - timedelta(days=90)}&end={today}"
+        self.assertEqual(self.client.get(too_wide).status_code, 400)
+        reversed_range = f"/admin/api/events?start={today}&end={today - timedelta(days=1)}"
+        self.assertEqual(self.client.get(reversed_range).status_code, 400)
+
+    def test_calendar_events_use_etag_and_constant_queries(self):
+        today = date.today()
+        url = f"/admin/api/events?start={today - timedelta(days=41)}&end={today}"
+        response, statements = self._get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), 35)
+        self.assertEqual(response.get_json()[0]["title"].split(" - ")[0], "Trabajado")
+        # sesión + sello del ETag + eventos con su empleado
+        self.assertEqual(len(statements), 3, "\n".join(s for s, _ in statements))
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+
+        cached, statements = self._get_with(url, {"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(statements), 2)
+
+        with self.app.app_context():
+            status = db.session.scalars(db.select(EmployeeStatus).limit(1)).one()
+            status.status = "Baja"
+            status.updated_at = datetime.utcnow() + timedelta(seconds=1)
+            db.session.commit()
+        changed = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
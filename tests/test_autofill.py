@@ -1,12 +1,14 @@
 import unittest
 from datetime import date, datetime, time, timedelta
+from unittest import mock
 
 from flask import Flask
+from sqlalchemy import event
 
 from models.database import db
-from models.models import EmployeeStatus, TimeRecord, User
-from tasks.autofill import autofill_week, estimate_auto_close_time
-from tasks.scheduler import close_open_record
+from models.models import EmployeeStatus, ShiftPattern, TimeRecord, User
+from tasks.autofill import autofill_week, estimate_auto_close_time, estimate_auto_close_times
+from tasks.scheduler import close_open_record, close_open_records
 
 
 class AutoFillWeekTestCase(unittest.TestCase):
@@ -277,6 +279,135 @@ class AutoFillWeekTestCase(unittest.TestCase):
         self.assertEqual(self._worked_seconds(user), worked_after_first)
         self.assertWeekBelowContract(user, 8)
 
+    def _created_snapshot(self):
+        records = TimeRecord.query.filter(TimeRecord.notes == "AA").all()
+        statuses = EmployeeStatus.query.filter(EmployeeStatus.status == "Trabajado").all()
+        return (
+            sorted((r.user_id, r.date, r.check_in, r.check_out) for r in records),
+            sorted((s.user_id, s.date, s.entry_time, s.exit_time) for s in statuses),
+        )
+
+    def test_batched_mode_matches_per_user_mode(self):
+        historic = self._user("historico40", weekly_hours=40)
+        self._full_history_weeks(historic)
+        self._record(historic, self.week_start, start_hour=9, hours=4)
+        veteran = self._user("veterano20", weekly_hours=20, categoria="Cocina")
+        self._full_history_weeks(veteran, start_hour=12, hours=5, days=4)
+        for index in range(4):
+            self._user(f"nuevo20_{index}", weekly_hours=20, categoria="Cocina")
+        on_leave = self._user("vacaciones15", weekly_hours=15)
+        db.session.add(EmployeeStatus(user_id=on_leave.id, date=self.week_start, status="Vacaciones"))
+        db.session.add(EmployeeStatus(
+            user_id=historic.id, date=self.week_start + timedelta(days=2), status="Ausente",
+        ))
+        db.session.commit()
+        hired_later = self._user("alta_futura", weekly_hours=20)
+        hired_later.hire_date = self.week_start + timedelta(days=14)
+        db.session.commit()
+
+        per_user = autofill_week(self.week_start, app=self.app, commit=False, batched=False)
+        per_user_created = self._created_snapshot()
+        db.session.rollback()
+
+        batched = autofill_week(self.week_start, app=self.app, commit=False, batched=True)
+        batched_created = self._created_snapshot()
+        db.session.rollback()
+
+        self.assertGreater(per_user.created_records, 0)
+        self.assertEqual(batched, per_user)
+        self.assertEqual(batched_created, per_user_created)
+
+    def test_batch_auto_close_matches_per_record_close(self):
+        full = self._user("completa40", weekly_hours=40)
+        self._full_history_weeks(full)
+        partial = self._user("martes20", weekly_hours=20, categoria="Cocina")
+        self._full_history_weeks(partial, start_hour=12, hours=5, days=1)
+        veteran = self._user("veterano20", weekly_hours=20, categoria="Cocina")
+        self._full_history_weeks(veteran, start_hour=16, hours=4, days=4)
+        newcomer = self._user("nuevo20", weekly_hours=20, categoria="Cocina")
+        no_contract = self._user("sinJornada", weekly_hours=0)
+
+        open_records = []
+        for week in (0, 7):
+            for user in (full, partial, newcomer, no_contract):
+                for offset in (1, 2):
+                    day = self.week_start + timedelta(days=week + offset)
+                    record = TimeRecord(user_id=user.id, date=day,
+                                        check_in=datetime.combine(day, time(10, 0)))
+                    db.session.add(record)
+                    open_records.append(record)
+        db.session.commit()
+        open_records.sort(key=lambda record: (record.date, record.id))
+
+        per_record = [close_open_record(record) for record in open_records]
+        db.session.flush()
+        per_record_state = [(r.check_out, r.notes) for r in open_records]
+        db.session.rollback()
+
+        batched = close_open_records(open_records)
+        db.session.flush()
+        batched_state = [(r.check_out, r.notes) for r in open_records]
+        db.session.rollback()
+
+        self.assertEqual(batched, per_record)
+        self.assertEqual(batched_state, per_record_state)
+        self.assertEqual(sum(value is None for value in batched), 4)
+
+    def test_failed_batch_estimate_rolls_back_and_falls_back(self):
+        user = self._user("completa40", weekly_hours=40)
+        self._full_history_weeks(user)
+        record = TimeRecord(user_id=user.id, date=self.week_start,
+                            check_in=datetime.combine(self.week_start, time(10, 0)))
+        db.session.add(record)
+        db.session.commit()
+        expected = estimate_auto_close_time(record, store=False)
+
+        def failing_estimate(batch):
+            db.session.add(ShiftPattern(week_start=self.week_start, user_id=user.id, weekday=0))
+            db.session.flush()
+            raise RuntimeError("estimación rota")
+
+        with mock.patch("tasks.autofill.estimate_auto_close_times", failing_estimate), \
+                self.assertLogs("tasks.scheduler", level="ERROR") as logs:
+            closed = close_open_records([record])
+
+        self.assertEqual(closed, [expected])
+        self.assertEqual(record.check_out, expected)
+        self.assertIn("estimación rota", logs.output[0])
+        # La fila a medias del lote fallido no sobrevive; solo las del cierre uno a uno
+        db.session.commit()
+        self.assertEqual(ShiftPattern.query.filter_by(user_id=user.id, weekday=0, start_seconds=None).count(), 0)
+
+    def test_batch_estimate_queries_do_not_grow_with_records(self):
+        users = [self._user(f"emp{i}", weekly_hours=20, categoria="Cocina") for i in range(6)]
+        self._full_history_weeks(users[0], start_hour=12, hours=5, days=4)
+        records = []
+        for user in users:
+            for offset in range(3):
+                day = self.week_start + timedelta(days=offset)
+                records.append(TimeRecord(user_id=user.id, date=day,
+                                          check_in=datetime.combine(day, time(10, 0))))
+        db.session.add_all(records)
+        db.session.commit()
+
+        def count_statements(batch):
+            statements = []
+            [record.check_in for record in batch]  # recarga tras el rollback anterior
+
+            def count(*args):
+                statements.append(args[2])
+
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                estimate_auto_close_times(batch)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+            db.session.rollback()
+            return len(statements)
+
+        first_day = [record for record in records if record.date == self.week_start]
+        self.assertEqual(count_statements(first_day), count_statements(records))
+
 
 if __name__ == "__main__":
     unittest.main()
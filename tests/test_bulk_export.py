@@ -0,0 +1,174 @@
+import csv
+import gzip
+import io
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+
+from flask import Flask
+
+from models.database import db
+from models.models import EmployeeStatus, TimeRecord, User
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.bulk_export import BULK_COLUMNS, parquet_available
+from routes.export import _request_filters, export_bp
+from routes.time import time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class BulkExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        for bp in (auth_bp, time_bp, admin_bp, export_bp):
+            self.app.register_blueprint(bp)
+        self.monday = date(2026, 5, 4)
+        with self.app.app_context():
+            db.create_all()
+            admin_id = self._user("jefa", centro=None, is_admin=True).id
+            for index, centro in enumerate(("Hortaleza", "Las Tablas")):
+                user = self._user(f"emp{index}", centro=centro)
+                for off in range(3):
+                    day = self.monday + timedelta(days=off)
+                    check_in = datetime.combine(day, time(9, 0))
+                    db.session.add(TimeRecord(user_id=user.id, date=day, check_in=check_in,
+                                              check_out=check_in + timedelta(hours=4, minutes=30),
+                                              notes=f"nota, {off}", modified_by=admin_id))
+                db.session.add(EmployeeStatus(user_id=user.id, date=self.monday, status="Trabajado",
+                                              entry_time=time(9, 5), notes="revisado"))
+                # Día con estado y sin fichajes
+                db.session.add(EmployeeStatus(user_id=user.id, date=self.monday + timedelta(days=5),
+                                              status="Baja", notes="médico"))
+            db.session.commit()
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = admin_id
+            sess["is_admin"] = True
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username, centro, is_admin=False):
+        user = User(
+            username=username, full_name=username.title(),
+            email=f"{username}@example.com", is_admin=is_admin, is_active=True,
+            weekly_hours=20, categoria="Reparto", centro=centro,
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def _range(self, **extra):
+        return {
+            "start_date": self.monday.isoformat(),
+            "end_date": (self.monday + timedelta(days=6)).isoformat(),
+            **extra,
+        }
+
+    def test_csv_streams_records_and_status_days(self):
+        response = self.client.get("/export/csv", query_string=self._range())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, "text/csv")
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[0], BULK_COLUMNS)
+        self.assertEqual(len(rows), 1 + 2 * 4)
+        first = dict(zip(BULK_COLUMNS, rows[1]))
+        self.assertEqual(first["Usuario"], "emp0")
+        self.assertEqual(first["Centro"], "Hortaleza")
+        self.assertEqual(first["Fecha"], "2026-05-04")
+        self.assertEqual(first["Entrada"], "2026-05-04 09:00:00")
+        self.assertEqual(first["Entrada Admin"], "09:05:00")
+        self.assertEqual(first["Horas Trabajadas"], "4.5")
+        self.assertEqual(first["Notas"], "nota, 0")
+        self.assertEqual(first["Notas Admin"], "revisado")
+        self.assertEqual(first["Modificado Por"], "jefa")
+        placeholder = dict(zip(BULK_COLUMNS, rows[4]))
+        self.assertEqual((placeholder["Fecha"], placeholder["Entrada"], placeholder["Notas Admin"]),
+                         ("2026-05-09", "", "médico"))
+
+    def test_gzip_matches_csv_and_filters_apply(self):
+        plain = self.client.post("/export/csv", data=self._range(centro="Las Tablas")).get_data()
+        response = self.client.post("/export/csv", data=self._range(centro="Las Tablas", format="csv.gz"))
+
+        self.assertEqual(response.mimetype, "application/gzip")
+        self.assertIn(".csv.gz", response.headers["Content-Disposition"])
+        self.assertEqual(gzip.decompress(response.get_data()), plain)
+        self.assertNotIn(b"emp0", plain)
+        self.assertEqual(plain.count(b"emp1"), 4)
+
+    def _form(self, **fields):
+        """Todos los campos que envía el formulario de exportación (export_excel.html)."""
+        form = {name: "" for name in ("centro1", "usuario1", "centro2", "categoria2", "centro3", "horas3",
+                                      "centro4", "usuario4", "categoria4", "horas4")}
+        form.update(fields)
+        return self._range(**form)
+
+    def test_export_form_filters_apply(self):
+        response = self.client.post("/export/csv", data=self._form(centro4="Las Tablas", format="csv.gz"))
+        plain = gzip.decompress(response.get_data())
+        self.assertNotIn(b"emp0", plain)
+        self.assertEqual(plain.count(b"emp1"), 4)
+
+        with self.app.app_context():
+            emp0 = User.query.filter_by(username="emp0").one().id
+        plain = self.client.post("/export/csv", data=self._form(usuario4=str(emp0))).get_data()
+        self.assertEqual(plain.count(b"emp0"), 4)
+        self.assertNotIn(b"emp1", plain)
+
+        # Las jornadas de la fila avanzada también filtran (nadie tiene 40 h)
+        plain = self.client.post("/export/csv", data=self._form(horas4="40")).get_data()
+        self.assertEqual(len(plain.decode().splitlines()), 1)
+        self.assertEqual(self.client.post("/export/csv", data=self._form(horas4="x")).status_code, 302)
+
+    def test_request_filters_follow_pressed_button(self):
+        form = self._form(centro1="Hortaleza", usuario1="7", centro3="Las Tablas", horas3="20",
+                          centro4="Majadahonda", categoria4="Sala")
+        empty = dict(centro=None, user_id=None, categoria=None, weekly_hours=None)
+        self.assertEqual(_request_filters({**form, "excel_centro_horas": "1"}),
+                         {**empty, "centro": "Las Tablas", "weekly_hours": 20})
+        self.assertEqual(_request_filters({**form, "excel_centro_usuario": "1"}),
+                         {**empty, "centro": "Hortaleza", "user_id": "7"})
+        self.assertEqual(_request_filters({**form, "excel_solo_categoria": "1"}), {**empty, "categoria": "Sala"})
+        self.assertEqual(_request_filters(form), {**empty, "centro": "Majadahonda", "categoria": "Sala"})
+        self.assertEqual(_request_filters({"centro": "Hortaleza", "jornada": "30"}),
+                         {**empty, "centro": "Hortaleza", "weekly_hours": 30})
+
+    def test_invalid_requests_redirect(self):
+        cases = [{}, self._range(format="xlsx"), {"start_date": "2026-05-10", "end_date": "2026-05-01"}]
+        if not parquet_available():
+            cases.append(self._range(format="parquet"))
+        for data in cases:
+            with self.subTest(data=data):
+                self.assertEqual(self.client.post("/export/csv", data=data).status_code, 302)
+
+    @unittest.skipUnless(parquet_available(), "pyarrow no instalado")
+    def test_parquet_has_same_rows_as_csv(self):
+        import pyarrow.parquet as pq
+
+        response = self.client.get("/export/csv", query_string=self._range(format="parquet"))
+
+        table = pq.read_table(io.BytesIO(response.get_data()))
+        self.assertEqual(table.column_names, BULK_COLUMNS)
+        self.assertEqual(table.num_rows, 2 * 4)
+        self.assertEqual(table.column("Horas Trabajadas")[0].as_py(), 4.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import TimeRecord, User
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.export import export_bp
+from routes.time import employee_dashboard_data, time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class EmployeeDashboardTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        for bp in (auth_bp, time_bp, admin_bp, export_bp):
+            self.app.register_blueprint(bp)
+        self.today = date.today()
+        self.monday = self.today - timedelta(days=self.today.weekday())
+        with self.app.app_context():
+            db.create_all()
+            self.ana = self._user("ana", weekly_hours=20)
+            self.luis = self._user("luis", weekly_hours=None)
+            # Semana en curso: 6 h cerradas (más una abierta hoy) y un fichaje de la semana pasada
+            for day, start, hours in ((self.monday, 9, 4), (self.today, 7, 2), (self.monday - timedelta(days=3), 9, 8)):
+                check_in = datetime.combine(day, time(start, 0))
+                db.session.add(TimeRecord(user_id=self.ana, date=day, check_in=check_in,
+                                          check_out=check_in + timedelta(hours=hours)))
+            db.session.add(TimeRecord(user_id=self.ana, date=self.today,
+                                      check_in=datetime.combine(self.today, time(12, 0))))
+            db.session.add(TimeRecord(user_id=self.luis, date=self.monday,
+                                      check_in=datetime.combine(self.monday, time(9, 0)),
+                                      check_out=datetime.combine(self.monday, time(12, 0))))
+            db.session.commit()
+            self.engine = db.engine
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username, weekly_hours):
+        user = User(
+            username=username, full_name=username.title(), email=f"{username}@example.com",
+            is_admin=False, is_active=True, weekly_hours=weekly_hours, categoria="Sala", centro="Hortaleza",
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    def _login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = user_id
+
+    def test_data_in_two_queries(self):
+        statements = []
+        capture = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.app_context():
+            event.listen(self.engine, "before_cursor_execute", capture)
+            try:
+                data = employee_dashboard_data(self.ana)
+                luis = employee_dashboard_data(self.luis)
+            finally:
+                event.remove(self.engine, "before_cursor_execute", capture)
+            self.assertEqual(len(statements), 4)
+            self.assertIsNone(employee_dashboard_data(999))
+
+            self.assertEqual(data.user.username, "ana")
+            worked = 6 * 3600
+            self.assertEqual(data.worked_seconds, worked)
+            self.assertEqual(data.allowed_seconds, 20 * 3600)
+            self.assertEqual(data.remaining_seconds, 20 * 3600 - worked)
+            self.assertEqual(data.open_record.check_in, datetime.combine(self.today, time(12, 0)))
+            self.assertEqual(len(data.recent_records), 3)
+            self.assertEqual(data.recent_records[0].date, self.today)
+
+            # Sin jornada de contrato: no queda nada y no hay fichaje abierto
+            self.assertEqual((luis.worked_seconds, luis.allowed_seconds, luis.remaining_seconds), (3 * 3600, 0, 0))
+            self.assertIsNone(luis.open_record)
+
+    def test_html_and_json_variants(self):
+        self._login(self.ana)
+        response = self.client.get("/employee/dashboard")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Bienvenido, Ana", response.get_data(as_text=True))
+
+        body = self.client.get("/api/v1/dashboard").get_json()
+        self.assertEqual(body["user"]["username"], "ana")
+        self.assertEqual(body["week"]["remaining_seconds"], body["week"]["allowed_seconds"] - body["week"]["worked_seconds"])
+        self.assertEqual(body["open_record"]["check_in"], datetime.combine(self.today, time(12, 0)).isoformat())
+        self.assertEqual(len(body["recent_records"]), 3)
+
+        with self.client.session_transaction() as sess:
+            sess.clear()
+        self.assertEqual(self.client.get("/api/v1/dashboard").status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
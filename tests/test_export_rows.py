@@ -0,0 +1,166 @@
+import unittest
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import EmployeeStatus, TimeRecord, User
+from routes.export import _iter_export_rows, _week_summaries
+
+
+class ExportRowsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.monday = date(2026, 5, 4)
+
+        self.users = []
+        for index, centro in enumerate(("Hortaleza", "Las Tablas", "Hortaleza")):
+            user = User(
+                username=f"emp{index}", full_name=f"Emp {index}", email=f"emp{index}@example.com",
+                is_admin=False, is_active=True, weekly_hours=20 + 10 * index,
+                categoria="Sala", centro=centro,
+            )
+            user.set_password("secret")
+            db.session.add(user)
+            self.users.append(user)
+        db.session.commit()
+
+        for user in self.users:
+            for off in range(-1, 8):
+                day = self.monday + timedelta(days=off)
+                if off % 3 == 2:
+                    continue  # día sin fichajes
+                # Dos fichajes desordenados en el día y uno sin entrada los lunes
+                for hour in (16, 9):
+                    check_in = datetime.combine(day, time(hour, user.id))
+                    db.session.add(TimeRecord(user_id=user.id, date=day, check_in=check_in,
+                                              check_out=check_in + timedelta(hours=3), notes=f"{hour}h"))
+                if off == 0:
+                    db.session.add(TimeRecord(user_id=user.id, date=day, check_in=None,
+                                              check_out=datetime.combine(day, time(23, 0))))
+            for off in (-1, 0, 2, 4, 5, 8):
+                db.session.add(EmployeeStatus(
+                    user_id=user.id, date=self.monday + timedelta(days=off), status="Trabajado",
+                    entry_time=time(9, off + 1), notes=f"estado {off}",
+                    updated_at=None if off == 5 else datetime(2026, 5, 20, 10, off + 1),
+                ))
+        db.session.commit()
+        # Estado sin fechas de auditoría: el marcador usa la medianoche del día
+        EmployeeStatus.query.filter_by(user_id=self.users[0].id, date=self.monday + timedelta(days=5)) \
+            .update({"created_at": None})
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.ctx.pop()
+
+    def _expected(self, start, end, user_ids):
+        """Resultado de referencia calculado en Python a partir de los modelos."""
+        statuses = {
+            (s.user_id, s.date): s
+            for s in EmployeeStatus.query.filter(EmployeeStatus.date.between(start, end))
+            if s.user_id in user_ids
+        }
+        rows = []
+        record_days = set()
+        for r in TimeRecord.query.filter(TimeRecord.date.between(start, end)):
+            if r.user_id not in user_ids:
+                continue
+            record_days.add((r.user_id, r.date))
+            status = statuses.get((r.user_id, r.date))
+            rows.append(((r.user_id, r.date, r.check_in is not None, r.check_in or datetime.min, r.id),
+                         (r.user_id, r.date, r.check_in, r.check_out, r.notes, r.modified_by, r.updated_at),
+                         status))
+        for key, s in statuses.items():
+            if key not in record_days:
+                updated = s.updated_at or s.created_at or datetime.combine(s.date, datetime.min.time())
+                rows.append(((s.user_id, s.date, False, datetime.min, 0),
+                             (s.user_id, s.date, None, None, None, None, updated), s))
+        rows.sort(key=lambda row: row[0])
+        return [
+            (record, None if s is None else
+             (s.user_id, s.date, s.notes, s.entry_time, s.exit_time, s.created_at, s.updated_at))
+            for _, record, s in rows
+        ]
+
+    def _actual(self, start, end, **filters):
+        return [
+            (tuple(record), None if status is None else tuple(status))
+            for record, status in _iter_export_rows(start, end, **filters)
+        ]
+
+    def test_rows_match_reference_with_union_and_full_outer_join(self):
+        start, end = self.monday, self.monday + timedelta(days=6)
+        hortaleza = {self.users[0].id, self.users[2].id}
+        cases = [
+            ({}, {u.id for u in self.users}),
+            ({"centro": "Hortaleza"}, hortaleza),
+            ({"user_id": self.users[1].id}, {self.users[1].id}),
+            ({"weekly_hours": 40}, {self.users[2].id}),
+        ]
+        for full_join in (False, True):
+            with mock.patch("routes.export._supports_full_outer_join", return_value=full_join):
+                for filters, user_ids in cases:
+                    with self.subTest(full_join=full_join, filters=filters):
+                        self.assertEqual(self._actual(start, end, **filters),
+                                         self._expected(start, end, user_ids))
+
+    def test_single_query(self):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            rows = list(_iter_export_rows(self.monday, self.monday + timedelta(days=6)))
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+        self.assertTrue(rows)
+        self.assertEqual(len(statements), 1)
+        self.assertIn("UNION ALL", statements[0])
+
+    def test_week_summaries_match_records(self):
+        # Fichaje abierto: no cuenta en los totales
+        day = self.monday + timedelta(days=3)
+        db.session.add(TimeRecord(user_id=self.users[0].id, date=day,
+                                  check_in=datetime.combine(day, time(20, 0))))
+        db.session.commit()
+
+        for start, end in (
+            (self.monday - timedelta(days=1), self.monday + timedelta(days=8)),  # bordes + semana completa
+            (self.monday + timedelta(days=1), self.monday + timedelta(days=5)),  # dentro de una semana
+            (self.monday, self.monday + timedelta(days=6)),                      # solo la semana completa
+        ):
+            for filters, user_ids in (({}, {u.id for u in self.users}), ({"centro": "Las Tablas"}, {self.users[1].id})):
+                expected = {}
+                for r in TimeRecord.query.filter(TimeRecord.date.between(start, end)):
+                    if r.user_id in user_ids and r.check_in and r.check_out:
+                        key = (r.user_id, r.date - timedelta(days=r.date.weekday()))
+                        expected[key] = expected.get(key, 0) + (r.check_out - r.check_in).total_seconds()
+                with self.subTest(start=start, end=end, filters=filters):
+                    summaries = _week_summaries(start, end, **filters)
+                    self.assertEqual(set(summaries), set(expected))
+                    for key, seconds in expected.items():
+                        contract = db.session.get(User, key[0]).weekly_hours
+                        summary = summaries[key]
+                        self.assertAlmostEqual(summary.worked_seconds, seconds, places=3)
+                        self.assertAlmostEqual(summary.worked_hours, seconds / 3600)
+                        self.assertEqual(summary.contract_hours, contract)
+                        self.assertAlmostEqual(summary.difference, contract - seconds / 3600)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from datetime import date, datetime, time, timedelta
+
+from flask import Flask
+
+from models.database import db
+from models.expressions import seconds_since_midnight, week_start
+from models.models import TimeRecord, User
+
+
+class ExpressionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        user = User(username="ana", full_name="Ana", email="ana@example.com",
+                    is_admin=False, is_active=True, weekly_hours=20)
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        self.user = user
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.ctx.pop()
+
+    def _records(self, check_ins):
+        for ci in check_ins:
+            db.session.add(TimeRecord(user_id=self.user.id, date=ci.date(), check_in=ci,
+                                      check_out=ci + timedelta(hours=4, minutes=30)))
+        db.session.add(TimeRecord(user_id=self.user.id, date=date(2026, 5, 4)))
+        db.session.commit()
+
+    def test_time_of_day_filters_match_python(self):
+        self._records([
+            datetime(2026, 5, 4, 8, 59, 59, 500000),
+            datetime(2026, 5, 4, 9, 0),
+            datetime(2026, 5, 5, 9, 0, 1),
+            datetime(2026, 5, 6, 13, 30, 15, 250000),
+            datetime(2026, 5, 7, 19, 29, 59),
+            datetime(2026, 5, 8, 19, 30),
+        ])
+        all_records = TimeRecord.query.all()
+        for ci_from, co_to in [(time(9, 0), None), (None, time(18, 0)),
+                               (time(9, 0), time(18, 0)), (time(13, 30), time(0, 0))]:
+            with self.subTest(ci_from=ci_from, co_to=co_to):
+                q = TimeRecord.query
+                expected = all_records
+                if ci_from:
+                    q = q.filter(TimeRecord.check_in_seconds >= seconds_since_midnight(ci_from))
+                    expected = [r for r in expected if r.check_in and r.check_in.time() >= ci_from]
+                if co_to:
+                    q = q.filter(TimeRecord.check_out_seconds <= seconds_since_midnight(co_to))
+                    expected = [r for r in expected if r.check_out and r.check_out.time() <= co_to]
+                self.assertEqual(sorted(r.id for r in q), sorted(r.id for r in expected))
+
+    def test_hybrid_values_on_instances(self):
+        record = TimeRecord(check_in=datetime(2026, 5, 4, 9, 15, 30, 250000))
+        self.assertEqual(record.check_in_seconds, 9 * 3600 + 15 * 60 + 30.25)
+        self.assertIsNone(record.check_out_seconds)
+
+    def test_week_start_matches_python(self):
+        day = date(2026, 4, 26)
+        for off in range(10):
+            current = day + timedelta(days=off)
+            got = db.session.scalar(db.select(week_start(db.literal(current, db.Date))))
+            self.assertEqual(got, current - timedelta(days=current.weekday()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import TimeRecord, User
+from routes.auth import auth_bp
+from routes.time import (
+    HISTORY_MAX_PAGE_SIZE,
+    HISTORY_PAGE_SIZE,
+    _decode_history_cursor,
+    _history_page,
+    _history_page_size,
+    time_bp,
+)
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class HistoryPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        self.app.config["HISTORY_PAGE_SIZE"] = 2
+        db.init_app(self.app)
+        self.app.register_blueprint(auth_bp)
+        self.app.register_blueprint(time_bp)
+        self.day = date(2026, 5, 4)
+        with self.app.app_context():
+            db.create_all()
+            self.ana = self._user("ana")
+            otro = self._user("otro")
+            # Tres fichajes el mismo día (turno partido y un retoque): el corte de
+            # página cae entre ellos y el desempate es el id
+            for offset, hours in ((0, (8, 12, 16)), (1, (9,)), (3, (9, 15)), (6, (10,))):
+                day = self.day - timedelta(days=offset)
+                for hour in hours:
+                    check_in = datetime.combine(day, time(hour, 0))
+                    db.session.add(TimeRecord(user_id=self.ana, date=day, check_in=check_in,
+                                              check_out=check_in + timedelta(hours=2)))
+            db.session.add(TimeRecord(user_id=otro, date=self.day,
+                                      check_in=datetime.combine(self.day, time(7, 0))))
+            db.session.commit()
+            self.expected = [
+                (r.date, r.id) for r in TimeRecord.query.filter_by(user_id=self.ana)
+                .order_by(TimeRecord.date.desc(), TimeRecord.id.desc())
+            ]
+            self.engine = db.engine
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = self.ana
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username):
+        user = User(
+            username=username, full_name=username.title(), email=f"{username}@example.com",
+            is_admin=False, is_active=True, weekly_hours=20, categoria="Sala", centro="Hortaleza",
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    def _more(self, cursor):
+        statements = []
+        capture = lambda conn, cursor_, statement, *args: statements.append(statement)
+        event.listen(self.engine, "before_cursor_execute", capture)
+        try:
+            response = self.client.get("/history/more", query_string={"cursor": cursor})
+        finally:
+            event.remove(self.engine, "before_cursor_execute", capture)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json(), len(statements)
+
+    def test_pages_walk_same_date_ties_in_constant_queries(self):
+        with self.app.app_context():
+            first, cursor = _history_page(self.ana)
+            seen = [(r.date, r.id) for r in first]
+
+        query_counts = []
+        while cursor is not None:
+            body, queries = self._more(cursor)
+            query_counts.append(queries)
+            self.assertLessEqual(len(body["records"]), 2)
+            seen += [(date.fromisoformat(r["date"]), None) for r in body["records"]]
+            if body["next_cursor"] is not None:
+                self.assertEqual(_decode_history_cursor(body["next_cursor"])[0], seen[-1][0])
+            cursor = body["next_cursor"]
+
+        # 7 fichajes de a 2: 3 llamadas a «Cargar más», ninguno repetido ni perdido
+        self.assertEqual(len(query_counts), 3)
+        self.assertEqual(len(set(query_counts)), 1)
+        self.assertEqual([day for day, _ in seen], [day for day, _ in self.expected])
+
+        with self.app.app_context():
+            ids = []
+            cursor = None
+            while True:
+                page, cursor = _history_page(self.ana, cursor)
+                ids += [(r.date, r.id) for r in page]
+                if cursor is None:
+                    break
+            self.assertEqual(ids, self.expected)
+
+    def test_last_page_has_no_cursor(self):
+        # El total es múltiplo exacto del tamaño de página: la última página va llena
+        self.app.config["HISTORY_PAGE_SIZE"] = 7
+        with self.app.app_context():
+            page, cursor = _history_page(self.ana)
+            self.assertEqual(len(page), 7)
+            self.assertIsNone(cursor)
+
+            self.app.config["HISTORY_PAGE_SIZE"] = 3
+            _, cursor = _history_page(self.ana)
+            _, cursor = _history_page(self.ana, cursor)
+            page, cursor = _history_page(self.ana, cursor)
+            self.assertEqual(len(page), 1)
+            self.assertIsNone(cursor)
+
+    def test_page_size_is_clamped(self):
+        with self.app.app_context():
+            for configured, expected in ((0, 1), (-5, 1), (10_000, HISTORY_MAX_PAGE_SIZE),
+                                         ("abc", HISTORY_PAGE_SIZE), (None, HISTORY_PAGE_SIZE), ("20", 20)):
+                self.app.config["HISTORY_PAGE_SIZE"] = configured
+                self.assertEqual(_history_page_size(), expected, configured)
+            self.app.config["HISTORY_PAGE_SIZE"] = 0
+            page, cursor = _history_page(self.ana)
+            self.assertEqual(len(page), 1)
+            self.assertIsNotNone(cursor)
+
+    def test_malformed_cursor_and_missing_session(self):
+        for cursor in ("ayer", "2026-05-04", "2026-05-04_x", "04-05-2026_3", "_7"):
+            with self.assertRaises(ValueError):
+                _decode_history_cursor(cursor)
+            response = self.client.get("/history/more", query_string={"cursor": cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+        with self.client.session_transaction() as sess:
+            sess.clear()
+        response = self.client.get("/history/more", query_string={"cursor": "2026-05-04_3"})
+        self.assertEqual(response.status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
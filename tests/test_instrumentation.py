@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from models.database import db
+from models.models import User
+from routes.instrumentation import init_instrumentation, registry, request_logger
+from routes.internal import internal_bp
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def _app(self, enabled):
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        app.config["TESTING"] = True
+        app.config["INSTRUMENTATION_ENABLED"] = enabled
+        db.init_app(app)
+        init_instrumentation(app)
+        app.register_blueprint(internal_bp)
+
+        @app.route("/users/count")
+        def count_users():
+            db.session.scalar(db.select(db.func.count(User.id)))
+            db.session.scalar(db.select(User.id).limit(1))
+            return "ok"
+
+        @app.route("/users/broken")
+        def broken_users():
+            db.session.scalar(db.select(db.func.count(User.id)))
+            raise RuntimeError("fallo")
+
+        with app.app_context():
+            db.create_all()
+        self.addCleanup(self._drop, app)
+        return app
+
+    def _drop(self, app):
+        with app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def setUp(self):
+        registry.reset()
+        env = mock.patch.dict(os.environ, {"METRICS_TOKEN": "s3cret"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_metrics_disabled_by_default(self):
+        client = self._app(enabled=False).test_client()
+        client.get("/users/count")
+        response = client.get("/internal/metrics", headers={"X-METRICS-TOKEN": "s3cret"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_require_token(self):
+        client = self._app(enabled=True).test_client()
+        self.assertEqual(client.get("/internal/metrics").status_code, 401)
+        response = client.get("/internal/metrics", headers={"X-METRICS-TOKEN": "nope"})
+        self.assertEqual(response.status_code, 401)
+        response = client.get("/internal/metrics", headers={"Authorization": "Bearer s3cret"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_queries_and_latency_are_recorded_per_endpoint(self):
+        client = self._app(enabled=True).test_client()
+        with self.assertLogs(request_logger, logging.INFO) as logs:
+            client.get("/users/count")
+            client.get("/users/count")
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["endpoint"], "count_users")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["db_queries"], 2)
+        self.assertIn("FROM user", line["slowest_sql"])
+
+        body = client.get("/internal/metrics", headers={"X-METRICS-TOKEN": "s3cret"}).get_data(as_text=True)
+        self.assertIn('timetracker_requests_total{endpoint="count_users",method="GET",status="200"} 2', body)
+        self.assertIn('timetracker_db_queries_total{endpoint="count_users"} 4', body)
+        self.assertIn('timetracker_request_duration_seconds_count{endpoint="count_users"} 2', body)
+        self.assertIn('timetracker_db_slow_statement_seconds{endpoint="count_users",rank="1",', body)
+
+    def test_unhandled_exception_is_recorded_as_500(self):
+        for propagate in (True, False):
+            with self.subTest(propagate=propagate):
+                registry.reset()
+                app = self._app(enabled=True)
+                # TESTING propaga la excepción y se salta after_request; sin
+                # propagar Flask responde 500 y after_request sí se ejecuta
+                app.config["PROPAGATE_EXCEPTIONS"] = propagate
+                client = app.test_client()
+                with self.assertLogs(request_logger, logging.INFO) as logs:
+                    if propagate:
+                        with self.assertRaises(RuntimeError):
+                            client.get("/users/broken")
+                    else:
+                        self.assertEqual(client.get("/users/broken").status_code, 500)
+                line = json.loads(logs.records[0].getMessage())
+                self.assertEqual((line["endpoint"], line["status"], line["db_queries"]), ("broken_users", 500, 1))
+                self.assertEqual(len(logs.records), 1)
+
+                body = client.get("/internal/metrics", headers={"X-METRICS-TOKEN": "s3cret"}).get_data(as_text=True)
+                self.assertIn('timetracker_requests_total{endpoint="broken_users",method="GET",status="500"} 1', body)
+                self.assertIn('timetracker_db_queries_total{endpoint="broken_users"} 1', body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from flask import Flask
+
+from models.database import db
+from models.models import Job, TimeRecord, User
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.time import time_bp
+from tasks.jobs import enqueue_job, requeue_stale_jobs, resume_thread_jobs, run_pending_jobs, start_thread_runner
+from tasks.regularize import regularize_range
+from tasks.worker import work
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__, template_folder=os.path.join(ROOT, "src", "templates"))
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        self.app.config["JOB_RUNNER"] = "worker"
+        db.init_app(self.app)
+        for bp in (auth_bp, time_bp, admin_bp):
+            self.app.register_blueprint(bp)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.week_start = date(2026, 5, 4)
+        self.today = self.week_start + timedelta(days=21)
+
+        self.admin = self._user("jefa", is_admin=True)
+        for i in range(3):
+            user = self._user(f"emp{i}", weekly_hours=15 + 5 * i)
+            for off in (0, 1, 7, 8):
+                day = self.week_start + timedelta(days=off)
+                db.session.add(TimeRecord(
+                    user_id=user.id, date=day, check_in=datetime.combine(day, time(9, 0)),
+                    check_out=datetime.combine(day, time(23, 59, 59)), notes="CA"))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.ctx.pop()
+
+    def _user(self, username, weekly_hours=20, is_admin=False):
+        user = User(
+            username=username, full_name=username.title(),
+            email=f"{username}@example.com", is_admin=is_admin, is_active=True,
+            weekly_hours=weekly_hours, categoria="Reparto",
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def _regularize_params(self, dry_run=True):
+        return {
+            "range_start": self.week_start,
+            "range_end": self.week_start + timedelta(days=13),
+            "today": self.today,
+            "dry_run": dry_run,
+            "centro": None,
+        }
+
+    def test_worker_runs_queued_job_and_stores_summary(self):
+        job = enqueue_job("regularize", self._regularize_params(), created_by=self.admin.id, app=self.app)
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+
+        self.assertEqual(run_pending_jobs(self.app, worker_name="test"), 1)
+
+        db.session.refresh(job)
+        expected = regularize_range(self.week_start, self.week_start + timedelta(days=13),
+                                    app=self.app, today=self.today, dry_run=True)
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual(job.worker, "test")
+        self.assertEqual((job.progress_done, job.progress_total), (2, 2))
+        self.assertEqual(job.result["created_records"], expected.created_records)
+        self.assertEqual(job.result["weeks"][0]["week_start"], self.week_start.isoformat())
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_records_error(self):
+        params = self._regularize_params()
+        params["range_start"] = "no-es-fecha"
+        job = enqueue_job("regularize", params, app=self.app)
+        work(self.app, once=True, name="test")
+
+        db.session.refresh(job)
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn("ValueError", job.error)
+
+    def test_autofill_job_reports_progress_per_user_chunk(self):
+        job = enqueue_job("autofill", {"week_start": self.week_start}, app=self.app)
+        reported = []
+        with mock.patch("tasks.autofill.PROGRESS_USERS", 2), \
+                mock.patch("tasks.jobs._report_progress", lambda job_id, done, total: reported.append((done, total))):
+            self.assertEqual(run_pending_jobs(self.app, worker_name="test"), 1)
+
+        self.assertEqual(reported, [(0, 3), (2, 3), (3, 3)])
+        db.session.refresh(job)
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual((job.progress_done, job.progress_total), (3, 3))
+
+    def test_jobs_run_in_order_and_stale_ones_are_requeued(self):
+        first = enqueue_job("autofill", {"week_start": self.week_start}, app=self.app)
+        second = enqueue_job("regularize", self._regularize_params(), app=self.app)
+        first.status = Job.STATUS_RUNNING
+        first.heartbeat_at = datetime.utcnow() - timedelta(hours=2)
+        db.session.commit()
+
+        # La tarea en curso no se vuelve a reclamar
+        self.assertEqual(run_pending_jobs(self.app, worker_name="test"), 1)
+        db.session.refresh(first)
+        db.session.refresh(second)
+        self.assertEqual(first.status, Job.STATUS_RUNNING)
+        self.assertEqual(second.status, Job.STATUS_DONE)
+
+        # ...salvo que lleve demasiado tiempo sin latido
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(run_pending_jobs(self.app, worker_name="test"), 1)
+        db.session.refresh(first)
+        self.assertEqual(first.status, Job.STATUS_DONE)
+        self.assertEqual(first.result["week_start"], self.week_start.isoformat())
+
+    def test_thread_runner_resumes_queued_jobs(self):
+        with mock.patch("tasks.jobs._dispatch_thread") as dispatch:
+            self.assertFalse(resume_thread_jobs(self.app))
+            dispatch.assert_not_called()
+
+            self.app.config["JOB_RUNNER"] = "thread"
+            self.assertTrue(resume_thread_jobs(self.app))
+            dispatch.assert_called_once_with(self.app)
+
+    def test_thread_runner_starts_once_and_only_for_thread(self):
+        with mock.patch("tasks.jobs._poller", None), mock.patch("tasks.jobs.threading.Thread") as thread:
+            self.assertFalse(start_thread_runner(self.app))
+            thread.assert_not_called()
+
+            self.app.config["JOB_RUNNER"] = "thread"
+            self.assertTrue(start_thread_runner(self.app))
+            self.assertTrue(start_thread_runner(self.app))
+            thread.assert_called_once()
+            self.assertTrue(thread.call_args.kwargs["daemon"])
+            thread.return_value.start.assert_called_once_with()
+
+    def test_admin_backfill_enqueues_and_reports_progress(self):
+        self.app.config["JOB_RUNNER"] = "inline"
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["user_id"] = self.admin.id
+            sess["is_admin"] = True
+
+        response = client.post("/admin/records/backfill", data={
+            "mode": "preview",
+            "date_from": self.week_start.isoformat(),
+            "date_to": (self.week_start + timedelta(days=13)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("job=", response.headers["Location"])
+        job_id = db.session.scalar(db.select(Job.id))
+
+        status = client.get(f"/admin/jobs/{job_id}").get_json()
+        self.assertTrue(status["finished"])
+        self.assertEqual(status["status"], Job.STATUS_DONE)
+        self.assertTrue(status["messages"][0]["text"].startswith("SIMULACIÓN"))
+        self.assertEqual(client.get("/admin/jobs/9999").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import io
+import os
+import re
+import unittest
+import zipfile
+import zlib
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+from flask import Flask
+
+from models.database import db
+from models.models import EmployeeStatus, TimeRecord, User
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.export import PDF_REPORT_MAX_DAYS, export_bp
+from routes.pdf_report import render_records_report
+from routes.time import time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _pages(pdf_bytes):
+    """Texto (sin comprimir) de cada página del PDF."""
+    streams = re.findall(rb"stream\r?\n(.*?)\r?\nendstream", pdf_bytes, re.S)
+    pages = []
+    for raw in streams:
+        try:
+            pages.append(zlib.decompress(raw))
+        except zlib.error:
+            pages.append(raw)
+    return [page for page in pages if b" Tj" in page]
+
+
+class PdfReportRenderTestCase(unittest.TestCase):
+    def test_headers_repeat_on_every_page_and_weeks_get_subtotals(self):
+        monday = date(2026, 5, 4)
+        user = SimpleNamespace(id=1, username="ana", full_name="Ana Pérez", categoria="Sala", weekly_hours=20)
+        rows = []
+        for off in range(28):
+            day = monday + timedelta(days=off)
+            for shift in range(3):
+                check_in = datetime.combine(day, time(8 + 4 * shift, 0))
+                rows.append((SimpleNamespace(
+                    user_id=1, date=day, check_in=check_in, check_out=check_in + timedelta(hours=1),
+                    notes="nota muy larga " * 10,
+                ), None))
+
+        pages = _pages(render_records_report("Informe", "Mayo", iter(rows), {1: user}, {}))
+
+        self.assertGreater(len(pages), 1)
+        for page in pages:
+            self.assertIn(b"(Nombre completo) Tj", page)
+        text = b"".join(pages)
+        self.assertEqual(text.count(b"(TOTAL SEMANA "), 4)
+        self.assertIn(b"(21.00) Tj", text)
+        self.assertIn("Ana Pérez".encode("latin-1"), text)
+
+
+class PdfReportRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        for bp in (auth_bp, time_bp, admin_bp, export_bp):
+            self.app.register_blueprint(bp)
+        self.monday = date(2026, 5, 4)
+        with self.app.app_context():
+            db.create_all()
+            admin_id = self._user("jefa", centro=None, is_admin=True).id
+            for index, centro in enumerate(("Hortaleza", "Las Tablas", "Hortaleza")):
+                user = self._user(f"emp{index}", centro=centro)
+                for off in range(10):
+                    day = self.monday + timedelta(days=off)
+                    check_in = datetime.combine(day, time(9, 0))
+                    db.session.add(TimeRecord(user_id=user.id, date=day, check_in=check_in,
+                                              check_out=check_in + timedelta(hours=4)))
+                db.session.add(EmployeeStatus(user_id=user.id, date=self.monday, status="Trabajado",
+                                              notes="revisado"))
+            db.session.commit()
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = admin_id
+            sess["is_admin"] = True
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username, centro, is_admin=False):
+        user = User(
+            username=username, full_name=username.title(),
+            email=f"{username}@example.com", is_admin=is_admin, is_active=True,
+            weekly_hours=20, categoria="Reparto", centro=centro,
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def _range(self, days=14, **extra):
+        return {
+            "start_date": self.monday.isoformat(),
+            "end_date": (self.monday + timedelta(days=days - 1)).isoformat(),
+            **extra,
+        }
+
+    def test_zip_has_one_pdf_per_centro(self):
+        response = self.client.post("/pdf_report", data=self._range(por_centro="1"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/zip")
+        bundle = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertEqual(sorted(bundle.namelist()), [
+            "registros_Hortaleza_04052026-17052026.pdf",
+            "registros_Las Tablas_04052026-17052026.pdf",
+        ])
+        hortaleza = b"".join(_pages(bundle.read("registros_Hortaleza_04052026-17052026.pdf")))
+        self.assertIn(b"(emp0) Tj", hortaleza)
+        self.assertIn(b"(emp2) Tj", hortaleza)
+        self.assertNotIn(b"(emp1) Tj", hortaleza)
+        self.assertIn(b"(revisado) Tj", hortaleza)
+        # Dos semanas por empleado: la primera completa (7 x 4h), la segunda con 3 días
+        self.assertEqual(hortaleza.count(b"(TOTAL SEMANA "), 4)
+        self.assertIn(b"(28.00) Tj", hortaleza)
+        self.assertIn(b"(12.00) Tj", hortaleza)
+
+    def test_single_centro_report_is_a_pdf(self):
+        response = self.client.get("/pdf_report", query_string=self._range(centro="Las Tablas"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/pdf")
+        text = b"".join(_pages(response.data))
+        self.assertIn(b"(emp1) Tj", text)
+        self.assertNotIn(b"(emp0) Tj", text)
+
+    def test_export_form_filters_apply(self):
+        form = {name: "" for name in ("centro1", "usuario1", "centro2", "categoria2", "centro3", "horas3",
+                                      "centro4", "usuario4", "categoria4", "horas4")}
+        # Con un centro elegido en el formulario, «por centro» da solo su PDF
+        response = self.client.post("/pdf_report", data=self._range(por_centro="1", **{**form, "centro4": "Las Tablas"}))
+        self.assertEqual(response.mimetype, "application/pdf")
+        text = b"".join(_pages(response.data))
+        self.assertIn(b"(emp1) Tj", text)
+        self.assertNotIn(b"(emp0) Tj", text)
+
+        # Los demás filtros se aplican dentro de cada PDF del zip
+        with self.app.app_context():
+            emp0 = User.query.filter_by(username="emp0").one().id
+        response = self.client.post("/pdf_report", data=self._range(por_centro="1", **{**form, "usuario4": str(emp0)}))
+        bundle = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertEqual(bundle.namelist(), ["registros_Hortaleza_04052026-17052026.pdf"])
+        hortaleza = b"".join(_pages(bundle.read("registros_Hortaleza_04052026-17052026.pdf")))
+        self.assertIn(b"(emp0) Tj", hortaleza)
+        self.assertNotIn(b"(emp2) Tj", hortaleza)
+
+        response = self.client.post("/pdf_report", data=self._range(**{**form, "horas4": "x"}))
+        self.assertEqual(response.status_code, 302)
+
+    def test_invalid_ranges_redirect(self):
+        for data in (
+            {},
+            self._range(days=PDF_REPORT_MAX_DAYS + 1),
+            {"start_date": "2026-05-10", "end_date": "2026-05-01"},
+        ):
+            with self.subTest(data=data):
+                response = self.client.post("/pdf_report", data=data)
+                self.assertEqual(response.status_code, 302)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from models.database import db
+from models.models import EmployeeStatus, PunchRequest, TimeRecord, User
+from routes.auth import auth_bp
+from routes.time import _start_punch, time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class PunchApiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        self.app.register_blueprint(auth_bp)
+        self.app.register_blueprint(time_bp)
+        with self.app.app_context():
+            db.create_all()
+            user = User(
+                username="ana", full_name="Ana", email="ana@example.com",
+                is_admin=False, is_active=True, weekly_hours=20, categoria="Sala", centro="Hortaleza",
+            )
+            user.set_password("secret")
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+            self.engine = db.engine
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = self.user_id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _punch(self, action=None, key=None, **extra):
+        payload = dict(extra)
+        if action:
+            payload["action"] = action
+        headers = {"Idempotency-Key": key} if key else {}
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement.lstrip().split(None, 1)[0].upper())
+
+        event.listen(self.engine, "before_cursor_execute", capture)
+        try:
+            response = self.client.post("/api/v1/punch", json=payload, headers=headers)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", capture)
+        return response, statements
+
+    def _records(self):
+        with self.app.app_context():
+            return [(r.check_in is not None, r.check_out is not None, r.notes)
+                    for r in TimeRecord.query.order_by(TimeRecord.id)]
+
+    def test_toggle_in_and_out_with_one_read_each(self):
+        response, statements = self._punch(key="k1")
+        self.assertEqual(response.status_code, 201)
+        body = response.get_json()
+        self.assertEqual((body["action"], body["state"]), ("in", "in"))
+        self.assertIsNone(body["record"]["check_out"])
+        self.assertEqual(statements.count("SELECT"), 1)
+        with self.app.app_context():
+            status = EmployeeStatus.query.one()
+            self.assertEqual((status.status, status.date), ("Trabajado", date.today()))
+
+        response, statements = self._punch("toggle", key="k2", notes="cierre")
+        self.assertEqual(response.status_code, 201)
+        body = response.get_json()
+        self.assertEqual((body["action"], body["state"]), ("out", "out"))
+        self.assertIsNotNone(body["record"]["duration_seconds"])
+        self.assertEqual(statements.count("SELECT"), 1)
+        self.assertEqual(self._records(), [(True, True, "cierre")])
+
+    def test_retried_key_replays_without_punching_again(self):
+        first, _ = self._punch("in", key="retry-1")
+        replay, statements = self._punch("in", key="retry-1")
+
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.headers.get("Idempotent-Replayed"), "true")
+        self.assertEqual(replay.get_json(), first.get_json())
+        self.assertEqual(statements, ["SELECT"])
+        self.assertEqual(self._records(), [(True, False, None)])
+
+        reused, _ = self._punch("out", key="retry-1")
+        self.assertEqual(reused.status_code, 422)
+        with self.app.app_context():
+            self.assertEqual(PunchRequest.query.count(), 1)
+
+    def test_rejections_match_form_validation_and_are_not_stored(self):
+        response, _ = self._punch("out", key="a")
+        self.assertEqual((response.status_code, response.get_json()["error"]), (409, "not_open"))
+
+        self._punch("in")
+        response, _ = self._punch("in", key="b")
+        self.assertEqual((response.status_code, response.get_json()["error"]), (409, "already_open"))
+
+        with self.app.app_context():
+            TimeRecord.query.delete()
+            EmployeeStatus.query.delete()
+            yesterday = date.today() - timedelta(days=1)
+            db.session.add(TimeRecord(user_id=self.user_id, date=yesterday,
+                                      check_in=datetime.combine(yesterday, time(9, 0))))
+            db.session.commit()
+        for action in ("in", "out", "toggle"):
+            with self.subTest(action=action):
+                response, _ = self._punch(action)
+                self.assertEqual((response.status_code, response.get_json()["error"]), (409, "pending_close"))
+
+        with self.app.app_context():
+            TimeRecord.query.delete()
+            db.session.add(EmployeeStatus(user_id=self.user_id, date=date.today(), status="Vacaciones"))
+            db.session.commit()
+        response, _ = self._punch("in", key="c")
+        self.assertEqual((response.status_code, response.get_json()["error"]), (409, "blocked_status"))
+        with self.app.app_context():
+            self.assertEqual(PunchRequest.query.count(), 0)
+            self.assertEqual(TimeRecord.query.count(), 0)
+
+    def test_check_in_retry_revalidates_after_concurrent_status(self):
+        """El reintento tras chocar con el estado de hoy vuelve a leerlo y a validar."""
+        def concurrent(status, open_record):
+            calls = []
+
+            def start_punch(user_id, now, today_status):
+                calls.append(today_status.status if today_status else None)
+                if len(calls) == 1:
+                    # Otro proceso confirma el estado (y quizá su fichaje) justo antes
+                    db.session.rollback()
+                    db.session.add(EmployeeStatus(user_id=user_id, date=now.date(), status=status))
+                    if open_record:
+                        db.session.add(TimeRecord(user_id=user_id, date=now.date(), check_in=now))
+                    db.session.commit()
+                    raise IntegrityError("INSERT INTO employee_status", {},
+                                         Exception("UNIQUE constraint failed: uix_employee_date"))
+                return _start_punch(user_id, now, today_status)
+
+            return calls, mock.patch("routes.time._start_punch", start_punch)
+
+        cases = (
+            ("Vacaciones", False, "tu estado de hoy es «Vacaciones»", 0),
+            ("Trabajado", True, "Tienes un fichaje abierto", 1),
+            ("Trabajado", False, "Entrada registrada correctamente", 1),
+        )
+        for status, open_record, message, records in cases:
+            with self.subTest(status=status, open_record=open_record):
+                with self.app.app_context():
+                    TimeRecord.query.delete()
+                    EmployeeStatus.query.delete()
+                    db.session.commit()
+                calls, patch = concurrent(status, open_record)
+                with patch:
+                    response = self.client.post("/check_in", follow_redirects=False)
+                self.assertEqual(response.status_code, 302)
+                with self.client.session_transaction() as sess:
+                    flashes = [text for _, text in sess.pop("_flashes", [])]
+                self.assertTrue(any(message in text for text in flashes), flashes)
+                with self.app.app_context():
+                    self.assertEqual(TimeRecord.query.count(), records)
+                    self.assertEqual(EmployeeStatus.query.count(), 1)
+                # El reintento solo llega a fichar si la validación pasa, y con el estado releído
+                if records and not open_record:
+                    self.assertEqual(len(calls), 2)
+                    self.assertEqual(calls, [None, status])
+                else:
+                    self.assertEqual(len(calls), 1)
+
+    def test_bad_requests(self):
+        response, _ = self._punch("sideways")
+        self.assertEqual(response.status_code, 400)
+        response, _ = self._punch("in", key="x" * 65)
+        self.assertEqual(response.status_code, 400)
+        with self.client.session_transaction() as sess:
+            sess.clear()
+        response, _ = self._punch("in")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self._records(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
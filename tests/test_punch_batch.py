@@ -0,0 +1,190 @@
+import os
+import random
+import unittest
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import EmployeeStatus, TimeRecord, User, WeeklyUserTotal
+from routes.auth import auth_bp
+from routes.time import time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class PunchBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        self.app.register_blueprint(auth_bp)
+        self.app.register_blueprint(time_bp)
+        # Un miércoles pasado: toda la semana queda en el pasado
+        self.day = date.today() - timedelta(days=7 + (date.today().weekday() - 2) % 7)
+        with self.app.app_context():
+            db.create_all()
+            self.ana = self._user("ana")
+            self.luis = self._user("luis")
+            self.baja = self._user("baja")
+            self.inactivo = self._user("inactivo", is_active=False)
+            db.session.add(EmployeeStatus(user_id=self.baja, date=self.day, status="Baja"))
+            # Luis dejó abierta la entrada de hoy antes de perder la conexión
+            db.session.add(TimeRecord(user_id=self.luis, date=self.day, check_in=self._at(8, 0)))
+            db.session.add(TimeRecord(user_id=self.luis, date=self.day - timedelta(days=1),
+                                      check_in=datetime.combine(self.day - timedelta(days=1), time(7, 0)),
+                                      check_out=datetime.combine(self.day - timedelta(days=1), time(9, 0))))
+            db.session.commit()
+            self.engine = db.engine
+
+        self.client = self.app.test_client()
+        env = mock.patch.dict(os.environ, {"KIOSK_TOKEN": "kiosco"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username, is_active=True):
+        user = User(
+            username=username, full_name=username.title(), email=f"{username}@example.com",
+            is_admin=False, is_active=is_active, weekly_hours=20, categoria="Sala", centro="Hortaleza",
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    def _at(self, hour, minute=0, day=None):
+        return datetime.combine(day or self.day, time(hour, minute))
+
+    def _event(self, event_id, user_id, action, at, **extra):
+        return {"id": event_id, "user_id": user_id, "action": action, "timestamp": at.isoformat(), **extra}
+
+    def _post(self, events, token="kiosco"):
+        return self.client.post("/api/v1/punch/batch", json={"events": events},
+                                headers={"X-KIOSK-TOKEN": token})
+
+    def _results(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {r["id"]: (r["status"], r.get("error")) for r in response.get_json()["results"]}
+
+    def test_events_are_ordered_per_user_and_applied(self):
+        events = [
+            self._event("a4", self.ana, "out", self._at(18), notes="tarde"),
+            self._event("l1", self.luis, "out", self._at(12)),
+            self._event("a2", self.ana, "out", self._at(13)),
+            self._event("a3", self.ana, "in", self._at(14)),
+            self._event("a1", self.ana, "in", self._at(9)),
+        ]
+        response = self._post(events)
+        self.assertEqual([r["index"] for r in response.get_json()["results"]], list(range(5)))
+        self.assertEqual(set(self._results(response).values()), {("applied", None)})
+        self.assertEqual(response.get_json()["applied"], 5)
+
+        with self.app.app_context():
+            ana = TimeRecord.query.filter_by(user_id=self.ana).order_by(TimeRecord.check_in).all()
+            self.assertEqual([(r.check_in, r.check_out, r.notes) for r in ana], [
+                (self._at(9), self._at(13), None), (self._at(14), self._at(18), "tarde"),
+            ])
+            luis = TimeRecord.query.filter_by(user_id=self.luis, date=self.day).one()
+            self.assertEqual(luis.check_out, self._at(12))
+            status = EmployeeStatus.query.filter_by(user_id=self.ana).one()
+            self.assertEqual((status.date, status.status), (self.day, "Trabajado"))
+            # Los INSERT/UPDATE masivos mantienen weekly_user_totals
+            week = self.day - timedelta(days=self.day.weekday())
+            totals = {t.user_id: t.worked_seconds for t in WeeklyUserTotal.query.filter_by(week_start=week)}
+            self.assertEqual(totals[self.ana], 8 * 3600)
+            self.assertEqual(totals[self.luis], 6 * 3600)
+
+        # El quiosco reenvía el lote: nada se aplica dos veces
+        again = self._results(self._post(events))
+        self.assertEqual(set(again.values()), {("duplicate", None)})
+        with self.app.app_context():
+            self.assertEqual(TimeRecord.query.filter_by(user_id=self.ana).count(), 2)
+
+    def test_conflicts_are_rejected_per_event(self):
+        other_day = self.day + timedelta(days=1)
+        with self.app.app_context():
+            marta = self._user("marta")
+            db.session.add(TimeRecord(user_id=marta, date=self.day, check_in=self._at(7), check_out=self._at(9)))
+            db.session.commit()
+        results = self._results(self._post([
+            self._event("blocked", self.baja, "in", self._at(9)),
+            self._event("no-open", self.ana, "out", self._at(8)),
+            self._event("in", self.ana, "in", self._at(9)),
+            self._event("twice", self.ana, "in", self._at(10)),
+            self._event("repeat", self.ana, "in", self._at(9)),
+            self._event("next-day", self.ana, "out", self._at(1, day=other_day)),
+            self._event("open", self.luis, "in", self._at(10)),
+            self._event("overlap", marta, "in", self._at(8, 30)),
+            self._event("inactive", self.inactivo, "in", self._at(9)),
+            self._event("ghost", 999, "in", self._at(9)),
+            self._event("future", self.ana, "in", datetime.now() + timedelta(hours=2)),
+            {"id": "bad", "user_id": self.ana, "action": "in", "timestamp": "ayer"},
+            "no es un evento",
+        ]))
+
+        self.assertEqual(results, {
+            "blocked": ("rejected", "blocked_status"),
+            "no-open": ("rejected", "not_open"),
+            "in": ("applied", None),
+            "twice": ("rejected", "already_open"),
+            "repeat": ("duplicate", None),
+            "next-day": ("rejected", "pending_close"),
+            "open": ("rejected", "already_open"),
+            "overlap": ("rejected", "overlap"),
+            "inactive": ("rejected", "unknown_user"),
+            "ghost": ("rejected", "unknown_user"),
+            "future": ("rejected", "future_timestamp"),
+            "bad": ("rejected", "invalid_event"),
+            None: ("rejected", "invalid_event"),
+        })
+        with self.app.app_context():
+            self.assertEqual(TimeRecord.query.count(), 4)
+
+    def test_statement_count_does_not_grow_with_events(self):
+        with self.app.app_context():
+            users = [self._user(f"emp{i}") for i in range(100)]
+        rnd = random.Random(1)
+        events = []
+        for user_id in users:
+            start = rnd.randrange(6, 12)
+            events += [self._event(f"{user_id}-in", user_id, "in", self._at(start)),
+                       self._event(f"{user_id}-out", user_id, "out", self._at(start + 4))]
+        rnd.shuffle(events)
+
+        statements = []
+        capture = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(self.engine, "before_cursor_execute", capture)
+        try:
+            response = self._post(events)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", capture)
+
+        self.assertEqual(response.get_json()["applied"], 200)
+        self.assertLess(len(statements), 20)
+
+    def test_requires_kiosk_token_and_event_list(self):
+        self.assertEqual(self._post([], token="otro").status_code, 401)
+        response = self.client.post("/api/v1/punch/batch", json=[1, 2],
+                                    headers={"Authorization": "Bearer kiosco"})
+        self.assertEqual(response.status_code, 400)
+        with mock.patch("routes.time.BATCH_MAX_EVENTS", 1):
+            self.assertEqual(self._post([{}, {}]).status_code, 413)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,15 @@
+import os
+import tempfile
 import unittest
 from datetime import date, datetime, time, timedelta
+from unittest import mock
 
 from flask import Flask
 
 from models.database import db
-from models.models import OvertimeAlert, TimeRecord, User
+from models.models import EmployeeStatus, OvertimeAlert, ShiftPattern, TimeRecord, User
 from tasks.regularize import regularize_range
+from tasks.regularize_parallel import regularize_range_parallel
 
 
 class RegularizeTestCase(unittest.TestCase):
@@ -223,6 +227,162 @@ class RegularizeTestCase(unittest.TestCase):
         self.assertEqual(len(recs), 1)
         self.assertEqual((recs[0].check_out - recs[0].check_in).total_seconds() / 3600, 8)
 
+    # --- Modo por lotes ----------------------------------------------------
+
+    def _mixed_scenario(self):
+        """Varias semanas y empleados: CA, días reales, ausencias y altas."""
+        prev = self.week_start - timedelta(days=7)
+        veteran = self._user("veterano", 40)
+        for weeks_back in (2, 3):
+            monday = self.week_start - timedelta(days=7 * weeks_back)
+            for off in range(5):
+                day = monday + timedelta(days=off)
+                ci = datetime.combine(day, time(8, 30))
+                db.session.add(TimeRecord(user_id=veteran.id, date=day, check_in=ci,
+                                          check_out=ci + timedelta(hours=8)))
+        inflated = self._user("inflado", 20)
+        for monday in (prev, self.week_start):
+            for off in (0, 1, 2):
+                day = monday + timedelta(days=off)
+                db.session.add(TimeRecord(
+                    user_id=inflated.id, date=day, check_in=datetime.combine(day, time(9, 0)),
+                    check_out=datetime.combine(day, time(23, 59, 59)), notes="CA"))
+        absent = self._user("ausente", 15)
+        self._rec(absent, 0, 9, 8)
+        db.session.add(EmployeeStatus(user_id=absent.id, date=self.week_start + timedelta(days=1),
+                                      status="Vacaciones"))
+        db.session.add(EmployeeStatus(user_id=absent.id, date=self.week_start, status="Trabajado",
+                                      notes="RG"))
+        late = self._user("tardio", 10)
+        day = self.week_start + timedelta(days=3)
+        db.session.add(TimeRecord(user_id=late.id, date=day,
+                                  check_in=datetime.combine(day, time(22, 30))))
+        newcomer = self._user("nuevo", 25)
+        newcomer.hire_date = self.week_start + timedelta(days=2)
+        self._user("sincontrato", 0)
+        db.session.commit()
+
+    def _snapshot_all(self):
+        return (
+            sorted((r.user_id, r.date, r.check_in, r.check_out, r.notes)
+                   for r in TimeRecord.query.all()),
+            sorted((s.user_id, s.date, s.status, s.entry_time, s.exit_time, s.notes)
+                   for s in EmployeeStatus.query.all()),
+        )
+
+    def test_batched_mode_matches_per_user_mode(self):
+        def run(batched):
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            self._mixed_scenario()
+            result = regularize_range(
+                self.week_start - timedelta(days=21), self.week_start + timedelta(days=6),
+                today=self.week_start + timedelta(days=14), batched=batched,
+            )
+            return result, self._snapshot_all()
+
+        per_user, per_user_state = run(batched=False)
+        batched, batched_state = run(batched=True)
+
+        self.assertGreater(per_user.created_records, 0)
+        self.assertEqual(batched, per_user)
+        self.assertEqual(batched_state, per_user_state)
+        self.assertEqual(TimeRecord.query.filter(TimeRecord.created_at.is_(None)).count(), 0)
+
+    def _run_range(self, runner, **kwargs):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        self._mixed_scenario()
+        result = runner(
+            self.week_start - timedelta(days=21), self.week_start + timedelta(days=6),
+            today=self.week_start + timedelta(days=14), **kwargs,
+        )
+        return result, self._snapshot_all()
+
+    def _assert_same_report(self, merged, serial):
+        self.assertEqual(merged.weeks, serial.weeks)
+        self.assertEqual(
+            (merged.created_records, merged.adjusted_records, merged.removed_records),
+            (serial.created_records, serial.adjusted_records, serial.removed_records),
+        )
+        key = lambda ur: (ur.user_id, ur.created_records, ur.removed_records)
+        self.assertEqual(sorted(map(key, merged.user_results)), sorted(map(key, serial.user_results)))
+
+    def test_parallel_shards_match_serial_run(self):
+        serial, serial_state = self._run_range(regularize_range)
+        for shard_by in ("users", "centro"):
+            with self.subTest(shard_by=shard_by):
+                merged, merged_state = self._run_range(
+                    regularize_range_parallel, workers=3, shard_by=shard_by, app=self.app)
+                self.assertEqual(merged.failed_shards, [])
+                self._assert_same_report(merged, serial)
+                self.assertEqual(merged_state, serial_state)
+
+    def test_parallel_shards_do_not_store_group_patterns(self):
+        calls = []
+
+        def spy(*args, **kwargs):
+            calls.append(kwargs["store_group_patterns"])
+            return regularize_range(*args, **kwargs)
+
+        with mock.patch("tasks.regularize_parallel.regularize_range", side_effect=spy):
+            merged, _ = self._run_range(regularize_range_parallel, workers=2, shard_by="users", app=self.app)
+        self.assertEqual(merged.failed_shards, [])
+        self.assertEqual(calls, [False, False])
+
+        # Solo quedan las filas de grupo de la primera semana, confirmadas por el
+        # padre antes de repartir; los lotes no guardan ni borran filas de grupo
+        first_week = self.week_start - timedelta(days=21)
+        group_weeks = {p.week_start for p in ShiftPattern.query.filter(ShiftPattern.user_id.is_(None))}
+        self.assertEqual(group_weeks, {first_week})
+
+        serial, _ = self._run_range(regularize_range)
+        serial_weeks = {p.week_start for p in ShiftPattern.query.filter(ShiftPattern.user_id.is_(None))}
+        self.assertGreater(len(serial_weeks), 1)
+
+    def test_failed_shard_is_rolled_back_alone(self):
+        def flaky(*args, user_ids=None, **kwargs):
+            if min(user_ids) % 2 == 0:
+                raise RuntimeError("lote roto")
+            return regularize_range(*args, user_ids=user_ids, **kwargs)
+
+        _, before = self._run_range(lambda *a, **k: None)
+        with mock.patch("tasks.regularize_parallel.regularize_range", side_effect=flaky):
+            merged, after = self._run_range(
+                regularize_range_parallel, workers=2, shard_by="users", app=self.app)
+
+        self.assertEqual(len(merged.failed_shards), 1)
+        self.assertIn("lote roto", merged.failed_shards[0]["error"])
+        failed_users = {u.id for u in User.query.all() if u.id % 2 == 0}
+        unchanged = lambda state: [r for r in state[0] if r[0] in failed_users]
+        self.assertEqual(unchanged(after), unchanged(before))
+        self.assertNotEqual(after, before)
+
+    def test_process_pool_on_file_database(self):
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        file_app = Flask(__name__)
+        file_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+        file_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}}
+        file_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        db.init_app(file_app)
+
+        serial, serial_state = self._run_range(regularize_range)
+        with file_app.app_context():
+            try:
+                merged, merged_state = self._run_range(
+                    regularize_range_parallel, workers=2, shard_by="users", app=file_app)
+            finally:
+                db.session.remove()
+                db.engine.dispose()
+
+        self.assertEqual(merged.failed_shards, [])
+        self._assert_same_report(merged, serial)
+        self.assertEqual(merged_state, serial_state)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,218 @@
+import unittest
+from datetime import date, datetime, time, timedelta
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import ShiftPattern, TimeRecord, User
+from tasks.autofill import (
+    _build_group_history,
+    _day_patterns_by_weekday,
+    _group_patterns,
+    _history_query,
+    _pattern_rows,
+    _store_pattern_rows,
+    _templates_by_weekday,
+    _user_patterns,
+    estimate_auto_close_time,
+)
+from tasks.regularize import regularize_range
+from tasks.shift_patterns import refresh
+
+
+class ShiftPatternTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.week_start = date(2026, 5, 4)  # lunes
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.ctx.pop()
+
+    def _user(self, username, weekly_hours=20, categoria="Reparto"):
+        user = User(
+            username=username, full_name=username.title(),
+            email=f"{username}@example.com", is_admin=False, is_active=True,
+            weekly_hours=weekly_hours, categoria=categoria,
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def _history(self, user, weeks=4, start_hour=9, hours=4, days=5):
+        for week in range(1, weeks + 1):
+            monday = self.week_start - timedelta(days=7 * week)
+            for off in range(days):
+                day = monday + timedelta(days=off)
+                check_in = datetime.combine(day, time(start_hour + off % 2, 0))
+                db.session.add(TimeRecord(user_id=user.id, date=day, check_in=check_in,
+                                          check_out=check_in + timedelta(hours=hours, minutes=10 * off)))
+        db.session.commit()
+
+    def _stored(self, **filters):
+        return ShiftPattern.query.filter_by(**filters).count()
+
+    def _count_statements(self, func):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            return func(), statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+    def test_stored_patterns_match_history_and_skip_it_once_stored(self):
+        ana = self._user("ana")
+        luis = self._user("luis", categoria="Cocina")
+        nuevo = self._user("nuevo")
+        self._history(ana)
+        self._history(luis, start_hour=12, hours=5, days=4)
+
+        user_ids = [ana.id, luis.id, nuevo.id]
+        first = _user_patterns(user_ids, self.week_start)
+        db.session.commit()
+        second, statements = self._count_statements(lambda: _user_patterns(user_ids, self.week_start))
+
+        self.assertEqual(second, first)
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn("time_record", statements[0])
+        self.assertEqual(second[nuevo.id], ({}, {}))
+        self.assertEqual(self._stored(user_id=nuevo.id, weekday=ShiftPattern.EMPTY_WEEKDAY), 1)
+        for user in (ana, luis):
+            history = _history_query(self.week_start).filter(TimeRecord.user_id == user.id).all()
+            self.assertEqual(second[user.id], (
+                _templates_by_weekday(history, "histórico empleado"),
+                _day_patterns_by_weekday(history),
+            ))
+
+        group = _group_patterns(self.week_start, 20, "Reparto")
+        db.session.commit()
+        self.assertEqual(group, _build_group_history(self.week_start, 20, "Reparto"))
+        self.assertEqual(_group_patterns(self.week_start, 20, "Reparto"), group)
+        self.assertEqual(_group_patterns(self.week_start, 20, None), _build_group_history(self.week_start, 20, None))
+
+    def test_duplicate_stores_keep_one_row_per_scope(self):
+        ana = self._user("ana")
+        self._history(ana)
+        _user_patterns([ana.id], self.week_start)
+        _group_patterns(self.week_start, 20, None)
+        db.session.commit()
+        stored = ShiftPattern.query.count()
+
+        # Otro proceso que calculó lo mismo a la vez vuelve a insertar sus filas
+        templates, day_patterns = _build_group_history(self.week_start, 20, None)
+        history = _history_query(self.week_start).filter(TimeRecord.user_id == ana.id).all()
+        _store_pattern_rows(
+            _pattern_rows(self.week_start, templates, day_patterns, group_hours=20, group_categoria=None)
+            + _pattern_rows(self.week_start, _templates_by_weekday(history, "histórico empleado"),
+                            _day_patterns_by_weekday(history), user_id=ana.id)
+        )
+        db.session.commit()
+        self.assertEqual(ShiftPattern.query.count(), stored)
+
+    def test_read_only_callers_do_not_store(self):
+        ana = self._user("ana")
+        self._history(ana)
+        stored = _user_patterns([ana.id], self.week_start, store=False)
+        self.assertEqual(self._stored(), 0)
+
+        day = self.week_start + timedelta(days=1)
+        record = TimeRecord(user_id=ana.id, date=day, check_in=datetime.combine(day, time(9, 0)))
+        db.session.add(record)
+        db.session.commit()
+        self.assertIsNotNone(estimate_auto_close_time(record, store=False))
+        self.assertEqual(self._stored(), 0)
+        self.assertEqual(_user_patterns([ana.id], self.week_start), stored)
+
+    def test_record_changes_invalidate_only_following_weeks(self):
+        ana = self._user("ana")
+        self._history(ana)
+        next_week = self.week_start + timedelta(days=7)
+        later = self.week_start + timedelta(days=70)
+        for week in (self.week_start, next_week, later):
+            refresh(week, app=self.app, verbose=False)
+        self.assertTrue(self._stored(user_id=ana.id, week_start=next_week))
+
+        day = self.week_start + timedelta(days=2)
+        record = TimeRecord(user_id=ana.id, date=day, check_in=datetime.combine(day, time(15, 0)),
+                            check_out=datetime.combine(day, time(22, 0)))
+        db.session.add(record)
+        db.session.commit()
+
+        self.assertTrue(self._stored(user_id=ana.id, week_start=self.week_start))
+        self.assertFalse(self._stored(user_id=ana.id, week_start=next_week))
+        self.assertFalse(self._stored(user_id=None, group_hours=20, week_start=next_week))
+        self.assertTrue(self._stored(user_id=ana.id, week_start=later))
+
+        templates, _ = _user_patterns([ana.id], next_week)[ana.id]
+        self.assertEqual(templates[2].count, 5)
+
+        refresh(next_week, app=self.app, verbose=False)
+        record.check_in = datetime.combine(day, time(16, 0))
+        db.session.commit()
+        self.assertFalse(self._stored(user_id=ana.id, week_start=next_week))
+
+    def test_user_changes_invalidate_group_patterns(self):
+        ana = self._user("ana")
+        luis = self._user("luis", weekly_hours=30)
+        self._history(ana)
+        self._history(luis)
+        refresh(self.week_start, app=self.app, verbose=False)
+
+        ana.weekly_hours = 30
+        db.session.commit()
+
+        self.assertFalse(self._stored(user_id=None, group_hours=20))
+        self.assertFalse(self._stored(user_id=None, group_hours=30))
+        self.assertTrue(self._stored(user_id=ana.id))
+        self.assertEqual(_group_patterns(self.week_start, 30, "Reparto")[0][0].count, 8)
+
+    def test_regularize_with_stored_patterns_matches_cold_table(self):
+        def scenario():
+            users = [self._user(f"emp{i}", weekly_hours=15 + 5 * i) for i in range(3)]
+            for i, user in enumerate(users):
+                # Poco histórico previo: el de la 2ª semana lo dominan los
+                # fichajes recién regularizados de la 1ª
+                self._history(user, weeks=1, start_hour=6, hours=3, days=2)
+                for week in (0, 7):
+                    for off in (0, 1, 3):
+                        day = self.week_start + timedelta(days=week + off)
+                        db.session.add(TimeRecord(
+                            user_id=user.id, date=day, check_in=datetime.combine(day, time(14 + i, 0)),
+                            check_out=datetime.combine(day, time(23, 59, 59)), notes="CA"))
+            db.session.commit()
+
+        def run(warm):
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            scenario()
+            if warm:
+                for week in (self.week_start, self.week_start + timedelta(days=7)):
+                    refresh(week, app=self.app, verbose=False)
+            regularize_range(self.week_start, self.week_start + timedelta(days=13),
+                             app=self.app, today=self.week_start + timedelta(days=28))
+            return sorted(
+                (r.user_id, r.date, r.check_in, r.check_out, r.notes)
+                for r in TimeRecord.query.filter(TimeRecord.date >= self.week_start)
+            )
+
+        self.assertEqual(run(warm=True), run(warm=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
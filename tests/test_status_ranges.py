@@ -0,0 +1,160 @@
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import EmployeeStatus, User
+from models.status_ranges import upsert_status_range
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.export import export_bp
+from routes.time import time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class StatusRangeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        for bp in (auth_bp, time_bp, admin_bp, export_bp):
+            self.app.register_blueprint(bp)
+        self.start = date(2026, 3, 1)
+        with self.app.app_context():
+            db.create_all()
+            self.admin_id = self._user("jefa", "Hortaleza", is_admin=True)
+            self.ana = self._user("ana", "Hortaleza")
+            self.luis = self._user("luis", "Hortaleza")
+            self.inactivo = self._user("inactivo", "Hortaleza", is_active=False)
+            self.otro = self._user("otro", "Las Tablas")
+            db.session.add(EmployeeStatus(
+                user_id=self.ana, date=self.start + timedelta(days=10), status="Trabajado",
+                notes="antes", created_at=datetime(2026, 1, 1), updated_at=datetime(2026, 1, 1),
+            ))
+            db.session.commit()
+            self.existing_id = EmployeeStatus.query.one().id
+            self.engine = db.engine
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = self.admin_id
+            sess["is_admin"] = True
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username, centro, is_admin=False, is_active=True):
+        user = User(
+            username=username, full_name=username.title(),
+            email=f"{username}@example.com", is_admin=is_admin, is_active=is_active,
+            weekly_hours=20, categoria="Sala", centro=centro,
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    def _post(self, url, data):
+        writes = []
+
+        def capture(conn, cursor, statement, *args):
+            if "employee_status" in statement and not statement.lstrip().upper().startswith("SELECT"):
+                writes.append(statement)
+
+        event.listen(self.engine, "before_cursor_execute", capture)
+        try:
+            response = self.client.post(url, data=data)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", capture)
+        return response, writes
+
+    def test_employee_range_is_one_upsert_that_overwrites_existing_days(self):
+        end = self.start + timedelta(days=89)
+        response, writes = self._post(f"/admin/employees/{self.ana}/status", {
+            "start_date": self.start.isoformat(), "end_date": end.isoformat(),
+            "status": "Baja", "notes": "médico", "entry_time": "", "exit_time": "",
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(writes), 1)
+        self.assertIn("ON CONFLICT", writes[0])
+        with self.app.app_context():
+            rows = EmployeeStatus.query.filter_by(user_id=self.ana).order_by(EmployeeStatus.date).all()
+            self.assertEqual(len(rows), 90)
+            self.assertEqual({(r.status, r.notes) for r in rows}, {("Baja", "médico")})
+            self.assertEqual([r.date for r in rows], [self.start + timedelta(days=i) for i in range(90)])
+            overwritten = db.session.get(EmployeeStatus, self.existing_id)
+            self.assertEqual((overwritten.status, overwritten.created_at), ("Baja", datetime(2026, 1, 1)))
+            self.assertGreater(overwritten.updated_at, datetime(2026, 1, 1))
+            self.assertEqual(EmployeeStatus.query.filter_by(user_id=self.luis).count(), 0)
+
+    def test_centro_range_covers_active_employees_in_one_statement(self):
+        response, writes = self._post("/admin/centro_status", {
+            "centro": "Hortaleza", "start_date": self.start.isoformat(),
+            "end_date": (self.start + timedelta(days=13)).isoformat(),
+            "status": "Vacaciones", "notes": "cierre", "entry_time": "10:00",
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(writes), 1)
+        with self.app.app_context():
+            counts = {
+                uid: EmployeeStatus.query.filter_by(user_id=uid, status="Vacaciones").count()
+                for uid in (self.admin_id, self.ana, self.luis, self.inactivo, self.otro)
+            }
+            self.assertEqual(counts, {self.admin_id: 0, self.ana: 14, self.luis: 14, self.inactivo: 0, self.otro: 0})
+            self.assertEqual(
+                {s.entry_time for s in EmployeeStatus.query.filter_by(status="Vacaciones")}, {time(10, 0)}
+            )
+
+    def test_invalid_forms_write_nothing(self):
+        for url, data in (
+            ("/admin/centro_status", {"centro": "Hortaleza", "status": "Baja"}),
+            (f"/admin/employees/{self.ana}/status", {"start_date": "2026-03-10", "end_date": "2026-03-01"}),
+            (f"/admin/employees/{self.ana}/status", {"start_date": "2026-01-01", "end_date": "2027-06-01"}),
+            (f"/admin/employees/{self.ana}/status", {"start_date": "2026-03-01", "entry_time": "25:99"}),
+        ):
+            with self.subTest(url=url, data=data):
+                response, writes = self._post(url, data)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(writes, [])
+
+    def test_fallback_without_on_conflict_gives_same_rows(self):
+        def run():
+            with self.app.app_context():
+                EmployeeStatus.query.delete()
+                db.session.add(EmployeeStatus(user_id=self.ana, date=self.start, status="Trabajado"))
+                db.session.commit()
+                written = upsert_status_range(
+                    db.session.connection(), [self.ana, self.luis, self.ana],
+                    self.start, self.start + timedelta(days=2), status="Ausente", notes="x",
+                )
+                db.session.commit()
+                return written, sorted(
+                    (s.user_id, s.date, s.status, s.notes) for s in EmployeeStatus.query.all()
+                )
+
+        upsert = run()
+        with mock.patch("models.status_ranges.upsert_insert", return_value=None):
+            fallback = run()
+        self.assertEqual(upsert, fallback)
+        self.assertEqual(upsert[0], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
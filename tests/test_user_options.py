@@ -0,0 +1,143 @@
+import os
+import unittest
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.database import db
+from models.models import User
+from models.user_options import _TTLCache, clear_filter_options, filter_options
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.export import export_bp
+from routes.time import time_bp
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class UserOptionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(
+            __name__,
+            static_folder=os.path.join(ROOT, "static"),
+            template_folder=os.path.join(ROOT, "src", "templates"),
+        )
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        self.app.config["SECRET_KEY"] = "test"
+        db.init_app(self.app)
+        for bp in (auth_bp, time_bp, admin_bp, export_bp):
+            self.app.register_blueprint(bp)
+        clear_filter_options()
+        with self.app.app_context():
+            db.create_all()
+            self.admin_id = self._user("jefa", "Hortaleza", None, None, is_admin=True)
+            self.ana = self._user("ana", "Hortaleza", "Sala", 20)
+            self._user("luis", "Hortaleza", "Cocina", 30, is_active=False)
+            self._user("otro", "Las Tablas", "Reparto", 40)
+            self.engine = db.engine
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["user_id"] = self.admin_id
+            sess["is_admin"] = True
+
+    def tearDown(self):
+        clear_filter_options()
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+    def _user(self, username, centro, categoria, weekly_hours, is_admin=False, is_active=True):
+        user = User(
+            username=username, full_name=username.title(), email=f"{username}@example.com",
+            is_admin=is_admin, is_active=is_active, weekly_hours=weekly_hours,
+            categoria=categoria, centro=centro,
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    def _count_selects(self, func):
+        statements = []
+        capture = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(self.engine, "before_cursor_execute", capture)
+        try:
+            result = func()
+        finally:
+            event.remove(self.engine, "before_cursor_execute", capture)
+        return result, len(statements)
+
+    def test_cached_per_centro_and_cleared_on_user_changes(self):
+        with self.app.app_context():
+            options, queries = self._count_selects(lambda: filter_options("Hortaleza"))
+            self.assertEqual(queries, 1)
+            self.assertEqual(options.centros, ["Hortaleza"])
+            self.assertEqual(options.categorias, ["Cocina", "Sala"])
+            self.assertEqual([u.username for u in options.active_users], ["ana", "jefa"])
+            self.assertEqual(options.active_hours, [0, 20])
+            self.assertEqual([u.username for u in options.employees], ["ana", "luis"])
+            self.assertEqual(options.employee_hours, [20, 30])
+
+            again, queries = self._count_selects(lambda: filter_options("Hortaleza"))
+            self.assertEqual(queries, 0)
+            self.assertIs(again, options)
+            self.assertEqual(filter_options().centros, ["Hortaleza", "Las Tablas"])
+
+            # Un cambio que no sale en los desplegables no vacía la caché
+            user = db.session.get(User, self.ana)
+            user.set_password("otra")
+            db.session.commit()
+            self.assertIs(filter_options("Hortaleza"), options)
+
+            # Cambios sin confirmar tampoco
+            user.weekly_hours = 25
+            db.session.flush()
+            db.session.rollback()
+            self.assertIs(filter_options("Hortaleza"), options)
+
+            db.session.get(User, self.ana).weekly_hours = 25
+            db.session.commit()
+            self.assertEqual(filter_options("Hortaleza").active_hours, [0, 25])
+
+            self._user("nuevo", "Hortaleza", "Delivery", 15)
+            self.assertEqual(filter_options("Hortaleza").categorias, ["Cocina", "Delivery", "Sala"])
+
+            db.session.delete(db.session.get(User, self.ana))
+            db.session.commit()
+            self.assertNotIn("ana", [u.username for u in filter_options("Hortaleza").employees])
+
+    def test_admin_pages_use_cache(self):
+        response, queries = self._count_selects(lambda: self.client.get("/admin/api/centro_info"))
+        body = response.get_json()
+        self.assertEqual([u["username"] for u in body["usuarios"]], ["ana", "luis"])
+        self.assertEqual((body["categorias"], body["horas"]), (["Cocina", "Sala"], [20, 30]))
+
+        # Segunda visita: solo la consulta del admin en sesión, ninguna de opciones
+        response, cached_queries = self._count_selects(lambda: self.client.get("/admin/api/centro_info"))
+        self.assertEqual(response.get_json(), body)
+        self.assertEqual(cached_queries, queries - 1)
+
+        # La exportación del mismo centro reutiliza la entrada
+        response, export_queries = self._count_selects(lambda: self.client.get("/excel"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ana (Ana)", response.get_data(as_text=True))
+        self.assertEqual(export_queries, cached_queries)
+
+    def test_ttl_and_lru(self):
+        now = [0.0]
+        cache = _TTLCache(ttl=10, max_entries=2, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)  # "b" es la menos usada
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        now[0] = 10
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
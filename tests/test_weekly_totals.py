@@ -0,0 +1,128 @@
+import unittest
+from datetime import date, datetime, time, timedelta
+
+from flask import Flask
+
+from models.database import db
+from models.models import TimeRecord, User, WeeklyUserTotal
+from tasks.autofill import autofill_week
+from tasks.regularize import regularize_range
+from tasks.weekly_totals import rebuild
+
+
+class WeeklyTotalsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["TESTING"] = True
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.week_start = date(2026, 5, 4)  # lunes
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.ctx.pop()
+
+    def _user(self, username, weekly_hours=20):
+        user = User(
+            username=username, full_name=username.title(),
+            email=f"{username}@example.com", is_admin=False, is_active=True,
+            weekly_hours=weekly_hours, categoria="Reparto",
+        )
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def _rec(self, user, day, start_h=9, hours=4, minutes=0):
+        ci = datetime.combine(day, time(start_h, 0))
+        record = TimeRecord(user_id=user.id, date=day, check_in=ci,
+                            check_out=ci + timedelta(hours=hours, minutes=minutes))
+        db.session.add(record)
+        db.session.commit()
+        return record
+
+    def _totals(self):
+        return {
+            (t.user_id, t.week_start): t.worked_seconds
+            for t in WeeklyUserTotal.query.all()
+        }
+
+    def _expected(self):
+        expected = {}
+        for r in TimeRecord.query.filter(
+            TimeRecord.check_in.isnot(None), TimeRecord.check_out.isnot(None)
+        ):
+            key = (r.user_id, r.date - timedelta(days=r.date.weekday()))
+            expected[key] = expected.get(key, 0) + (r.check_out - r.check_in).total_seconds()
+        return {key: round(value) for key, value in expected.items()}
+
+    def test_orm_changes_keep_totals_current(self):
+        user = self._user("ana")
+        other = self._user("luis")
+        monday = self._rec(user, self.week_start, hours=4)
+        self._rec(user, self.week_start + timedelta(days=1), hours=3, minutes=30)
+        self.assertEqual(self._totals(), {(user.id, self.week_start): 7.5 * 3600})
+
+        # Abierto: no cuenta hasta que se cierra
+        open_record = TimeRecord(user_id=other.id, date=self.week_start,
+                                 check_in=datetime.combine(self.week_start, time(10, 0)))
+        db.session.add(open_record)
+        db.session.commit()
+        self.assertNotIn((other.id, self.week_start), self._totals())
+        open_record.check_out = datetime.combine(self.week_start, time(12, 0))
+        db.session.commit()
+        self.assertEqual(self._totals()[(other.id, self.week_start)], 2 * 3600)
+
+        # Mover un fichaje a otra semana recalcula ambas
+        monday.date = self.week_start + timedelta(days=7)
+        monday.check_in = datetime.combine(monday.date, time(9, 0))
+        monday.check_out = datetime.combine(monday.date, time(13, 0))
+        db.session.commit()
+        totals = self._totals()
+        self.assertEqual(totals[(user.id, self.week_start)], 3.5 * 3600)
+        self.assertEqual(totals[(user.id, self.week_start + timedelta(days=7))], 4 * 3600)
+
+        db.session.delete(monday)
+        db.session.commit()
+        self.assertNotIn((user.id, self.week_start + timedelta(days=7)), self._totals())
+        self.assertEqual(self._totals(), self._expected())
+
+    def test_bulk_regularize_and_autofill_keep_totals_current(self):
+        users = [self._user(f"emp{i}", weekly_hours=15 + 5 * i) for i in range(3)]
+        for user in users:
+            for off in (0, 1):
+                day = self.week_start + timedelta(days=off)
+                db.session.add(TimeRecord(
+                    user_id=user.id, date=day, check_in=datetime.combine(day, time(9, 0)),
+                    check_out=datetime.combine(day, time(23, 59, 59)), notes="CA"))
+        db.session.commit()
+
+        autofill_week(self.week_start + timedelta(days=7), app=self.app)
+        regularize_range(self.week_start, self.week_start + timedelta(days=6),
+                         today=self.week_start + timedelta(days=21), batched=True)
+
+        self.assertEqual(self._totals(), self._expected())
+
+    def test_rebuild_matches_incremental_totals(self):
+        user = self._user("ana")
+        for off in range(10):
+            self._rec(user, self.week_start + timedelta(days=off), hours=4, minutes=off)
+        incremental = self._totals()
+
+        db.session.execute(db.delete(WeeklyUserTotal))
+        db.session.commit()
+        rows = rebuild(app=self.app, verbose=False)
+
+        self.assertEqual(rows, 2)
+        self.assertEqual(self._totals(), incremental)
+        self.assertEqual(incremental, self._expected())
+
+
+if __name__ == "__main__":
+    unittest.main()